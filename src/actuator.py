@@ -0,0 +1,125 @@
+import threading
+import time
+
+import numpy as np
+
+
+def steering_setpoint(offset, threshold=20, kp=4e-3, tmax=0.3, t_up=0.05):
+    """
+    Maps a lane offset to a steering setpoint for SteeringActuator.
+
+    Offsets within the threshold give 0. Otherwise the key is held for
+    t_down = min(abs(offset) * kp, tmax) out of every t_down + t_up seconds, which
+    gives the duty cycle, and the sign follows the offset (positive steers right).
+    Works element-wise on arrays of offsets.
+
+    Args:
+    offset (float or np.array): Offset of the lane center from the image center.
+    threshold (float): Offsets with a smaller magnitude need no steering.
+    kp (float): Seconds the key is held per pixel of offset.
+    tmax (float): Maximum key-down time in seconds.
+    t_up (float): Key-up time in seconds.
+
+    Returns:
+    float or np.array: Setpoint in [-1, 1].
+    """
+    magnitude = np.abs(offset)
+    t_down = np.minimum(magnitude * kp, tmax)
+    duty = t_down / (t_down + t_up)
+    setpoint = np.where(magnitude < threshold, 0.0, np.sign(offset) * duty)
+    return float(setpoint) if setpoint.ndim == 0 else setpoint
+
+
+class SteeringActuator:
+    """Turns a continuous steering setpoint into key-down / key-up edges.
+
+    The setpoint lies in [-1, 1], negative values steer left and positive values steer
+    right. Its magnitude is the duty cycle: within every period the arrow key is held
+    for abs(setpoint) * period seconds. update() has to be called once per scheduler
+    tick; it never blocks and only sends a key event when the key state changes.
+    A new setpoint replaces the previous one and takes effect on the next tick.
+    """
+
+    LEFT = 'left'
+    RIGHT = 'right'
+
+    def __init__(self, key_down, key_up, period=0.2, tick=0.01):
+        """
+        Args:
+            key_down: Function called with LEFT or RIGHT to press a key.
+            key_up: Function called with LEFT or RIGHT to release a key.
+            period: Duration of one duty cycle in seconds.
+            tick: Interval in seconds at which update() is expected to be called.
+        """
+        self.key_down = key_down
+        self.key_up = key_up
+        self.period = period
+        self.tick = tick
+
+        # Guards the setpoint and the pressed key, reentrant because update() calls desired_key()
+        self._lock = threading.RLock()
+        self._setpoint = 0.0
+        self._t_setpoint = time.perf_counter()
+        self._pressed = None  # Key that is currently held down
+
+        self.superseded = 0  # Setpoints replaced before they were applied
+        self._applied = True
+
+    @property
+    def setpoint(self):
+        return self._setpoint
+
+    def set_setpoint(self, setpoint):
+        """Sets a new steering setpoint, replacing any previous one.
+
+        Args:
+            setpoint: Steering command in [-1, 1], values outside are clipped.
+        """
+        setpoint = min(max(float(setpoint), -1.0), 1.0)
+        with self._lock:
+            if not self._applied:
+                self.superseded += 1
+            # Restart the duty cycle when steering starts or changes direction, so the new
+            # key is pressed on the next tick. Otherwise keep the phase running, which lets
+            # setpoints arrive faster than the period without holding the key forever.
+            if setpoint * self._setpoint <= 0:
+                self._t_setpoint = time.perf_counter()
+            self._setpoint = setpoint
+            self._applied = False
+
+    def desired_key(self, now=None):
+        """Returns the key that should be held down at time now, or None."""
+        now = time.perf_counter() if now is None else now
+        with self._lock:
+            setpoint, t_setpoint = self._setpoint, self._t_setpoint
+
+        phase = (now - t_setpoint) % self.period
+        if phase >= abs(setpoint) * self.period:
+            return None
+        return self.RIGHT if setpoint > 0 else self.LEFT
+
+    def update(self, now=None):
+        """Emits the key edges needed to follow the current setpoint."""
+        # The key edges are sent under the lock, so release() from another thread cannot
+        # interleave and leave a key held down or release it twice
+        with self._lock:
+            key = self.desired_key(now)
+            self._applied = True
+
+            if key == self._pressed:
+                return
+
+            if self._pressed is not None:
+                self.key_up(self._pressed)
+            if key is not None:
+                self.key_down(key)
+            self._pressed = key
+
+    def release(self):
+        """Clears the setpoint and releases any key that is held down."""
+        with self._lock:
+            self._setpoint = 0.0
+            self._applied = True
+            if self._pressed is not None:
+                self.key_up(self._pressed)
+                self._pressed = None
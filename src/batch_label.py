@@ -0,0 +1,276 @@
+"""
+Batch labeling of screenshot directories for lane segmentation training.
+
+Runs preprocess_image and find_driving_path over every PNG below a directory in a
+pool of worker processes and writes, mirroring the input tree:
+    <output>/masks/<name>.png      marking mask (0/255)
+    <output>/overlays/<name>.png   detection overlay, only if a driving path was found
+    <output>/labels/<name>.txt     YOLO segmentation label, one marking polygon per line
+    <output>/labels.jsonl          manifest with one line per finished frame
+
+Frames are decoded by a thread pool in the main process (cv.imread releases the GIL)
+straight into slots of a shared memory block, the workers only receive the slot index.
+A frame is listed in the manifest once all its outputs are written, frames that failed
+are listed with an error. --resume skips exactly the frames that are done and retries
+the failed ones.
+
+Usage:
+    python batch_label.py ../data ../data/labels
+    python batch_label.py ../data ../data/labels --workers 8 --resume
+"""
+import argparse
+import json
+import os
+import queue
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool, cpu_count, shared_memory
+
+import cv2 as cv
+import numpy as np
+
+from lane_detection_utils import preprocess_image, find_driving_path, OverlayRenderer
+
+MANIFEST = 'labels.jsonl'
+MARKING_CLASS = 0
+
+# Screenshot names from SlowRoadsSimulator.save_screenshot: {season}_{weather}_{timestamp}.png
+NAME_PATTERN = re.compile(r'^(?P<season>[a-z]+)_(?P<weather>[a-z]+)_\d+')
+
+# Worker process state, set by init_worker
+_frames = None
+_shm = None
+_options = None
+_renderer = None
+
+
+def find_images(input_dir):
+    """Returns the paths of all PNG files below input_dir relative to it, sorted."""
+    paths = []
+    for root, _, files in os.walk(input_dir):
+        for name in files:
+            if name.lower().endswith('.png'):
+                paths.append(os.path.relpath(os.path.join(root, name), input_dir))
+    return sorted(paths)
+
+
+def read_manifest(output_dir):
+    """Returns the relative paths the manifest of output_dir lists as labeled, failed frames are left out."""
+    done = set()
+    path = os.path.join(output_dir, MANIFEST)
+    if not os.path.exists(path):
+        return done
+    with open(path, 'r') as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+                path = entry['path']
+            except (ValueError, KeyError):
+                continue  # Incomplete last line of an interrupted run
+            if 'error' not in entry:
+                done.add(path)
+    return done
+
+
+def yolo_polygons(mask, min_area=90, epsilon=1.5):
+    """
+    Converts a binary mask into YOLO segmentation label lines.
+
+    Args:
+    mask (np.array): Binary mask (0 or 1).
+    min_area (float): Contours with a smaller area are skipped.
+    epsilon (float): Tolerance in pixels of the polygon simplification.
+
+    Returns:
+    list: Lines "class x1 y1 x2 y2 ..." with coordinates normalized to [0, 1].
+    """
+    height, width = mask.shape
+    contours, _ = cv.findContours(mask.astype(np.uint8), cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE)
+    lines = []
+    for contour in contours:
+        if cv.contourArea(contour) < min_area:
+            continue
+        polygon = cv.approxPolyDP(contour, epsilon, True).reshape(-1, 2).astype(np.float64)
+        if len(polygon) < 3:
+            continue
+        polygon /= (width, height)
+        lines.append(f"{MARKING_CLASS} " + " ".join(f"{v:.5f}" for v in polygon.reshape(-1)))
+    return lines
+
+
+def init_worker(shm_name, shape, options):
+    global _frames, _shm, _options, _renderer
+    _shm = shared_memory.SharedMemory(name=shm_name)
+    _frames = np.ndarray(shape, dtype=np.uint8, buffer=_shm.buf)
+    _options = options
+    _renderer = OverlayRenderer(n_buffers=1)  # Each overlay is written before the next frame
+
+
+def label_frame(slot, rel_path):
+    """Labels the frame in the given shared memory slot and writes its outputs. Runs in a worker."""
+    t_start = time.perf_counter()
+    output_dir = _options['output_dir']
+    stem = os.path.splitext(rel_path)[0]
+
+    image = _frames[slot]
+    mask, resized_image = preprocess_image(image, size=_options['size'])
+    stats = {}
+    success, offset, overlay, stats = find_driving_path(resized_image, mask, min_pixels=_options['min_pixels'], stats=stats, draw=_renderer)
+
+    outputs = {'masks': stem + '.png', 'labels': stem + '.txt'}
+    if success:
+        outputs['overlays'] = stem + '.png'
+    for kind, name in outputs.items():
+        os.makedirs(os.path.dirname(os.path.join(output_dir, kind, name)), exist_ok=True)
+
+    cv.imwrite(os.path.join(output_dir, 'masks', outputs['masks']), mask * 255)
+    with open(os.path.join(output_dir, 'labels', outputs['labels']), 'w') as file:
+        file.write("\n".join(yolo_polygons(mask)))
+    if success:
+        cv.imwrite(os.path.join(output_dir, 'overlays', outputs['overlays']), overlay.render())
+
+    lane_center = stats['lane_center']
+    entry = {'path': rel_path, 'success': bool(success), 'offset': offset,
+             'lane_center': None if lane_center is None else int(lane_center)}
+    match = NAME_PATTERN.match(os.path.basename(rel_path))
+    if match:
+        entry.update(match.groupdict())
+    return slot, entry, os.getpid(), time.perf_counter() - t_start
+
+
+class WorkerStats:
+    """Frames and busy time per worker process."""
+
+    def __init__(self):
+        self.workers = {}
+        self.t_start = time.perf_counter()
+        self.count = 0
+
+    def record(self, pid, duration):
+        frames, busy = self.workers.get(pid, (0, 0.0))
+        self.workers[pid] = (frames + 1, busy + duration)
+        self.count += 1
+
+    def format(self):
+        elapsed = time.perf_counter() - self.t_start
+        lines = [f"{self.count} frames in {elapsed:.1f} s, {self.count / max(elapsed, 1e-9):.1f} frames/s"]
+        for pid, (frames, busy) in sorted(self.workers.items()):
+            lines.append(f"  worker {pid:<8}{frames:>8} frames{frames / max(busy, 1e-9):>10.1f} frames/s busy{100 * busy / max(elapsed, 1e-9):>6.0f}%")
+        return "\n".join(lines)
+
+
+def load_frame(frames, slot, path, size):
+    """Decodes an image into a shared memory slot at the working resolution. Returns False if it cannot be read."""
+    image = cv.imread(path, cv.IMREAD_COLOR)
+    if image is None:
+        return False
+    if (image.shape[1], image.shape[0]) == size:
+        frames[slot] = image
+    else:
+        cv.resize(image, size, dst=frames[slot], interpolation=cv.INTER_LINEAR)
+    return True
+
+
+def label_directory(input_dir, output_dir, workers=None, size=(640, 360), min_pixels=60, resume=False, report_interval=10):
+    """
+    Labels all PNG screenshots below input_dir.
+
+    Args:
+    input_dir (str): Directory searched recursively for PNG files.
+    output_dir (str): Directory receiving masks, overlays, labels and the manifest.
+    workers (int): Number of worker processes, all cores if None.
+    size (tuple): Working resolution, format (width, height).
+    min_pixels (int): Passed to find_driving_path.
+    resume (bool): Skip frames an existing manifest lists as labeled instead of starting over.
+    report_interval (float): Seconds between throughput reports.
+
+    Returns:
+    WorkerStats: Throughput of the run.
+    """
+    workers = workers or cpu_count()
+    os.makedirs(output_dir, exist_ok=True)
+
+    paths = find_images(input_dir)
+    done = read_manifest(output_dir) if resume else set()
+    paths = [p for p in paths if p not in done]
+    print(f"Labeling {len(paths)} frames with {workers} workers" + (f", {len(done)} already done" if done else ""))
+
+    # Two slots per worker so that the next frame is decoded while the current one is labeled
+    n_slots = 2 * workers
+    shape = (n_slots, size[1], size[0], 3)
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+    frames = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+
+    options = {'output_dir': output_dir, 'size': size, 'min_pixels': min_pixels}
+    stats = WorkerStats()
+    results = queue.Queue()
+    free_slots = list(range(n_slots))
+    in_flight = 0
+    t_report = time.perf_counter()
+
+    try:
+        with Pool(workers, initializer=init_worker, initargs=(shm.name, shape, options)) as pool, \
+                ThreadPoolExecutor(max(2, workers // 2)) as loaders, \
+                open(os.path.join(output_dir, MANIFEST), 'a' if resume else 'w') as manifest:
+
+            def submit(slot, rel_path, future):
+                if future.result():
+                    pool.apply_async(label_frame, (slot, rel_path), callback=results.put,
+                                     error_callback=lambda e: results.put((slot, {'path': rel_path, 'error': str(e)}, None, 0.0)))
+                else:
+                    results.put((slot, {'path': rel_path, 'error': 'unreadable'}, None, 0.0))
+
+            def collect():
+                slot, entry, pid, duration = results.get()
+                free_slots.append(slot)
+                if pid is not None:
+                    stats.record(pid, duration)
+                else:
+                    print(f"Failed to label {entry['path']}: {entry['error']}")
+                manifest.write(json.dumps(entry) + "\n")
+                manifest.flush()
+
+            for rel_path in paths:
+                while not free_slots:
+                    collect()
+                    in_flight -= 1
+                slot = free_slots.pop()
+                future = loaders.submit(load_frame, frames, slot, os.path.join(input_dir, rel_path), size)
+                future.add_done_callback(lambda f, slot=slot, rel_path=rel_path: submit(slot, rel_path, f))
+                in_flight += 1
+
+                if time.perf_counter() - t_report > report_interval:
+                    print(stats.format())
+                    t_report = time.perf_counter()
+
+            while in_flight:
+                collect()
+                in_flight -= 1
+    finally:
+        del frames
+        shm.close()
+        shm.unlink()
+
+    print(stats.format())
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Label screenshot directories for lane segmentation training.")
+    parser.add_argument('input', help="Directory with PNG screenshots, searched recursively.")
+    parser.add_argument('output', help="Output directory.")
+    parser.add_argument('--workers', type=int, help="Worker processes, defaults to the number of cores.")
+    parser.add_argument('--size', default='640x360', help="Working resolution, e.g. 640x360.")
+    parser.add_argument('--min-pixels', type=int, default=60, help="Minimum marking pixels of find_driving_path.")
+    parser.add_argument('--resume', action='store_true', help="Skip frames that are already labeled, retry failed ones.")
+    args = parser.parse_args(argv)
+
+    size = tuple(int(v) for v in args.size.split('x'))
+    label_directory(args.input, args.output, args.workers, size, args.min_pixels, args.resume)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,346 @@
+"""
+Benchmark of the lane detection pipeline on synthetic road frames.
+
+Runs headless on the CPU. Each case is timed per frame and reported as frames/sec and
+latency percentiles, together with the instrumentation spans of the stages it covers.
+
+Usage:
+    python benchmark_lane_pipeline.py                    # run and compare against the baseline
+    python benchmark_lane_pipeline.py --save-baseline    # run and store the results as new baseline
+    python benchmark_lane_pipeline.py --tolerance 0.1    # fail if any case is >10% slower
+
+The exit code is 1 if any case regressed by more than the tolerance or if the overlay
+renderer allocates image buffers per frame.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import cv2 as cv
+import numpy as np
+
+import instrumentation
+from lane_detection_utils import preprocess_image, find_driving_path, find_driving_path_two_sided, find_lane_curve, remove_small_components, scanline_band, plot_results, OverlayRenderer
+from frame_decoder import FrameDecoder
+from synthetic_frames import make_road_frames
+from display import Display
+
+src_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(src_dir)
+DEFAULT_BASELINE = os.path.join(project_dir, 'data', 'benchmark_baseline.json')
+
+DEFAULT_SIZES = [(640, 360), (1280, 720), (1920, 1080)]
+DEFAULT_COMPONENTS = [0, 100, 1000, 5000]
+
+# Bytes a call may allocate and still count as allocation-free: array views and other
+# Python objects, but no image buffers
+ALLOC_FREE_BYTES = 4096
+
+
+def summarize(durations):
+    """Returns frames/sec and latency percentiles in milliseconds for a list of durations."""
+    durations = np.asarray(durations)
+    p50, p95, p99 = np.percentile(durations, [50, 95, 99]) * 1e3
+    return {
+        'fps': float(1 / durations.mean()),
+        'mean_ms': float(durations.mean() * 1e3),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+    }
+
+
+def run_case(func, inputs, repeat, warmup=3):
+    """
+    Times func on the inputs, cycling through them for repeat calls.
+
+    Args:
+    func (callable): Function called with one input.
+    inputs (list): Inputs of the case.
+    repeat (int): Number of timed calls.
+    warmup (int): Number of untimed calls before the measurement.
+
+    Returns:
+    dict: summarize() of the timed calls plus the instrumentation spans under 'stages'.
+    """
+    for i in range(warmup):
+        func(inputs[i % len(inputs)])
+
+    instrumentation.reset()
+    durations = []
+    for i in range(repeat):
+        x = inputs[i % len(inputs)]
+        t_start = time.perf_counter()
+        func(x)
+        durations.append(time.perf_counter() - t_start)
+
+    result = summarize(durations)
+    result['stages'] = {name: s['p50_ms'] for name, s in instrumentation.snapshot().items() if s['count']}
+    return result
+
+
+def full_frame_pipeline(frame):
+    mask, resized_image = preprocess_image(frame)
+    return find_driving_path(resized_image, mask, min_pixels=60, stats={})
+
+
+def roi_pipeline(frame, ymin=250, ymax=265):
+    y0, y1 = scanline_band(ymin, ymax, 360)
+    mask, resized_image = preprocess_image(frame, roi=(y0, y1))
+    return find_driving_path(resized_image, mask, ymin, ymax, min_pixels=60, stats={}, roi_offset=y0)
+
+
+def two_sided_pipeline(frame):
+    mask, resized_image = preprocess_image(frame)
+    return find_driving_path_two_sided(resized_image, mask, min_pixels=60, stats={})
+
+
+def curve_pipeline(frame):
+    mask, resized_image = preprocess_image(frame)
+    return find_lane_curve(resized_image, mask, min_pixels=60, stats={})
+
+
+def display_pipeline(display):
+    """Full frame pipeline that publishes deferred overlays to display, like the detect stage of run_slowroads.py."""
+    renderer = OverlayRenderer()
+
+    def pipeline(frame):
+        mask, resized_image = preprocess_image(frame)
+        success, offset, overlay, stats = find_driving_path(resized_image, mask, min_pixels=60, stats={}, draw=renderer)
+        if success:
+            display.show(overlay, {k: stats[k] for k in ['offset', 'lane_center']})
+        return success, offset
+    return pipeline
+
+
+def measure_allocations(func, inputs, calls=20):
+    """Returns the largest number of bytes a single call of func allocated at its peak, traced with tracemalloc."""
+    func(inputs[0])  # Let func set up its reusable buffers
+    tracemalloc.start()
+    try:
+        worst = 0
+        for i in range(calls):
+            x = inputs[i % len(inputs)]
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            func(x)
+            _, peak = tracemalloc.get_traced_memory()
+            worst = max(worst, peak - before)
+    finally:
+        tracemalloc.stop()
+    return worst
+
+
+def full_frame_overlay(image, mask, ymin, ymax, cx, l_index, r_index=None):
+    """The former plot_results: converts the whole mask to RGB before pasting the stripe."""
+    result = image.copy()
+    mask_rgb = cv.cvtColor(mask, cv.COLOR_GRAY2RGB) * 255
+    x_end = cx if r_index is None else cx + r_index
+    result[ymin:ymax, :x_end, :] = mask_rgb[ymin:ymax, :x_end, :]
+    result[ymin:ymax, cx - l_index:cx, 1:] = 0
+    if r_index is not None:
+        result[ymin:ymax, cx:cx + r_index, 0] = 0
+    return result
+
+
+def overlay_cases(frames, repeat, stripe=(250, 265, 320, 150, 150)):
+    """
+    Times the overlay rendering of one two-sided stripe and reports the bytes allocated per overlay.
+
+    'full_frame' is the former plot_results, 'copy' the stripe-only plot_results into a new
+    array, 'buffered' an OverlayRenderer and 'deferred' what detection pays if the overlay
+    is left to the consumer.
+
+    Returns:
+    dict: Mapping of case name to its results.
+    """
+    inputs = [preprocess_image(frame)[::-1] for frame in frames]
+    renderer = OverlayRenderer()
+    cases = {
+        'overlay/full_frame': lambda x: full_frame_overlay(*x, *stripe),
+        'overlay/copy': lambda x: plot_results(*x, *stripe),
+        'overlay/buffered': lambda x: renderer.render(*x, *stripe),
+        'overlay/deferred': lambda x: renderer.defer(*x, *stripe),
+    }
+    results = {}
+    for name, func in cases.items():
+        results[name] = run_case(func, inputs, repeat)
+        results[name]['alloc_bytes'] = measure_allocations(func, inputs)
+    return results
+
+
+def noise_masks(n_components, n_masks=4, size=(640, 360), seed=0):
+    """Binary masks (0/255) with a lane marking and n_components isolated speckles each."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    masks = []
+    for _ in range(n_masks):
+        mask = np.zeros((height, width), dtype=np.uint8)
+        mask[200:360, 100:110] = 255  # Large component that is kept
+        # Speckles on a grid of odd coordinates so that they never touch each other
+        cells = rng.choice((height // 2) * (width // 2), n_components, replace=False)
+        mask[2 * (cells // (width // 2)) + 1, 2 * (cells % (width // 2)) + 1] = 255
+        masks.append(mask)
+    return masks
+
+
+def encode_frames(frames, ext):
+    return [cv.imencode(ext, frame)[1] for frame in frames]
+
+
+def full_decode(data, size=(640, 360)):
+    """The decode path without a FrameDecoder: full resolution decode, then preprocess_image's resize."""
+    image = cv.imdecode(data, cv.IMREAD_COLOR)
+    return cv.resize(image, size, interpolation=cv.INTER_LINEAR)
+
+
+def decode_cases(frames, ext, repeat, size=(640, 360)):
+    """
+    Times the full decode against a FrameDecoder and reports the bytes allocated per frame.
+
+    Returns:
+    dict: Results of the 'full' and 'reduced' cases.
+    """
+    encoded = encode_frames(frames, ext)
+    height, width = frames[0].shape[:2]
+    decoder = FrameDecoder(size)
+
+    full = run_case(full_decode, encoded, repeat)
+    full['alloc_bytes'] = width * height * 3 + size[0] * size[1] * 3
+
+    reduced = run_case(decoder.decode, encoded, repeat)
+    reduced['alloc_bytes'] = decoder.allocated_bytes()
+    return {'full': full, 'reduced': reduced}
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, components=DEFAULT_COMPONENTS, n_frames=20, repeat=200, seed=0):
+    """
+    Runs all benchmark cases.
+
+    Returns:
+    dict: Mapping of case name to its results.
+    """
+    was_enabled = instrumentation.is_enabled()
+    instrumentation.enable()
+    results = {}
+    try:
+        for size in sizes:
+            frames = make_road_frames(n_frames, size, seed)
+            name = f"{size[0]}x{size[1]}"
+            results[f"pipeline/{name}"] = run_case(full_frame_pipeline, frames, repeat)
+            results[f"pipeline_roi/{name}"] = run_case(roi_pipeline, frames, repeat)
+            results[f"pipeline_two_sided/{name}"] = run_case(two_sided_pipeline, frames, repeat)
+            results[f"pipeline_curve/{name}"] = run_case(curve_pipeline, frames, repeat)
+            results[f"pipeline_display/{name}"] = run_case(display_pipeline(Display('null')), frames, repeat)
+
+            if size != (640, 360):
+                for ext in ('.png', '.jpg'):
+                    for mode, result in decode_cases(frames, ext, repeat).items():
+                        results[f"decode_{ext[1:]}_{mode}/{name}"] = result
+
+        results.update(overlay_cases(make_road_frames(n_frames, (640, 360), seed), repeat))
+
+        for n in components:
+            results[f"components/{n}"] = run_case(remove_small_components, noise_masks(n, seed=seed), repeat)
+    finally:
+        if not was_enabled:
+            instrumentation.disable()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares results against a baseline.
+
+    Returns:
+    list: (case, baseline fps, current fps) for every case slower than baseline * (1 - tolerance).
+    """
+    regressions = []
+    for case, base in baseline.items():
+        if case not in results:
+            continue
+        fps = results[case]['fps']
+        if fps < base['fps'] * (1 - tolerance):
+            regressions.append((case, base['fps'], fps))
+    return regressions
+
+
+def format_results(results, baseline=None):
+    lines = [f"{'case':<28}{'fps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'vs base':>10}"]
+    for case, r in results.items():
+        change = ''
+        if baseline and case in baseline:
+            change = f"{100 * (r['fps'] / baseline[case]['fps'] - 1):+.1f}%"
+        lines.append(f"{case:<28}{r['fps']:>10.1f}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}{r['p99_ms']:>10.3f}{change:>10}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the lane detection pipeline on synthetic frames.")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline JSON file.")
+    parser.add_argument('--save-baseline', action='store_true', help="Store the results as the new baseline.")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed relative fps loss before failing.")
+    parser.add_argument('--repeat', type=int, default=200, help="Timed calls per case.")
+    parser.add_argument('--frames', type=int, default=20, help="Synthetic frames per frame size.")
+    parser.add_argument('--sizes', nargs='+', default=[f"{w}x{h}" for w, h in DEFAULT_SIZES], help="Frame sizes, e.g. 640x360.")
+    parser.add_argument('--components', nargs='+', type=int, default=DEFAULT_COMPONENTS, help="Noise component counts.")
+    parser.add_argument('--output', help="Write the results to this JSON file.")
+    parser.add_argument('--stages', action='store_true', help="Print the per-stage p50 latencies.")
+    args = parser.parse_args(argv)
+
+    sizes = [tuple(int(v) for v in s.split('x')) for s in args.sizes]
+    results = run_benchmark(sizes, args.components, args.frames, args.repeat)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+
+    print(format_results(results, baseline))
+
+    # Memory traffic of the decode and overlay cases, the reduced decode and the overlay renderer write into reused buffers
+    for case, r in results.items():
+        if 'alloc_bytes' in r:
+            print(f"{case:<28}{r['alloc_bytes'] / 1e6:>10.3f} MB allocated per frame")
+
+    # The overlay renderer must not allocate image buffers per frame
+    allocating = [case for case in ('overlay/buffered', 'overlay/deferred')
+                  if case in results and results[case]['alloc_bytes'] > ALLOC_FREE_BYTES]
+    for case in allocating:
+        print(f"Allocation in {case}: {results[case]['alloc_bytes']} bytes per frame")
+
+    if args.stages:
+        for case, r in results.items():
+            print(f"\n{case}")
+            for stage, ms in r['stages'].items():
+                print(f"  {stage:<32}{ms:>10.3f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=4)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=4)
+        print(f"Saved baseline at {args.baseline}")
+        return 0
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for case, base_fps, fps in regressions:
+            print(f"Regression in {case}: {fps:.1f} fps vs. baseline {base_fps:.1f} fps")
+        if regressions:
+            return 1
+
+    if allocating:
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,341 @@
+"""
+Display of detection overlays and statistics off the capture / detect / actuate hot path.
+
+The producer calls Display.show(image, stats_dict), which only puts the pair into a
+latest-value slot. image may be a deferred Overlay, it is only rendered if it is drawn,
+also in process mode, where it is sent unrendered. A display thread (or process) takes
+the newest pair at most max_fps times per second and hands it to a backend:
+    'null'        headless no-op, for benchmarks and batch runs
+    'opencv'      cv.imshow window, the stats are rendered into a panel only when they change
+    'matplotlib'  blitting: the figure is drawn once, afterwards only the image and the
+                  stats text are redrawn on top of the cached background
+
+Matplotlib GUI toolkits only work on the main thread of a process, so the matplotlib
+backend either runs in its own process (process=True) or is driven from the main loop
+with Display.poll.
+
+Usage:
+    display = Display('opencv', max_fps=20)
+    display.start()
+    display.show(overlay, {'offset': 12, 'lane_center': 310})
+    display.close()
+"""
+import multiprocessing
+import queue
+import sys
+import threading
+import time
+
+import cv2 as cv
+import numpy as np
+
+from pipeline import LatestValueQueue, StageMetrics
+
+
+class NullBackend:
+    """Headless backend that draws nothing."""
+
+    main_thread = False
+
+    def open(self):
+        pass
+
+    def draw(self, image, stats_dict):
+        pass
+
+    def close(self):
+        pass
+
+
+class OpenCVBackend:
+    """Shows the overlay in an OpenCV window with the stats in a panel above it.
+
+    All window calls are made from the thread that draws. On macOS HighGUI windows only
+    work on the main thread, so there the backend is driven with Display.poll.
+    """
+
+    main_thread = sys.platform == 'darwin'
+
+    def __init__(self, window_name='SlowRoads', panel_height=24, font_scale=0.5):
+        self.window_name = window_name
+        self.panel_height = panel_height
+        self.font_scale = font_scale
+        self.canvas = None
+        self.stats_text = None
+
+    def open(self):
+        cv.namedWindow(self.window_name, cv.WINDOW_AUTOSIZE)
+
+    def draw(self, image, stats_dict):
+        height, width = image.shape[:2]
+        if self.canvas is None or self.canvas.shape[1] != width or self.canvas.shape[0] != height + self.panel_height:
+            self.canvas = np.zeros((height + self.panel_height, width, 3), dtype=np.uint8)
+            self.stats_text = None
+
+        if stats_dict is not None:
+            stats_text = "  ".join(f"{key}: {value}" for key, value in stats_dict.items())
+            if stats_text != self.stats_text:
+                # Only re-render the panel if the text changed
+                panel = self.canvas[:self.panel_height]
+                panel[:] = (179, 222, 245)  # Wheat, like the matplotlib stats box
+                cv.putText(panel, stats_text, (6, self.panel_height - 7), cv.FONT_HERSHEY_SIMPLEX,
+                           self.font_scale, (0, 0, 0), 1, cv.LINE_AA)
+                self.stats_text = stats_text
+
+        np.copyto(self.canvas[self.panel_height:], image)
+        cv.imshow(self.window_name, self.canvas)
+        cv.waitKey(1)
+
+    def close(self):
+        cv.destroyWindow(self.window_name)
+        cv.waitKey(1)
+
+
+class BlitBackend:
+    """Matplotlib display that redraws only the image and the stats text using blitting."""
+
+    main_thread = True
+
+    def __init__(self):
+        self.fig = None
+        self.ax = None
+        self.image_artist = None
+        self.text_artist = None
+        self.background = None
+        self.shape = None
+
+    def open(self):
+        import matplotlib.pyplot as plt
+        self.plt = plt
+        plt.ion()
+        self.fig, self.ax = plt.subplots()
+        # A resize or expose invalidates the cached background
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+        plt.show(block=False)
+
+    def _on_draw(self, event):
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        self.ax.draw_artist(self.image_artist)
+        self.ax.draw_artist(self.text_artist)
+
+    def draw(self, image, stats_dict):
+        if self.image_artist is None or image.shape != self.shape:
+            # First frame or a new size: full draw, which also captures the background
+            self.ax.clear()
+            self.image_artist = self.ax.imshow(image, interpolation='nearest', animated=True)
+            self.text_artist = self.ax.text(
+                0.02, 0.95, "", transform=self.ax.transAxes, fontsize=12, animated=True,
+                verticalalignment='top', bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5)
+            )
+            self.shape = image.shape
+            self.background = None
+
+        self.image_artist.set_data(image)
+        if stats_dict is not None:
+            self.text_artist.set_text("\n".join(f"{key}: {value}" for key, value in stats_dict.items()))
+
+        canvas = self.fig.canvas
+        if self.background is None:
+            canvas.draw()  # Calls _on_draw
+        else:
+            canvas.restore_region(self.background)
+            self._draw_artists()
+        canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+    def close(self):
+        if self.fig is not None:
+            self.plt.close(self.fig)
+
+
+BACKENDS = {
+    'null': NullBackend,
+    'opencv': OpenCVBackend,
+    'matplotlib': BlitBackend,
+}
+
+
+def _display_process(backend, max_fps, input_queue, exit_event, drawn):
+    """Runs a display in a child process, fed with (image, stats_dict) pairs through input_queue.
+
+    drawn is a shared counter of the frames drawn, the parent reports it in Display.stats.
+    """
+    display = Display(backend, max_fps)
+    try:
+        while not exit_event.is_set():
+            item = None
+            try:
+                item = input_queue.get(timeout=0.1)
+                # Skip to the newest pair the producer managed to send
+                while True:
+                    item = input_queue.get_nowait()
+            except queue.Empty:
+                pass
+            if item is not None:
+                display.slot.put(item)
+            display.poll(0)
+            drawn.value = display.metrics.count
+    finally:
+        display.close()
+
+
+class Display:
+    """Latest-value display with its own refresh rate, see the module docstring.
+
+    Only show() and stats() are meant to be called from the pipeline threads.
+    """
+
+    def __init__(self, backend='opencv', max_fps=20, process=False):
+        """
+        Args:
+            backend: Name of a backend in BACKENDS or a backend instance.
+            max_fps: Upper bound on redraws per second, newer frames replace older ones in between.
+            process: Run the backend in a child process instead of a thread.
+        """
+        self.backend_name = backend if isinstance(backend, str) else type(backend).__name__
+        self.backend = BACKENDS[backend]() if isinstance(backend, str) else backend
+        self.max_fps = max_fps
+        self.process = process
+        self.headless = isinstance(self.backend, NullBackend)
+
+        self.slot = LatestValueQueue()
+        self.metrics = StageMetrics('display')
+        self.exit_event = threading.Event()
+        self.t_next = 0.0
+        self.worker = None
+        self.opened = False
+        self.shown = 0
+        self.expired = 0
+
+    @property
+    def threaded(self):
+        """True if frames are drawn without the caller having to call poll."""
+        return self.worker is not None or self.headless
+
+    def start(self):
+        """Starts the display thread or process. Backends that need the main thread are left to poll."""
+        if self.headless or self.worker is not None:
+            return self
+        if self.process:
+            context = multiprocessing.get_context('spawn')
+            self._queue = context.Queue(maxsize=2)
+            self._process_exit = context.Event()
+            self._drawn = context.Value('i', 0, lock=False)
+            self.metrics.reset()
+            self.worker = context.Process(target=_display_process, daemon=True,
+                                          args=(self.backend_name, self.max_fps, self._queue, self._process_exit, self._drawn))
+            self.worker.start()
+        elif not self.backend.main_thread:
+            self.worker = threading.Thread(target=self._run, name='display', daemon=True)
+            self.worker.start()
+        return self
+
+    def show(self, image=None, stats_dict=None):
+        """Publishes the newest overlay and stats. Never blocks and never draws."""
+        self.shown += 1
+        if self.headless:
+            return
+        if self.process and self.worker is not None:
+            if self._queue.full():
+                self.slot.dropped += 1  # The child process is behind, this frame is skipped
+                return
+            if hasattr(image, 'detach'):
+                # Deferred overlays are sent unrendered with their own copy of the frame,
+                # the child process renders them
+                image = image.detach()
+                if image is None:
+                    self.expired += 1
+                    return
+            try:
+                self._queue.put_nowait((image, stats_dict))
+            except queue.Full:
+                self.slot.dropped += 1
+            return
+        self.slot.put((image, stats_dict))
+
+    def poll(self, timeout=0.1):
+        """Draws the newest frame if the refresh interval has passed.
+
+        Runs in the display thread, or must be called periodically from the main loop for
+        backends that need the main thread. Waits at most timeout seconds.
+        """
+        if self.threaded:
+            self.exit_event.wait(timeout)
+            return
+
+        delay = self.t_next - time.perf_counter()
+        if delay > 0:
+            # Wait for the next refresh slot, frames arriving meanwhile replace each other
+            if delay > timeout:
+                self.exit_event.wait(timeout)
+                return
+            self.exit_event.wait(delay)
+            timeout = 0
+
+        item, age = self.slot.get(timeout=timeout)
+        if item is None:
+            return
+        self._draw(*item, age=age)
+
+    def _draw(self, image, stats_dict, age=None):
+        if not self.opened:
+            self.backend.open()
+            self.opened = True
+
+        t_start = time.perf_counter()
+        if image is not None:
+            if hasattr(image, 'render'):
+                # Deferred overlays (lane_detection_utils.Overlay) are rendered here, off the hot path
+                image = image.render()
+                if image is None:
+                    self.expired += 1  # Its frame bus slot was reused before it was drawn
+                    return
+            self.backend.draw(image, stats_dict)
+        self.metrics.record(time.perf_counter() - t_start, age)
+        self.t_next = t_start + (1 / self.max_fps if self.max_fps else 0)
+
+    def _run(self):
+        try:
+            while not self.exit_event.is_set():
+                delay = self.t_next - time.perf_counter()
+                if delay > 0 and self.exit_event.wait(delay):
+                    break
+                item, age = self.slot.get(timeout=0.1)
+                if item is not None:
+                    self._draw(*item, age=age)
+        except Exception as e:
+            print(f"An unexpected error occurred in the display: {e}")
+        finally:
+            if self.opened:
+                self.backend.close()
+                self.opened = False
+
+    def stats(self):
+        stats = self.metrics.snapshot()
+        if self.process and self.worker is not None:
+            # Draw times stay in the child process, only the number of drawn frames is shared
+            elapsed = time.perf_counter() - self.metrics.t_start
+            stats['count'] = self._drawn.value
+            stats['fps'] = stats['count'] / elapsed if elapsed > 0 else 0.0
+        stats['dropped'] = self.slot.dropped
+        stats['shown'] = self.shown
+        stats['expired'] = self.expired
+        return stats
+
+    def close(self):
+        """Stops the display thread or process and closes the window."""
+        self.exit_event.set()
+        if self.process and self.worker is not None:
+            self._process_exit.set()
+            self.worker.join(timeout=5)
+            if self.worker.is_alive():
+                self.worker.terminate()
+        elif self.worker is not None:
+            self.worker.join(timeout=5)
+        elif self.opened:
+            self.backend.close()
+            self.opened = False
+        self.worker = None
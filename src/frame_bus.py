@@ -0,0 +1,217 @@
+"""
+Shared memory frame bus: one capture producer publishes each frame once, any number of
+consumers in this or other processes read it without copying.
+
+The bus is a single SharedMemory block with a small header followed by a ring of frame
+slots. Every slot carries the sequence number of the frame in it (0 while it is being
+written). A reader always gets the newest frame, so slow readers skip frames and never
+hold up the producer. Frames are views into the ring: a slot is overwritten n_slots
+frames later, Frame.valid() tells whether that has happened yet.
+
+Usage:
+    bus = FrameBus((360, 640, 3), n_slots=8)        # producer
+    bus.publish(image)
+
+    reader = FrameReader(bus)                       # consumer in the same process
+    reader = FrameReader(FrameBus.attach(bus.name)) # consumer in another process
+    frame = reader.next(timeout=0.1)
+    if frame is not None:
+        process(frame.image)
+"""
+import os
+import threading
+import time
+
+import cv2 as cv
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+
+# Header fields, int64 each, followed by the slot sequence numbers and timestamps
+HEADER_FIELDS = ('n_slots', 'height', 'width', 'channels', 'latest')
+HEADER_SIZE = len(HEADER_FIELDS) * 8
+
+
+def _open_untracked(name):
+    """Opens an existing block without letting this process's resource tracker remove it on exit."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        pass
+    # Older versions register every block they open, only the producer should own it
+    shm = shared_memory.SharedMemory(name=name)
+    if os.name == 'posix':
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+class Frame:
+    """A published frame: a read-only view into one slot of the bus."""
+
+    __slots__ = ('bus', 'seq', 'slot', 'image', 'timestamp')
+
+    def __init__(self, bus, seq, slot, image, timestamp):
+        self.bus = bus
+        self.seq = seq
+        self.slot = slot
+        self.image = image
+        self.timestamp = timestamp
+
+    def valid(self):
+        """True as long as the slot still holds this frame, check it after reading the image."""
+        return self.bus._seqs[self.slot] == self.seq
+
+    def copy(self):
+        """Returns a copy of the image that stays valid after the slot is reused."""
+        return self.image.copy()
+
+
+class FrameBus:
+    """Ring of shared memory frame slots with sequence numbers, see the module docstring."""
+
+    def __init__(self, shape, n_slots=8, name=None, create=True):
+        """
+        Args:
+            shape: Frame shape (height, width, channels) of uint8 frames.
+            n_slots: Number of frames kept in the ring.
+            name: Name of the shared memory block, chosen by the system if None.
+            create: Create the block (producer) or open an existing one (see attach).
+        """
+        height, width, channels = shape
+        self.frame_size = height * width * channels
+        self.n_slots = n_slots
+        self.owner = create
+
+        # Header, slot sequence numbers and timestamps, padded to keep the frames 64-byte aligned
+        meta_size = HEADER_SIZE + 16 * n_slots
+        self._data_offset = -(-meta_size // 64) * 64
+        size = self._data_offset + n_slots * self.frame_size
+        if create:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            self.shm = _open_untracked(name)
+        self.name = self.shm.name
+
+        self._header = np.ndarray(len(HEADER_FIELDS), dtype=np.int64, buffer=self.shm.buf)
+        self._seqs = np.ndarray(n_slots, dtype=np.int64, buffer=self.shm.buf, offset=HEADER_SIZE)
+        self._timestamps = np.ndarray(n_slots, dtype=np.float64, buffer=self.shm.buf, offset=HEADER_SIZE + 8 * n_slots)
+        self._frames = np.ndarray((n_slots, height, width, channels), dtype=np.uint8,
+                                  buffer=self.shm.buf, offset=self._data_offset)
+        if create:
+            self._header[:] = (n_slots, height, width, channels, 0)
+            self._seqs[:] = 0
+
+        self.shape = (height, width, channels)
+        self._claimed = None
+        # Wakes readers in this process, readers in other processes poll
+        self._cond = threading.Condition()
+        self.published = 0
+
+    @classmethod
+    def attach(cls, name):
+        """Opens the bus a producer created under name, e.g. in another process."""
+        shm = _open_untracked(name)
+        try:
+            n_slots, height, width, channels, _ = np.ndarray(len(HEADER_FIELDS), dtype=np.int64, buffer=shm.buf).tolist()
+        finally:
+            shm.close()
+        return cls((int(height), int(width), int(channels)), int(n_slots), name=name, create=False)
+
+    @property
+    def latest_seq(self):
+        return int(self._header[4])
+
+    def claim(self):
+        """Returns the buffer of the next slot for the producer to write a frame into, then call commit."""
+        seq = self.latest_seq + 1
+        slot = (seq - 1) % self.n_slots
+        self._seqs[slot] = 0  # Readers that still hold a frame in this slot see it is gone
+        self._claimed = (seq, slot)
+        return self._frames[slot]
+
+    def commit(self, timestamp=None):
+        """Publishes the frame written into the claimed slot. Returns it as a Frame."""
+        seq, slot = self._claimed
+        self._claimed = None
+        self._timestamps[slot] = time.time() if timestamp is None else timestamp
+        self._seqs[slot] = seq
+        self._header[4] = seq
+        self.published += 1
+        with self._cond:
+            self._cond.notify_all()
+        return self._frame(seq, slot)
+
+    def publish(self, image, timestamp=None):
+        """Copies image into the next slot and publishes it. Frames of another size are resized to the bus shape."""
+        out = self.claim()
+        if image.shape == self.shape:
+            np.copyto(out, image)
+        else:
+            cv.resize(image, (self.shape[1], self.shape[0]), dst=out, interpolation=cv.INTER_LINEAR)
+        return self.commit(timestamp)
+
+    def _frame(self, seq, slot):
+        image = self._frames[slot]
+        image.flags.writeable = False
+        return Frame(self, seq, slot, image, float(self._timestamps[slot]))
+
+    def latest(self):
+        """Returns the newest published Frame, or None if there is none."""
+        seq = self.latest_seq
+        if seq == 0:
+            return None
+        slot = (seq - 1) % self.n_slots
+        if self._seqs[slot] != seq:
+            return None  # Overwritten between reading the header and the slot
+        return self._frame(seq, slot)
+
+    def wait(self, after_seq, timeout=None, poll_interval=0.001):
+        """Waits until a frame newer than after_seq is published. Returns False on timeout."""
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        with self._cond:
+            while self.latest_seq <= after_seq:
+                remaining = None if deadline is None else deadline - time.perf_counter()
+                if remaining is not None and remaining <= 0:
+                    return False
+                # Publishers in other processes cannot notify, so the wait is bounded
+                self._cond.wait(poll_interval if remaining is None else min(poll_interval, remaining))
+        return True
+
+    def close(self):
+        """Releases the mapping. The producer also removes the shared memory block."""
+        if self.owner:
+            if os.name == 'posix':
+                # A consumer sharing this process's resource tracker (e.g. a spawned child)
+                # unregistered the block when it attached, unlink expects it registered
+                resource_tracker.register(self.shm._name, 'shared_memory')
+            self.shm.unlink()
+        # Views into the block have to be released before it can be closed
+        self._header = self._seqs = self._timestamps = self._frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # Frames are still referenced, the mapping goes away with them
+
+
+class FrameReader:
+    """Consumer of a FrameBus that always reads the newest frame and counts the frames it skipped."""
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.last_seq = bus.latest_seq  # Only frames published from now on
+        self.read = 0
+        self.skipped = 0
+
+    def next(self, timeout=None):
+        """Returns the newest Frame published since the last call, or None on timeout."""
+        if not self.bus.wait(self.last_seq, timeout):
+            return None
+        frame = self.bus.latest()
+        if frame is None:
+            return None
+        self.skipped += frame.seq - self.last_seq - 1
+        self.last_seq = frame.seq
+        self.read += 1
+        return frame
+
+    def stats(self):
+        return {'read': self.read, 'skipped': self.skipped}
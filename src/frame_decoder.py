@@ -0,0 +1,86 @@
+import cv2 as cv
+import numpy as np
+
+from instrumentation import span
+
+PNG_SIGNATURE = b'\x89PNG'
+
+REDUCED_COLOR_FLAGS = {1: cv.IMREAD_COLOR, 2: cv.IMREAD_REDUCED_COLOR_2, 4: cv.IMREAD_REDUCED_COLOR_4, 8: cv.IMREAD_REDUCED_COLOR_8}
+
+
+class FrameDecoder:
+    """Decodes encoded frames (PNG, JPEG) directly to the working resolution.
+
+    The largest reduced decode mode (1/2, 1/4, 1/8) that still yields at least the target
+    size is chosen from the first frame and used for JPEG frames, which libjpeg scales
+    while decoding. PNG has no reduced decode, so PNG frames are decoded at full size.
+    The result is resized into a ring of preallocated buffers, so a decoded frame is only
+    overwritten n_buffers frames later. Consumers that keep a frame for longer than that
+    (e.g. the recorder) have to copy it.
+
+    Frames are always decoded to BGR, preprocess_image thresholds them in HSV.
+    """
+
+    def __init__(self, size=(640, 360), n_buffers=3):
+        """
+        Args:
+            size: Working resolution, format (width, height).
+            n_buffers: Number of output buffers used in turn.
+        """
+        self.size = size
+        self.flags = REDUCED_COLOR_FLAGS
+
+        shape = (size[1], size[0], 3)
+        self.buffers = [np.empty(shape, dtype=np.uint8) for _ in range(n_buffers)]
+        self.index = 0
+        self.reduce = None  # Reduction factor, chosen from the first frame
+        self.last_reduce = 1
+        self.source_size = None
+
+    def reduction_for(self, source_size):
+        """Returns the largest supported reduction factor that keeps the frame at least the target size."""
+        width, height = source_size
+        for factor in (8, 4, 2):
+            if width // factor >= self.size[0] and height // factor >= self.size[1]:
+                return factor
+        return 1
+
+    def decode(self, data):
+        """
+        Decodes one frame.
+
+        Args:
+        data (np.array): Encoded image bytes as uint8 array.
+
+        Returns:
+        np.array: Frame at the working resolution, usually one of the reused buffers, or None.
+        """
+        # OpenCV's reduced PNG decode is a full decode followed by a resize
+        reduce = 1 if bytes(data[:4]) == PNG_SIGNATURE else (self.reduce or 1)
+        self.last_reduce = reduce
+
+        with span('decode.imdecode'):
+            image = cv.imdecode(data, self.flags[reduce])
+        if image is None:
+            return None
+
+        if self.reduce is None:
+            # The first frame is decoded at full size to learn the source resolution
+            self.source_size = (image.shape[1], image.shape[0])
+            self.reduce = self.reduction_for(self.source_size)
+
+        if (image.shape[1], image.shape[0]) == self.size:
+            return image  # The decoder already produced the working resolution
+
+        out = self.buffers[self.index]
+        self.index = (self.index + 1) % len(self.buffers)
+
+        with span('decode.resize'):
+            cv.resize(image, self.size, dst=out, interpolation=cv.INTER_LINEAR)
+        return out
+
+    def allocated_bytes(self):
+        """Bytes allocated per decoded frame by the last decode, the output buffers are reused."""
+        if self.source_size is None:
+            return None
+        return (self.source_size[0] // self.last_reduce) * (self.source_size[1] // self.last_reduce) * 3
@@ -0,0 +1,317 @@
+import base64
+import itertools
+import json
+import os
+import threading
+import time
+import urllib.request
+import zlib
+from abc import ABC, abstractmethod
+
+import cv2 as cv
+import numpy as np
+import websocket
+
+from frame_decoder import FrameDecoder
+from instrumentation import span
+from slowroads_utils import grab_screenshot
+
+# A frame archive consists of two files: <path>.frames holds the raw uint8 BGR frames
+# back to back, <path>.index is a JSON lines sidecar with one entry per frame giving its
+# byte offset, shape and capture timestamp. Frames written with compression carry
+# 'codec' and 'nbytes' in their entry and are stored zlib compressed.
+FRAMES_SUFFIX = '.frames'
+INDEX_SUFFIX = '.index'
+
+
+class FrameSource(ABC):
+    """Interface of everything SlowRoadsSimulator.grab_screenshot can read frames from."""
+
+    # Set once the source cannot deliver any more frames
+    finished = False
+
+    @abstractmethod
+    def grab(self):
+        """Returns (success, image) with the next BGR frame."""
+
+    def close(self):
+        pass
+
+
+class DriverFrameSource(FrameSource):
+    """Live frames from a Selenium driver."""
+
+    def __init__(self, driver, decode_size=None):
+        """
+        Args:
+            driver: Selenium WebDriver object.
+            decode_size: Optional (width, height) to decode the screenshots to with a FrameDecoder.
+        """
+        self.driver = driver
+        self.decoder = None if decode_size is None else FrameDecoder(decode_size)
+
+    def grab(self):
+        return grab_screenshot(self.driver, self.decoder)
+
+
+class ScreencastFrameSource(FrameSource):
+    """Live frames pushed by Chrome through the DevTools Page.startScreencast command.
+
+    Chrome sends a compressed frame whenever the page renders a new one. A background
+    thread keeps only the most recent frame, so grab() never waits for a WebDriver round
+    trip; it decodes the latest frame and only waits if nothing new arrived since the
+    previous call. Requires Chrome, the DevTools connection is opened next to the one
+    chromedriver uses.
+    """
+
+    def __init__(self, driver, format='jpeg', quality=80, max_size=None, every_nth_frame=1, timeout=1.0, decode_size=None):
+        """
+        Args:
+            driver: Chrome WebDriver object.
+            format: 'jpeg' or 'png'.
+            quality: JPEG quality between 0 and 100.
+            max_size: Optional (width, height) the frames are scaled down to fit in.
+            every_nth_frame: Only send every n-th rendered frame.
+            timeout: Maximum time in seconds grab() waits for a new frame.
+            decode_size: Optional (width, height) to decode the frames to with a FrameDecoder.
+        """
+        self.timeout = timeout
+        self.decoder = None if decode_size is None else FrameDecoder(decode_size)
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._latest = None  # (sequence number, encoded frame)
+        self._sequence = 0
+        self._last_grabbed = 0
+        self._closed = False
+
+        self.ws = websocket.create_connection(self._page_websocket_url(driver), suppress_origin=True)
+        self._thread = threading.Thread(target=self._receive, daemon=True)
+        self._thread.start()
+
+        params = {'format': format, 'quality': quality, 'everyNthFrame': every_nth_frame}
+        if max_size is not None:
+            params['maxWidth'], params['maxHeight'] = max_size
+        self._send('Page.startScreencast', params)
+
+    @staticmethod
+    def _page_websocket_url(driver):
+        """Returns the DevTools websocket URL of the page the driver controls."""
+        address = driver.capabilities['goog:chromeOptions']['debuggerAddress']
+        with urllib.request.urlopen(f"http://{address}/json") as response:
+            targets = json.load(response)
+
+        pages = [t for t in targets if t.get('type') == 'page']
+        current_url = driver.current_url
+        for target in pages:
+            if target.get('url') == current_url:
+                return target['webSocketDebuggerUrl']
+        return pages[0]['webSocketDebuggerUrl']
+
+    def _send(self, method, params=None):
+        self.ws.send(json.dumps({'id': next(self._ids), 'method': method, 'params': params or {}}))
+
+    def _receive(self):
+        while not self._closed:
+            try:
+                message = json.loads(self.ws.recv())
+            except Exception as e:
+                if not self._closed:
+                    print(f"Screencast connection closed: {e}")
+                break
+
+            if message.get('method') != 'Page.screencastFrame':
+                continue
+
+            params = message['params']
+            # Chrome only sends the next frame after the previous one was acknowledged
+            self._send('Page.screencastFrameAck', {'sessionId': params['sessionId']})
+
+            with self._cond:
+                self._sequence += 1
+                self._latest = (self._sequence, params['data'])
+                self._cond.notify_all()
+
+        with self._cond:
+            self.finished = True
+            self._cond.notify_all()
+
+    def grab(self):
+        with self._cond:
+            has_new = self._cond.wait_for(
+                lambda: self.finished or (self._latest is not None and self._latest[0] > self._last_grabbed),
+                self.timeout,
+            )
+            if not has_new or self._latest is None or self._latest[0] <= self._last_grabbed:
+                return False, None
+            self._last_grabbed, data = self._latest
+
+        with span('capture.decode'):
+            nparr = np.frombuffer(base64.b64decode(data), np.uint8)
+            if self.decoder is None:
+                image = cv.imdecode(nparr, cv.IMREAD_COLOR)
+            else:
+                image = self.decoder.decode(nparr)
+        return image is not None, image
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._send('Page.stopScreencast')
+            self.ws.close()
+        except Exception:
+            pass
+
+
+class FrameArchiveWriter:
+    """Appends frames to a frame archive that ReplayFrameSource can memory-map."""
+
+    def __init__(self, path, append=False):
+        mode = 'ab' if append else 'wb'
+        self.path = path
+        self.frames_file = open(path + FRAMES_SUFFIX, mode)
+        self.index_file = open(path + INDEX_SUFFIX, mode[0])
+        self.offset = self.frames_file.tell()
+        self.count = 0
+
+    def write(self, image, timestamp=None, compression=None, **meta):
+        """Appends one frame.
+
+        Args:
+            image: uint8 image, usually BGR with shape (height, width, 3).
+            timestamp: Capture time in seconds, defaults to the current time.
+            compression: zlib level (0-9) to compress the frame with, None stores it raw
+                so that it can be replayed zero-copy.
+            meta: Additional values stored under 'meta' in the index entry.
+        """
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        entry = {
+            'offset': self.offset,
+            'shape': list(image.shape),
+            't': time.time() if timestamp is None else timestamp,
+        }
+
+        data = image.data
+        if compression is not None:
+            data = zlib.compress(data, compression)
+            entry['codec'] = 'zlib'
+            entry['nbytes'] = len(data)
+        if meta:
+            entry['meta'] = meta
+
+        self.frames_file.write(data)
+        self.index_file.write(json.dumps(entry, default=_to_builtin) + "\n")
+        self.offset += len(data) if compression is not None else image.nbytes
+        self.count += 1
+
+    def flush(self):
+        self.frames_file.flush()
+        self.index_file.flush()
+
+    def close(self):
+        self.frames_file.close()
+        self.index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _to_builtin(value):
+    """Converts NumPy scalars and arrays in index entries to JSON types."""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def read_frame_index(path):
+    """Reads the sidecar index of a frame archive as a list of dictionaries."""
+    with open(path + INDEX_SUFFIX, 'r') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+class ReplayFrameSource(FrameSource):
+    """Replays a recorded frame archive without a browser.
+
+    Raw frames are returned as read-only views into a memory map of the archive, so no
+    frame is copied until a consumer writes to it. Compressed frames are decompressed.
+    """
+
+    def __init__(self, path, realtime=False, loop=False):
+        """
+        Args:
+            path: Archive path without suffix.
+            realtime: If True, frames are delivered at the pace they were recorded at,
+                otherwise as fast as they are requested.
+            loop: Start again from the first frame after the last one.
+        """
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+
+        self.index = read_frame_index(path)
+        if os.path.getsize(path + FRAMES_SUFFIX) > 0:
+            self.data = np.memmap(path + FRAMES_SUFFIX, dtype=np.uint8, mode='r')
+        else:
+            self.data = np.zeros(0, dtype=np.uint8)
+
+        self.position = 0
+        self.finished = len(self.index) == 0
+        self._t_start = None  # Wall clock time that corresponds to frame t_offset
+        self._t_offset = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def frame(self, i):
+        """Returns frame i as a read-only view into the archive."""
+        entry = self.index[i]
+        shape = tuple(entry['shape'])
+        start = entry['offset']
+
+        if entry.get('codec') == 'zlib':
+            data = zlib.decompress(self.data[start:start + entry['nbytes']])
+            return np.frombuffer(data, dtype=np.uint8).reshape(shape)
+
+        return self.data[start:start + int(np.prod(shape))].reshape(shape)
+
+    def seek(self, i):
+        """Moves playback to frame i."""
+        if not 0 <= i < len(self.index):
+            raise IndexError(f"Frame {i} out of range for archive with {len(self.index)} frames")
+        self.position = i
+        self.finished = False
+        self._t_start = None
+
+    def grab(self):
+        if self.position >= len(self.index):
+            if not self.loop or not self.index:
+                self.finished = True
+                return False, None
+            self.seek(0)
+
+        i = self.position
+        if self.realtime:
+            self._wait_for(i)
+
+        self.position += 1
+        return True, self.frame(i)
+
+    def _wait_for(self, i):
+        t_frame = self.index[i]['t']
+        if self._t_start is None:
+            self._t_start, self._t_offset = time.perf_counter(), t_frame
+            return
+
+        delay = (t_frame - self._t_offset) - (time.perf_counter() - self._t_start)
+        if delay > 0:
+            time.sleep(delay)
+
+    def close(self):
+        # Drop the reference to the memory map so the file can be released
+        self.data = np.zeros(0, dtype=np.uint8)
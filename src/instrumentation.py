@@ -0,0 +1,187 @@
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+# Instrumentation is off by default; span() and timed() then only check this flag
+_enabled = False
+
+_spans = {}
+_spans_lock = threading.Lock()
+
+
+class SpanStats:
+    """Fixed-size ring buffer with the most recent durations of one span."""
+
+    def __init__(self, name, size=4096):
+        self.name = name
+        self.durations = np.zeros(size, dtype=np.float64)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def add(self, duration):
+        with self._lock:
+            self.durations[self.count % len(self.durations)] = duration
+            self.count += 1
+
+    def summary(self):
+        """Returns count, mean and p50/p95/p99/max in milliseconds over the buffered durations."""
+        with self._lock:
+            values = self.durations[:min(self.count, len(self.durations))].copy()
+            count = self.count
+
+        if len(values) == 0:
+            return {'count': 0}
+
+        p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1e3
+        return {
+            'count': count,
+            'mean_ms': float(values.mean() * 1e3),
+            'p50_ms': float(p50),
+            'p95_ms': float(p95),
+            'p99_ms': float(p99),
+            'max_ms': float(values.max() * 1e3),
+        }
+
+
+class _Span:
+    __slots__ = ('stats', 't_start')
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def __enter__(self):
+        self.t_start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.add((time.perf_counter_ns() - self.t_start) * 1e-9)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def get_span(name):
+    """Returns the SpanStats registered under name, creating it on first use."""
+    stats = _spans.get(name)
+    if stats is None:
+        with _spans_lock:
+            stats = _spans.setdefault(name, SpanStats(name))
+    return stats
+
+
+def span(name):
+    """Context manager that records the duration of its block under name.
+
+    Example:
+        with span('preprocess.resize'):
+            resized_image = cv.resize(image, size)
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(get_span(name))
+
+
+def timed(name):
+    """Decorator that records the duration of every call of the function under name."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            t_start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                get_span(name).add((time.perf_counter_ns() - t_start) * 1e-9)
+        return wrapper
+    return decorator
+
+
+def record(name, duration):
+    """Records a duration in seconds that was measured elsewhere."""
+    if _enabled:
+        get_span(name).add(duration)
+
+
+def reset():
+    """Removes all recorded spans."""
+    with _spans_lock:
+        _spans.clear()
+
+
+def snapshot():
+    """Returns a dictionary mapping every span name to its summary."""
+    with _spans_lock:
+        spans = list(_spans.values())
+    return {stats.name: stats.summary() for stats in sorted(spans, key=lambda s: s.name)}
+
+
+def dump_json(path):
+    """Writes the current snapshot together with a timestamp to a JSON file.
+
+    The file is replaced atomically, so a reader never sees a partially written dump.
+    """
+    data = {'time': time.time(), 'spans': snapshot()}
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as file:
+            json.dump(data, file, indent=4)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def format_snapshot(snap=None):
+    """Formats a snapshot as one line per span."""
+    snap = snapshot() if snap is None else snap
+    return "\n".join(
+        f"{name:>32}: n={s['count']:<7} p50 {s['p50_ms']:7.2f} ms | p95 {s['p95_ms']:7.2f} ms | p99 {s['p99_ms']:7.2f} ms"
+        for name, s in snap.items() if s['count']
+    )
+
+
+def start_periodic_dump(path, interval, stop_event):
+    """Starts a daemon thread that writes dump_json(path) every interval seconds until stop_event is set."""
+    def _dump():
+        while not stop_event.wait(interval):
+            try:
+                dump_json(path)
+            except Exception as e:
+                print(f"An error occurred while writing instrumentation data: {e}")
+
+    thread = threading.Thread(target=_dump, daemon=True)
+    thread.start()
+    return thread
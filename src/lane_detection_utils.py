@@ -1,22 +1,87 @@
+import threading
+
 import numpy as np
 import cv2 as cv
+from instrumentation import span, timed
 
 
+@timed('preprocess.components')
 def remove_small_components(image, min_size=90):
-    num_labels, labels_im = cv.connectedComponents(image)
+    """
+    Removes connected components whose area is not larger than min_size.
 
-    # Create an output image the same size as the original, initialized to zero (black)
-    output = np.zeros_like(image)
+    The component areas come from a single cv.connectedComponentsWithStats pass and
+    are turned into a keep/drop lookup table indexed by label, so the cost does not
+    grow with the number of components in the frame.
+
+    Args:
+    image (np.array): Binary uint8 image (0 or 255).
+    min_size (int): Components with an area of min_size pixels or less are removed.
 
-    for label in range(1, num_labels):
-        # Create a mask where the components are equal to the current label
-        component = labels_im == label
-        if np.sum(component) > min_size:  # If the component is larger than min_size
-            output[component] = 255
+    Returns:
+    np.array: Image of the same shape with only the large components set to 255.
+    """
+    _, labels_im, stats, _ = cv.connectedComponentsWithStats(image)
+    return _component_lut(stats, min_size)[labels_im]
 
-    return output
+def _component_lut(stats, min_size):
+    """Maps every label to 255 (keep) or 0 (drop); label 0 is the background."""
+    lut = np.where(stats[:, cv.CC_STAT_AREA] > min_size, 255, 0).astype(np.uint8)
+    lut[0] = 0
+    return lut
 
-def preprocess_image(image, lower_white=None, upper_white=None, size=(640, 360)):
+@timed('preprocess.components')
+def remove_small_band_components(image, cut_top, cut_bottom, min_size=90):
+    """
+    remove_small_components for a band of rows cut out of a taller mask.
+
+    A component that touches a cut edge may continue outside the band, so its area in
+    the band is only a lower bound. It is kept if that bound exceeds min_size already,
+    otherwise its size cannot be decided from the band.
+
+    Args:
+    image (np.array): Binary uint8 band (0 or 255).
+    cut_top (bool): The mask continues above the first row of the band.
+    cut_bottom (bool): The mask continues below the last row of the band.
+    min_size (int): Components with an area of min_size pixels or less are removed.
+
+    Returns:
+    np.array: Band with the components kept so far set to 255.
+    bool: True if a component at a cut edge was too small to decide, the band then has
+        to be extended.
+    """
+    _, labels_im, stats, _ = cv.connectedComponentsWithStats(image)
+    lut = _component_lut(stats, min_size)
+
+    top = stats[:, cv.CC_STAT_TOP]
+    cut = np.zeros(len(stats), dtype=bool)
+    if cut_top:
+        cut |= top == 0
+    if cut_bottom:
+        cut |= top + stats[:, cv.CC_STAT_HEIGHT] == image.shape[0]
+    cut[0] = False
+
+    return lut[labels_im], bool(np.any(cut & (lut == 0)))
+
+def scanline_band(ymin, ymax, height, margin=10):
+    """
+    Computes the rows of the working image that are needed to analyze the stripe ymin:ymax.
+
+    Args:
+    ymin (int): First row of the stripe read by find_driving_path.
+    ymax (int): Last row (exclusive) of the stripe read by find_driving_path.
+    height (int): Height of the working image.
+    margin (int): Extra rows kept above and below the stripe. Component filtering sees
+        more of the markings that cross the stripe, so preprocess_image has to extend
+        the band less often.
+
+    Returns:
+    tuple: (y0, y1) row range in working image coordinates.
+    """
+    return max(ymin - margin, 0), min(ymax + margin, height)
+
+@timed('preprocess.total')
+def preprocess_image(image, lower_white=None, upper_white=None, size=(640, 360), roi=None):
     """
     Preprocess an image to extract a mask of the road based on specified white color ranges.
     Allows resizing the image to a specified size for consistent processing.
@@ -26,33 +91,70 @@ def preprocess_image(image, lower_white=None, upper_white=None, size=(640, 360))
     lower_white (np.array): Lower bound for the white color range, default if None.
     upper_white (np.array): Upper bound for the white color range, default if None.
     size (tuple): The target size for resizing the image, format (width, height).
+    roi (tuple): Optional (y0, y1) row range in working image coordinates, see scanline_band.
+        If given, only the matching rows of the source image are cropped, resized and
+        thresholded, and the returned arrays cover just these rows. The mask is the same
+        as these rows of the full-frame mask: while a marking that crosses the band edge
+        is too small inside the band to decide whether it is noise, the band is extended.
 
     Returns:
     np.array: A binary mask where white areas within the specified range are marked.
+    np.array: The resized image (or the resized band if roi is given).
     """
 
-    # Set default color ranges using the 'or' operator for concise default assignment
-    lower_white = lower_white or np.array([0, 0, 170], dtype=np.uint8)
-    upper_white = upper_white or np.array([255, 30, 255], dtype=np.uint8)
-
-    # Resize the image to the specified size for uniform processing
-    resized_image = cv.resize(image, size, interpolation=cv.INTER_LINEAR)
+    # Set default color ranges
+    lower_white = np.array([0, 0, 170], dtype=np.uint8) if lower_white is None else np.asarray(lower_white, dtype=np.uint8)
+    upper_white = np.array([255, 30, 255], dtype=np.uint8) if upper_white is None else np.asarray(upper_white, dtype=np.uint8)
+
+    if roi is None:
+        resized_image = _resize(image, size)
+        mask = _threshold(resized_image, lower_white, upper_white)
+
+        # Remove noise using morphological operations
+        mask = remove_small_components(mask)
+    else:
+        y0, y1 = roi
+        b0, b1 = y0, y1
+        scale = image.shape[0] / size[1]
+        while True:
+            # Map the band back to source image rows and crop before resizing
+            band = image[int(round(b0 * scale)):int(round(b1 * scale))]
+            resized_image = _resize(band, (size[0], b1 - b0))
+            mask = _threshold(resized_image, lower_white, upper_white)
+            mask, undecided = remove_small_band_components(mask, b0 > 0, b1 < size[1])
+            if not undecided:
+                break
+            # A marking crosses the band edge, extend the band until its size is known
+            grow = b1 - b0
+            b0, b1 = max(b0 - grow, 0), min(b1 + grow, size[1])
+
+        mask = mask[y0 - b0:y1 - b0]
+        resized_image = resized_image[y0 - b0:y1 - b0]
 
-    # Convert the image from BGR to HSV color space
-    hsv_image = cv.cvtColor(resized_image, cv.COLOR_BGR2HSV)
+    # Normalize the mask to binary values (0 or 1) by integer division
+    with span('preprocess.normalize'):
+        mask = mask // 255
 
-    # Create a mask to isolate the white regions in the image
-    mask = cv.inRange(hsv_image, lower_white, upper_white)
+    return mask, resized_image
 
-    # Remove noise using morphological operations
-    mask = remove_small_components(mask)
+def _resize(image, size):
+    """Resizes image to size for uniform processing."""
+    with span('preprocess.resize'):
+        if (image.shape[1], image.shape[0]) == size:
+            return image  # Already at the working resolution, e.g. from a FrameDecoder
+        return cv.resize(image, size, interpolation=cv.INTER_LINEAR)
 
-    # Normalize the mask to binary values (0 or 1) by integer division
-    mask = mask // 255
+def _threshold(resized_image, lower_white, upper_white):
+    """Returns the 0/255 mask of the pixels within the white color range."""
+    # Convert the image from BGR to HSV color space
+    with span('preprocess.hsv'):
+        hsv_image = cv.cvtColor(resized_image, cv.COLOR_BGR2HSV)
 
-    return mask, resized_image
+    # Create a mask to isolate the white regions in the image
+    with span('preprocess.in_range'):
+        return cv.inRange(hsv_image, lower_white, upper_white)
 
-def plot_results(image, mask, ymin, ymax, cx, l_index, r_index = None):
+def plot_results(image, mask, ymin, ymax, cx, l_index, r_index = None, out = None):
     """
     Overlays the mask on the image with a red stripe indicating the driving path.
 
@@ -62,16 +164,26 @@ def plot_results(image, mask, ymin, ymax, cx, l_index, r_index = None):
     - ymin: Minimum y-coordinate for the stripe.
     - ymax: Maximum y-coordinate for the stripe.
     - cx: Center x-coordinate of the image.
-    - index: Width of the stripe to the left of the center.
+    - l_index: Width of the stripe to the left of the center.
+    - r_index: Width of the stripe to the right of the center, None for a left stripe only.
+    - out: Buffer with the shape of image to draw into, a new array is allocated if None.
 
     Returns:
     - result: Image with the overlay.
     """
-    result = image.copy()
-    mask_rgb = cv.cvtColor(mask, cv.COLOR_GRAY2RGB) * 255
+    if out is None:
+        result = image.copy()
+    else:
+        result = out
+        np.copyto(result, image)
+    x_end = cx if r_index is None else cx + r_index
     
-    # Apply mask to the specified stripe area
-    result[ymin:ymax, :cx, :] = mask_rgb[ymin:ymax, :cx, :]
+    # Apply mask to the specified stripe area, only the stripe is converted to RGB.
+    # OpenCV writes straight into the stripe view, NumPy would allocate a cast buffer
+    stripe = result[ymin:ymax, :x_end, :]
+    if stripe.size:
+        cv.cvtColor(mask[ymin:ymax, :x_end], cv.COLOR_GRAY2RGB, dst=stripe)
+        cv.multiply(stripe, (255, 255, 255, 0), dst=stripe)
 
     # Add red stripe indicating the path
     result[ymin:ymax, cx - l_index:cx, 1:] = 0
@@ -82,9 +194,134 @@ def plot_results(image, mask, ymin, ymax, cx, l_index, r_index = None):
 
     return result
 
+def draw_lane_curve(overlay, coefficients, ymin, ymax):
+    """Draws the fitted marking polynomial of find_lane_curve between ymin and ymax into overlay."""
+    ys = np.arange(ymin, ymax)
+    points = np.stack([np.polyval(coefficients, ys), ys], axis=1).round().astype(np.int32)
+    cv.polylines(overlay, [points], False, (0, 0, 255), 2)
+    return overlay
+
+class Overlay:
+    """Detection overlay that is only rendered once a consumer asks for it.
+
+    Holds the plot_results arguments of a detection; render() or np.asarray(overlay)
+    draws it into a buffer of the OverlayRenderer on the consumer's thread. Image and
+    mask are referenced, not copied, so they must not be reused before the overlay is
+    rendered (FrameDecoder buffers are reused n_buffers frames later).
+
+    If the image is a view into a frame_bus slot, set source to its Frame: render() then
+    checks after drawing that the slot still holds the frame and returns None otherwise.
+    detach() returns a picklable copy that renders into a new array, e.g. in a display
+    process.
+    """
+
+    __slots__ = ('renderer', 'args', 'coefficients', 'source', '_result')
+
+    def __init__(self, renderer, args, coefficients=None, source=None):
+        self.renderer = renderer
+        self.args = args
+        self.coefficients = coefficients
+        self.source = source
+        self._result = None
+
+    @property
+    def shape(self):
+        return self.args[0].shape
+
+    def valid(self):
+        """False once the frame the image belongs to was overwritten."""
+        return self.source is None or self.source.valid()
+
+    def render(self):
+        """Returns the rendered overlay, drawing it on the first call, or None if the source frame was overwritten."""
+        if self._result is None:
+            if not self.valid():
+                return None
+            if self.renderer is None:
+                result = render_overlay(True, *self.args, coefficients=self.coefficients)
+            else:
+                result = self.renderer.render(*self.args, coefficients=self.coefficients)
+            # The slot may have been reused while it was drawn, then the result is torn
+            if not self.valid():
+                return None
+            self._result = result
+        return self._result
+
+    def detach(self):
+        """Returns an unrendered copy that owns its image and mask and has no renderer.
+
+        Returns None if the source frame was overwritten before the copy was taken.
+        """
+        image, mask, *rest = self.args
+        detached = Overlay(None, (image.copy(), mask.copy(), *rest), self.coefficients)
+        if not self.valid():
+            return None
+        return detached
+
+    def __array__(self, dtype=None, copy=None):
+        result = self.render()
+        if result is None:
+            raise ValueError("The frame of the overlay was overwritten before it was rendered")
+        return result if dtype is None else result.astype(dtype)
+
+class OverlayRenderer:
+    """Renders detection overlays into a ring of reusable buffers.
+
+    Pass a renderer as draw to find_driving_path, find_driving_path_two_sided or
+    find_lane_curve to get a deferred Overlay instead of an array: detection only stores
+    the stripe parameters and the overlay is drawn when a display or recorder consumes
+    it. A rendered overlay is overwritten n_buffers renders later, consumers that keep
+    it for longer have to copy it.
+    """
+
+    def __init__(self, n_buffers=3):
+        """
+        Args:
+            n_buffers: Number of output buffers used in turn.
+        """
+        self.n_buffers = n_buffers
+        self.buffers = []
+        self.index = 0
+        self.rendered = 0
+        self._lock = threading.Lock()
+
+    def _next_buffer(self, shape):
+        if not self.buffers or self.buffers[0].shape != shape:
+            # First frame or a new frame size
+            self.buffers = [np.empty(shape, dtype=np.uint8) for _ in range(self.n_buffers)]
+            self.index = 0
+        out = self.buffers[self.index]
+        self.index = (self.index + 1) % self.n_buffers
+        return out
+
+    def render(self, image, mask, ymin, ymax, cx, l_index, r_index=None, coefficients=None):
+        """Draws plot_results (and the lane curve, if coefficients are given) into the next buffer."""
+        with self._lock, span('overlay.render'):
+            out = plot_results(image, mask, ymin, ymax, cx, l_index, r_index, out=self._next_buffer(image.shape))
+            if coefficients is not None:
+                draw_lane_curve(out, coefficients, ymin, ymax)
+            self.rendered += 1
+        return out
+
+    def defer(self, image, mask, ymin, ymax, cx, l_index, r_index=None, coefficients=None):
+        """Returns an Overlay that calls render with these arguments on first use."""
+        return Overlay(self, (image, mask, ymin, ymax, cx, l_index, r_index), coefficients)
+
+def render_overlay(draw, image, mask, ymin, ymax, cx, l_index, r_index=None, coefficients=None):
+    """Renders the overlay of a detection for the draw argument of the find_* functions.
+
+    draw = True renders into a new array, an OverlayRenderer returns a deferred Overlay.
+    """
+    if isinstance(draw, OverlayRenderer):
+        return draw.defer(image, mask, ymin, ymax, cx, l_index, r_index, coefficients)
+    overlay = plot_results(image, mask, ymin, ymax, cx, l_index, r_index)
+    if coefficients is not None:
+        draw_lane_curve(overlay, coefficients, ymin, ymax)
+    return overlay
 
     
-def find_driving_path(image, mask, ymin=250, ymax=265, min_pixels=55, lane_width = 370, prev_center = None, stats = {}):
+@timed('detect.total')
+def find_driving_path(image, mask, ymin=250, ymax=265, min_pixels=55, lane_width = 370, prev_center = None, stats = None, roi_offset = 0, search_width = None, draw = True):
     """
     Finds the driving path within the image based on the mask.
 
@@ -96,7 +333,14 @@ def find_driving_path(image, mask, ymin=250, ymax=265, min_pixels=55, lane_width
     - min_pixels: Minimum number of pixels required to classify a line as a lane line.
     - lane_width: Expected width of the lane.
     - prev_center: Previous center of the lane, used to split the mask into left and right halves.
-    - stats: Dictionary to store additional statistics.
+      The marking is searched from prev_center towards the left.
+    - stats: Dictionary to store additional statistics, a new one is created if None.
+    - roi_offset: Row of the working image at which image and mask start. Use the y0 of
+      scanline_band when the inputs come from preprocess_image in ROI mode.
+    - search_width: Only search the search_width columns left of prev_center, None searches
+      up to the left image border.
+    - draw: Render the overlay. If False, the returned overlay is None. An OverlayRenderer
+      returns a deferred Overlay that is only drawn when it is consumed.
 
     Returns:
     - success: Boolean indicating if a valid driving path was found.
@@ -107,50 +351,310 @@ def find_driving_path(image, mask, ymin=250, ymax=265, min_pixels=55, lane_width
 
     offset = None
     lane_center = None
+    marking_x = None
     overlay = None
 
+    if stats is None:
+        stats = {}
+
     
     height, width = mask.shape
     cx = width // 2  # Center x-coordinate
 
     prev_center = prev_center or cx
+    x_start = 0 if search_width is None else max(prev_center - search_width, 0)
 
-    # Crop the stripe between ymin and ymax and split it into left and right halves
-    stripe = mask[ymin:ymax, :prev_center][::-1]  # Left stripe, flipped vertically
+    # Express the stripe in the coordinates of the (possibly cropped) mask
+    ymin, ymax = ymin - roi_offset, ymax - roi_offset
 
-    # Sum the stripe along the vertical axis
-    summed = np.sum(stripe, axis=0)
+    with span('detect.stripe'):
+        # Crop the stripe between ymin and ymax left of prev_center
+        stripe = mask[ymin:ymax, x_start:prev_center][:, ::-1]  # Flipped horizontally to scan from prev_center outwards
 
-    # Cumulative sum to determine the path width
-    cumsum = np.cumsum(summed)
+        # Sum the stripe along the vertical axis
+        summed = np.sum(stripe, axis=0)
 
-    # # Total number of white pixels in the stripe
-    total_pixels = np.max(cumsum)
+        # Cumulative sum to determine the path width
+        cumsum = np.cumsum(summed)
+
+        # # Total number of white pixels in the stripe
+        total_pixels = np.max(cumsum)
 
     # Check if the total pixels exceed the minimum threshold
     success = total_pixels > min_pixels
 
     if success:
-       
-        # Find the index where the cumulative sum exceeds min_pixels
-        index = np.argmax(cumsum > min_pixels)
+        with span('detect.lane_position'):
+            # Find the index where the cumulative sum exceeds min_pixels
+            index = np.argmax(cumsum > min_pixels)
 
-        # Get the non-zero coordinates within the stripe up to the index
-        y, x = np.nonzero(stripe[:, :index])
+            # Get the non-zero coordinates within the stripe up to the index
+            y, x = np.nonzero(stripe[:, :index])
 
-        # Compute the mean x-coordinate of the non-zero pixels
-        mean_x = prev_center - np.mean(x, dtype = int)
+            # Compute the mean x-coordinate of the non-zero pixels
+            marking_x = prev_center - np.mean(x, dtype = int)
 
-        # Calculate lane center
-        lane_center = mean_x + lane_width//2
+            # Calculate lane center
+            lane_center = marking_x + lane_width//2
 
-        # Caluclate Offset
-        offset = int(cx - lane_center)
+            # Caluclate Offset, positive if the lane center is right of the image center
+            offset = int(lane_center - cx)
     
-        overlay = plot_results(image, mask, ymin, ymax, prev_center, index+20)
+        if draw:
+            with span('detect.overlay'):
+                overlay = render_overlay(draw, image, mask, ymin, ymax, prev_center, index+20)
     
     stats['lane_center'] = lane_center
     stats['offset'] = offset
+    stats['marking_x'] = marking_x
 
     
-    return success, offset, overlay, stats
\ No newline at end of file
+    return success, offset, overlay, stats
+
+def find_lane_markings(mask, ymin=250, ymax=265, min_pixels=55, center=None, roi_offset=0, search_window=None):
+    """
+    Finds the left and right lane markings in one pass over the stripe.
+
+    The stripe is summed once over its full width. The column sums left of center
+    (flipped to scan outwards) and right of center are stacked into one array, so
+    both sides are searched with the same cumsum/argmax pass find_driving_path uses.
+
+    Parameters:
+    - mask: Binary mask of the road.
+    - ymin: Minimum y-coordinate for the stripe.
+    - ymax: Maximum y-coordinate for the stripe.
+    - min_pixels: Minimum number of pixels required to classify a line as a lane line.
+    - center: Column that separates the left from the right side, the image center if None.
+    - roi_offset: Row of the working image at which the mask starts.
+    - search_window: (near, far) distance range from center in which both markings are
+      searched, None searches up to the image borders.
+
+    Returns:
+    - left_x: Column of the left marking, or None if it was not found.
+    - right_x: Column of the right marking, or None if it was not found.
+    - indices: Number of columns scanned until each marking was found, as (left, right).
+    """
+    width = mask.shape[1]
+    center = center or width // 2
+    ymin, ymax = ymin - roi_offset, ymax - roi_offset
+
+    near, far = (0, None) if search_window is None else search_window
+    far_left = center if far is None else min(far, center)
+    far_right = width - center if far is None else min(far, width - center)
+    near_left, near_right = min(near, far_left), min(near, far_right)
+
+    summed = np.sum(mask[ymin:ymax], axis=0, dtype=np.int32)
+
+    # Row 0 scans from center to the left border, row 1 from center to the right border,
+    # both starting near columns away from center
+    n = max(far_left - near_left, far_right - near_right, 1)
+    sides = np.zeros((2, n), dtype=np.int32)
+    sides[0, :far_left - near_left] = summed[center - far_left:center - near_left][::-1]
+    sides[1, :far_right - near_right] = summed[center + near_right:center + far_right]
+
+    cumsum = np.cumsum(sides, axis=1)
+    found = cumsum[:, -1] > min_pixels
+    indices = np.argmax(cumsum > min_pixels, axis=1)
+
+    # Mean distance from center of the marking pixels up to the index
+    columns = np.arange(n)
+    weights = sides * (columns < indices[:, None])
+    counts = weights.sum(axis=1)
+    found &= counts > 0
+    distance = (weights * columns).sum(axis=1) // np.maximum(counts, 1)
+
+    left_x = int(center - 1 - near_left - distance[0]) if found[0] else None
+    right_x = int(center + near_right + distance[1]) if found[1] else None
+    return left_x, right_x, (int(indices[0]) + near_left, int(indices[1]) + near_right)
+
+
+@timed('detect.two_sided')
+def find_driving_path_two_sided(image, mask, ymin=250, ymax=265, min_pixels=55, lane_width=370, prev_center=None, stats=None, roi_offset=0, min_width=200, max_width=560, draw=True, search_window=None):
+    """
+    Finds the driving path from the left and right lane markings.
+
+    If both markings are found the lane center lies halfway between them and the measured
+    lane width is reported in the stats. If only one is found, the center is inferred from
+    it and lane_width, as find_driving_path does for the left marking.
+
+    Parameters:
+    - image: The original image from which the mask was derived.
+    - mask: Binary mask of the road.
+    - ymin: Minimum y-coordinate for the stripe.
+    - ymax: Maximum y-coordinate for the stripe.
+    - min_pixels: Minimum number of pixels required to classify a line as a lane line.
+    - lane_width: Lane width used when only one marking is found.
+    - prev_center: Previous center of the lane, separates the left from the right side.
+    - stats: Dictionary to store additional statistics, a new one is created if None.
+    - roi_offset: Row of the working image at which image and mask start.
+    - min_width: Smallest plausible distance between the markings. Pairs outside
+      min_width and max_width are rejected and only the marking closer to its expected
+      position is used.
+    - max_width: Largest plausible distance between the markings.
+    - draw: Render the overlay, see find_driving_path.
+    - search_window: (near, far) distance range from prev_center in which the markings are
+      searched, see find_lane_markings.
+
+    Returns:
+    - success: Boolean indicating if a valid driving path was found.
+    - offset: Offset of the lane center from the image center.
+    - overlay: Image with the overlay indicating the driving path.
+    - stats: Dictionary with lane center, offset, both marking positions, the measured
+      lane width (None unless both markings were found) and the sides used.
+    """
+    offset = None
+    lane_center = None
+    measured_width = None
+    overlay = None
+
+    if stats is None:
+        stats = {}
+
+    height, width = mask.shape
+    cx = width // 2
+    prev_center = prev_center or cx
+
+    with span('detect.markings'):
+        left_x, right_x, (l_index, r_index) = find_lane_markings(mask, ymin, ymax, min_pixels, prev_center, roi_offset, search_window)
+
+    if left_x is not None and right_x is not None:
+        measured_width = right_x - left_x
+        if not min_width <= measured_width <= max_width:
+            # Keep the marking that agrees better with the previous center
+            measured_width = None
+            if abs(prev_center - lane_width//2 - left_x) <= abs(prev_center + lane_width//2 - right_x):
+                right_x = None
+            else:
+                left_x = None
+
+    if left_x is not None and right_x is not None:
+        lane_center = (left_x + right_x) // 2
+        sides = 'both'
+    elif left_x is not None:
+        lane_center = left_x + lane_width//2
+        sides = 'left'
+    elif right_x is not None:
+        lane_center = right_x - lane_width//2
+        sides = 'right'
+    else:
+        sides = None
+
+    success = sides is not None
+
+    if success:
+        # Caluclate Offset, positive if the lane center is right of the image center
+        offset = int(lane_center - cx)
+
+        if draw:
+            with span('detect.overlay'):
+                overlay = render_overlay(draw, image, mask, ymin - roi_offset, ymax - roi_offset, prev_center,
+                                         min(l_index + 20, prev_center) if left_x is not None else 0,
+                                         r_index + 20 if right_x is not None else None)
+
+    stats['lane_center'] = lane_center
+    stats['offset'] = offset
+    stats['marking_x'] = left_x
+    stats['right_marking_x'] = right_x
+    stats['measured_width'] = measured_width
+    stats['sides'] = sides
+
+    return success, offset, overlay, stats
+
+
+@timed('detect.curve')
+def find_lane_curve(image, mask, ymin=200, ymax=350, band_height=15, min_pixels=55, lane_width=370, y_ref=257, degree=2, prev_center=None, stats=None, draw=True):
+    """
+    Fits the lane marking over many horizontal bands to estimate offset and heading.
+
+    The rows ymin:ymax are viewed as bands of band_height rows without copying. The
+    marking position is computed for all bands at once in the same way find_driving_path
+    does for its single stripe, and a polynomial x(y) is fitted through the bands in
+    which a marking was found.
+
+    Parameters:
+    - image: The original image from which the mask was derived.
+    - mask: Binary mask of the road.
+    - ymin: First row of the first band.
+    - ymax: Last row (exclusive) covered by the bands, rounded down to full bands.
+    - band_height: Number of rows per band.
+    - min_pixels: Minimum number of pixels required to classify a band as containing a lane line.
+    - lane_width: Expected width of the lane at row y_ref.
+    - y_ref: Row at which the offset and heading are evaluated, the center of find_driving_path's stripe by default.
+    - degree: Degree of the fitted polynomial.
+    - prev_center: Previous center of the lane, the marking is searched left of it.
+    - stats: Dictionary to store additional statistics, a new one is created if None.
+    - draw: Render the overlay, see find_driving_path.
+
+    Returns:
+    - success: Boolean indicating if enough bands contained a marking for the fit.
+    - offset: Offset of the lane center at y_ref from the image center.
+    - overlay: Image with the fitted marking drawn on the overlay.
+    - stats: Dictionary with lane center, offset, marking_x, heading (radians, positive if
+      the marking leans to the right towards the horizon), curvature and the per-band positions.
+    """
+    stats = {} if stats is None else stats
+    offset = None
+    lane_center = None
+    overlay = None
+
+    height, width = mask.shape
+    cx = width // 2
+    prev_center = prev_center or cx
+
+    n_bands = (min(ymax, height) - ymin) // band_height
+    y_end = ymin + n_bands * band_height
+
+    with span('detect.curve_bands'):
+        # (n_bands, band_height, prev_center) view of the rows, flipped to scan from prev_center outwards
+        bands = mask[ymin:y_end, :prev_center].reshape(n_bands, band_height, prev_center)[:, :, ::-1]
+
+        # Column sums per band and their cumulative sums along the scan direction
+        summed = bands.sum(axis=1, dtype=np.int32)
+        cumsum = np.cumsum(summed, axis=1)
+
+        valid = cumsum[:, -1] > min_pixels
+        index = np.argmax(cumsum > min_pixels, axis=1)
+
+        # Mean distance from prev_center of the marking pixels up to index, for every band
+        columns = np.arange(prev_center)
+        weights = summed * (columns < index[:, None])
+        counts = weights.sum(axis=1)
+        valid &= counts > 0
+        distance = (weights * columns).sum(axis=1) / np.maximum(counts, 1)
+
+        band_x = prev_center - distance
+        band_y = ymin + band_height * (np.arange(n_bands) + 0.5)
+
+    success = np.count_nonzero(valid) > degree
+    coefficients = None
+    heading = None
+    curvature = None
+    marking_x = None
+
+    if success:
+        with span('detect.curve_fit'):
+            coefficients = np.polyfit(band_y[valid], band_x[valid], degree)
+            marking_x = int(np.polyval(coefficients, y_ref))
+
+            # dx/dy and d2x/dy2 of the marking at y_ref; y grows downwards, so a marking that
+            # leans right towards the horizon has a negative slope
+            slope = np.polyval(np.polyder(coefficients), y_ref)
+            heading = float(np.arctan(-slope))
+            curvature = float(np.polyval(np.polyder(coefficients, 2), y_ref)) if degree >= 2 else 0.0
+
+            lane_center = marking_x + lane_width//2
+            offset = int(lane_center - cx)
+
+        if draw:
+            with span('detect.overlay'):
+                overlay = render_overlay(draw, image, mask, ymin, y_end, prev_center, 0, coefficients=coefficients)
+
+    stats['lane_center'] = lane_center
+    stats['offset'] = offset
+    stats['marking_x'] = marking_x
+    stats['heading'] = heading
+    stats['curvature'] = curvature
+    stats['coefficients'] = coefficients
+    stats['band_x'] = np.where(valid, band_x, np.nan)
+
+    return success, offset, overlay, stats
@@ -0,0 +1,162 @@
+from lane_detection_utils import find_driving_path, find_driving_path_two_sided
+
+
+class LaneTracker:
+    """Tracks the lane marking between frames and searches only near its predicted position.
+
+    The marking position is filtered with an alpha-beta filter (position and velocity in
+    pixels per frame). Each frame the stripe is only searched within a window around the
+    prediction. After a miss the window doubles, and after max_misses misses in a row
+    the track is dropped and find_driving_path searches the whole left half again.
+
+    With two_sided, the stripe is split at the predicted lane center and each marking is
+    searched in a window of the same size around its expected distance from the center.
+    The lane width is measured whenever both are found and smoothed with width_alpha,
+    and a missing left marking is inferred from the right one.
+    """
+
+    def __init__(self, window=40, max_misses=4, alpha=0.6, beta=0.2, lane_width=370, two_sided=False, width_alpha=0.1):
+        """
+        Args:
+            window: Half width in pixels of the search window around the predicted marking.
+            max_misses: Consecutive misses after which the track is dropped.
+            alpha: Position gain of the filter, 1 follows the measurements without smoothing.
+            beta: Velocity gain of the filter.
+            lane_width: Lane width in pixels, the lane center is half of it right of the marking.
+                With two_sided it is only the initial value of the measured width.
+            two_sided: Use find_driving_path_two_sided instead of the left-side search window.
+            width_alpha: Smoothing gain of the measured lane width, 0 keeps lane_width fixed.
+        """
+        self.window = window
+        self.max_misses = max_misses
+        self.alpha = alpha
+        self.beta = beta
+        self.lane_width = lane_width
+        self.two_sided = two_sided
+        self.width_alpha = width_alpha
+        self.width_measurements = 0
+        self.reset()
+
+    def reset(self):
+        self.marking_x = None  # Filtered marking position
+        self.velocity = 0.0
+        self.misses = 0
+
+    @property
+    def tracking(self):
+        return self.marking_x is not None
+
+    def predict(self):
+        """Returns the predicted marking position for the next frame, or None without a track."""
+        if not self.tracking:
+            return None
+        return self.marking_x + self.velocity
+
+    @property
+    def lane_center(self):
+        if not self.tracking:
+            return None
+        return self.marking_x + self.lane_width / 2
+
+    def search_window(self, width):
+        """
+        Returns the (prev_center, search_width) arguments of find_driving_path for the next frame.
+
+        Both are None without a track, which makes find_driving_path search the full left half.
+        """
+        predicted = self.predict()
+        if predicted is None:
+            return None, None
+
+        half = self.window * 2 ** self.misses
+        prev_center = int(min(max(predicted + half, 1), width))
+        return prev_center, int(2 * half)
+
+    def two_sided_window(self, width):
+        """
+        Returns the (prev_center, search_window) arguments of find_driving_path_two_sided for the next frame.
+
+        Both are None without a track, which searches both sides up to the image borders.
+        """
+        predicted = self.predict()
+        if predicted is None:
+            return None, None
+
+        half = self.window * 2 ** self.misses
+        prev_center = int(min(max(predicted + self.lane_width / 2, 1), width - 1))
+        distance = self.lane_width / 2
+        return prev_center, (int(max(distance - half, 0)), int(distance + half))
+
+    def update(self, marking_x):
+        """Updates the filter with a measured marking position, or a miss if it is None."""
+        if marking_x is None:
+            self.misses += 1
+            if self.misses > self.max_misses:
+                self.reset()
+            return
+
+        if not self.tracking:
+            self.marking_x = float(marking_x)
+            self.velocity = 0.0
+        else:
+            predicted = self.predict()
+            residual = marking_x - predicted
+            self.marking_x = predicted + self.alpha * residual
+            self.velocity += self.beta * residual
+        self.misses = 0
+
+    def update_width(self, measured_width):
+        """Moves the lane width towards a measured width between both markings."""
+        if measured_width is not None:
+            self.lane_width += self.width_alpha * (measured_width - self.lane_width)
+            self.width_measurements += 1
+
+    def find_driving_path(self, image, mask, **kwargs):
+        """
+        Runs find_driving_path within the predicted search window and updates the track.
+
+        Takes the same keyword arguments as lane_detection_utils.find_driving_path except
+        prev_center and search_width. The returned offset and lane center are the filtered ones.
+        A lane_width argument only sets the estimate until the first width is measured.
+        """
+        lane_width = kwargs.pop('lane_width', None)
+        if lane_width is not None and self.width_measurements == 0:
+            self.lane_width = lane_width
+        if self.two_sided:
+            return self._find_driving_path_two_sided(image, mask, **kwargs)
+
+        prev_center, search_width = self.search_window(mask.shape[1])
+
+        success, offset, overlay, stats = find_driving_path(
+            image, mask, lane_width=self.lane_width, prev_center=prev_center, search_width=search_width, **kwargs
+        )
+        self.update(stats['marking_x'] if success else None)
+
+        if success:
+            cx = mask.shape[1] // 2
+            stats['lane_center'] = int(self.lane_center)
+            stats['offset'] = offset = int(self.lane_center - cx)
+
+        stats['search_width'] = search_width
+        return success, offset, overlay, stats
+
+    def _find_driving_path_two_sided(self, image, mask, **kwargs):
+        width = mask.shape[1]
+        prev_center, search_window = self.two_sided_window(width)
+
+        success, offset, overlay, stats = find_driving_path_two_sided(
+            image, mask, lane_width=int(self.lane_width), prev_center=prev_center, search_window=search_window, **kwargs
+        )
+        self.update_width(stats['measured_width'])
+
+        # The track follows the measured lane center, shifted to where the left marking would be
+        self.update(stats['lane_center'] - self.lane_width / 2 if success else None)
+
+        if success:
+            cx = width // 2
+            stats['lane_center'] = int(self.lane_center)
+            stats['offset'] = offset = int(self.lane_center - cx)
+
+        stats['lane_width'] = self.lane_width
+        stats['search_width'] = None if search_window is None else search_window[1] - search_window[0]
+        return success, offset, overlay, stats
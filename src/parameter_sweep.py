@@ -0,0 +1,312 @@
+"""
+Parameter sweep of the HSV thresholds, detector parameters and controller gains.
+
+Scores a grid or a random sample of parameter sets against recorded frames:
+    mask:       lower_white = [0, 0, value_min], upper_white = [255, saturation_max, 255]
+    detector:   min_pixels, ymin (the stripe is ymin:ymin + stripe_height) and lane_width
+    controller: threshold, kp and tmax of publish_control_commands
+
+Work is shared along this hierarchy. Every frame is resized and converted to HSV once,
+every mask is computed once per threshold set and reused by all detector parameters,
+and the controller gains are applied to the resulting offsets in one vectorized step.
+The frames are split into contiguous ranges that are processed in parallel.
+
+Each configuration is reported with its success rate, offset stability (mean absolute
+frame-to-frame change of the offset), steering stability (mean absolute change and
+sign flips of the setpoint), the fraction of the frame its mask covers and the
+detection cost in ms per frame.
+
+Usage:
+    python parameter_sweep.py --archive ../data/session          # recorded with SessionRecorder
+    python parameter_sweep.py --images ../data --random 200      # screenshots, random search
+    python parameter_sweep.py --synthetic 100 --season winter    # synthetic frames
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool, cpu_count
+
+import cv2 as cv
+import numpy as np
+
+from actuator import steering_setpoint
+from frame_sources import ReplayFrameSource
+from lane_detection_utils import remove_small_components, find_driving_path
+from synthetic_frames import make_road_frames
+
+MASK_KEYS = ('value_min', 'saturation_max')
+DETECTOR_KEYS = ('min_pixels', 'ymin', 'stripe_height', 'lane_width')
+CONTROLLER_KEYS = ('threshold', 'kp', 'tmax')
+
+# Markings cover a few percent of a frame, masks above this fraction are flooded
+MAX_MASK_FILL = 0.15
+
+DEFAULT_SPACE = {
+    'value_min': [150, 170, 190, 210],
+    'saturation_max': [20, 30, 45],
+    'min_pixels': [40, 60, 80],
+    'ymin': [230, 250, 270],
+    'stripe_height': [15],
+    'lane_width': [330, 370, 410],
+    'threshold': [10, 20, 30],
+    'kp': [2e-3, 4e-3, 6e-3],
+    'tmax': [0.2, 0.3],
+}
+
+
+def grid(space):
+    """Returns every combination of the values in space as a list of parameter dicts."""
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+
+
+def random_search(space, n, seed=0):
+    """Returns n parameter dicts with every value drawn independently from space."""
+    rng = np.random.default_rng(seed)
+    return [{k: values[rng.integers(len(values))] for k, values in space.items()} for _ in range(n)]
+
+
+def _key(params, keys):
+    return tuple(params[k] for k in keys)
+
+
+def load_frames(spec, start, stop):
+    """
+    Loads frames start:stop of a frame specification.
+
+    Args:
+    spec (dict): {'archive': path}, {'images': [paths]} or {'synthetic': n, 'seed': seed, 'kwargs': {...}}.
+    start (int): First frame.
+    stop (int): End of the range (exclusive).
+
+    Returns:
+    list: BGR uint8 images, unreadable images are skipped.
+    """
+    if 'archive' in spec:
+        source = ReplayFrameSource(spec['archive'])
+        frames = [source.frame(i) for i in range(start, stop)]
+        source.close()
+        return frames
+    if 'images' in spec:
+        frames = [cv.imread(path, cv.IMREAD_COLOR) for path in spec['images'][start:stop]]
+        return [frame for frame in frames if frame is not None]
+    return make_road_frames(spec['synthetic'], seed=spec.get('seed', 0), **spec.get('kwargs', {}))[start:stop]
+
+
+def frame_count(spec):
+    if 'archive' in spec:
+        source = ReplayFrameSource(spec['archive'])
+        n = len(source)
+        source.close()
+        return n
+    if 'images' in spec:
+        return len(spec['images'])
+    return spec['synthetic']
+
+
+def evaluate_range(spec, start, stop, mask_sets, detector_sets, size=(640, 360)):
+    """
+    Runs all mask and detector parameter sets on frames start:stop.
+
+    Returns:
+    tuple: (offsets, mask_seconds, detector_seconds, mask_fill). offsets has the shape
+        (len(mask_sets), len(detector_sets), n_frames) and is NaN where no path was found,
+        the times are summed over the frames per mask set and per (mask, detector) pair,
+        mask_fill is the fraction of set mask pixels summed over the frames per mask set.
+    """
+    frames = load_frames(spec, start, stop)
+    offsets = np.full((len(mask_sets), len(detector_sets), len(frames)), np.nan)
+    mask_seconds = np.zeros(len(mask_sets))
+    detector_seconds = np.zeros((len(mask_sets), len(detector_sets)))
+    mask_fill = np.zeros(len(mask_sets))
+
+    for f, frame in enumerate(frames):
+        # Shared by all parameter sets
+        resized = frame if (frame.shape[1], frame.shape[0]) == size else cv.resize(frame, size, interpolation=cv.INTER_LINEAR)
+        hsv = cv.cvtColor(resized, cv.COLOR_BGR2HSV)
+
+        for m, (value_min, saturation_max) in enumerate(mask_sets):
+            t_start = time.perf_counter()
+            mask = cv.inRange(hsv, np.array([0, 0, value_min], np.uint8), np.array([255, saturation_max, 255], np.uint8))
+            mask = remove_small_components(mask) // 255
+            mask_seconds[m] += time.perf_counter() - t_start
+            mask_fill[m] += cv.countNonZero(mask) / mask.size
+
+            for d, (min_pixels, ymin, stripe_height, lane_width) in enumerate(detector_sets):
+                t_start = time.perf_counter()
+                success, offset, _, _ = find_driving_path(resized, mask, ymin, ymin + stripe_height, min_pixels,
+                                                          lane_width, stats={}, draw=False)
+                detector_seconds[m, d] += time.perf_counter() - t_start
+                if success:
+                    offsets[m, d, f] = offset
+
+    return offsets, mask_seconds, detector_seconds, mask_fill
+
+
+def _evaluate_range(args):
+    return evaluate_range(*args)
+
+
+def score(offsets, controller_sets):
+    """
+    Computes the stability metrics of one offset sequence for all controller parameter sets.
+
+    Args:
+    offsets (np.array): Offset per frame, NaN where no path was found.
+    controller_sets (list): (threshold, kp, tmax) tuples.
+
+    Returns:
+    list: One dict of metrics per controller parameter set.
+    """
+    found = ~np.isnan(offsets)
+    valid = offsets[found]
+    success_rate = float(found.mean()) if len(offsets) else 0.0
+    offset_jitter = float(np.abs(np.diff(valid)).mean()) if len(valid) > 1 else None
+    mean_abs_offset = float(np.abs(valid).mean()) if len(valid) else None
+
+    thresholds, kps, tmaxs = (np.array(v, dtype=np.float64)[:, None] for v in zip(*controller_sets))
+    # (n_controller, n_valid) setpoints in one call
+    setpoints = steering_setpoint(valid[None, :], thresholds, kps, tmaxs) if len(valid) else np.zeros((len(controller_sets), 0))
+    if setpoints.shape[1] > 1:
+        steer_jitter = np.abs(np.diff(setpoints, axis=1)).mean(axis=1)
+        signs = np.sign(setpoints)
+        flips = (signs[:, 1:] * signs[:, :-1] < 0).sum(axis=1) / (setpoints.shape[1] - 1)
+    else:
+        steer_jitter = flips = np.full(len(controller_sets), np.nan)
+
+    return [{
+        'success_rate': success_rate,
+        'mean_abs_offset': mean_abs_offset,
+        'offset_jitter': offset_jitter,
+        'steer_jitter': float(steer_jitter[c]),
+        'sign_flips': float(flips[c]),
+    } for c in range(len(controller_sets))]
+
+
+def sweep(spec, configs, workers=None, size=(640, 360), chunk_size=None):
+    """
+    Scores parameter configurations against the frames of spec.
+
+    Args:
+    spec (dict): Frame specification, see load_frames.
+    configs (list): Parameter dicts with all MASK_KEYS, DETECTOR_KEYS and CONTROLLER_KEYS.
+    workers (int): Worker processes, all cores if None. 1 runs in this process.
+    size (tuple): Working resolution, format (width, height).
+    chunk_size (int): Frames per task, by default the frames are split evenly across the workers.
+
+    Returns:
+    list: The configs with their metrics and cost_ms added, best first.
+    """
+    workers = workers or cpu_count()
+    mask_sets = sorted({_key(c, MASK_KEYS) for c in configs})
+    detector_sets = sorted({_key(c, DETECTOR_KEYS) for c in configs})
+    controller_sets = sorted({_key(c, CONTROLLER_KEYS) for c in configs})
+
+    n_frames = frame_count(spec)
+    chunk_size = chunk_size or max(1, -(-n_frames // workers))
+    tasks = [(spec, start, min(start + chunk_size, n_frames), mask_sets, detector_sets, size)
+             for start in range(0, n_frames, chunk_size)]
+
+    if workers == 1:
+        parts = [evaluate_range(*task) for task in tasks]
+    else:
+        with Pool(workers) as pool:
+            parts = pool.map(_evaluate_range, tasks)
+
+    # Chunks are contiguous and in order, so the concatenated offsets keep the frame sequence
+    offsets = np.concatenate([p[0] for p in parts], axis=2)
+    n_loaded = max(offsets.shape[2], 1)
+    mask_ms = 1e3 * sum(p[1] for p in parts) / n_loaded
+    detector_ms = 1e3 * sum(p[2] for p in parts) / n_loaded
+    mask_fill = sum(p[3] for p in parts) / n_loaded
+
+    mask_index = {k: i for i, k in enumerate(mask_sets)}
+    detector_index = {k: i for i, k in enumerate(detector_sets)}
+    controller_index = {k: i for i, k in enumerate(controller_sets)}
+
+    scores = {}
+    results = []
+    for config in configs:
+        m = mask_index[_key(config, MASK_KEYS)]
+        d = detector_index[_key(config, DETECTOR_KEYS)]
+        if (m, d) not in scores:
+            scores[(m, d)] = score(offsets[m, d], controller_sets)
+        metrics = scores[(m, d)][controller_index[_key(config, CONTROLLER_KEYS)]]
+        results.append({**config, **metrics, 'mask_fill': float(mask_fill[m]), 'cost_ms': float(mask_ms[m] + detector_ms[m, d])})
+
+    results.sort(key=rank)
+    return results
+
+
+def rank(result):
+    """
+    Sort key: highest success rate first, then the smoothest offsets and steering.
+
+    Thresholds whose masks cover more than MAX_MASK_FILL of the frame select the road or
+    the sky rather than the markings, their "detections" are meaningless and go last.
+    """
+    jitter = result['offset_jitter'] if result['offset_jitter'] is not None else np.inf
+    flooded = result['mask_fill'] > MAX_MASK_FILL
+    return (flooded, -round(result['success_rate'], 2), round(jitter, 1), result['steer_jitter'], result['cost_ms'])
+
+
+def format_results(results, top=10):
+    keys = MASK_KEYS + DETECTOR_KEYS + CONTROLLER_KEYS
+    header = "".join(f"{k[:10]:>11}" for k in keys) + f"{'success':>9}{'jitter':>8}{'steer':>8}{'flips':>7}{'fill':>7}{'ms':>7}"
+    lines = [header]
+    for r in results[:top]:
+        jitter = r['offset_jitter'] if r['offset_jitter'] is not None else float('nan')
+        lines.append("".join(f"{r[k]:>11g}" for k in keys)
+                     + f"{r['success_rate']:>9.2f}{jitter:>8.1f}{r['steer_jitter']:>8.3f}{r['sign_flips']:>7.2f}{r['mask_fill']:>7.2f}{r['cost_ms']:>7.2f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score lane detection and controller parameters on recorded frames.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--archive', help="Frame archive recorded with SessionRecorder, path without suffix.")
+    source.add_argument('--images', help="Directory with PNG screenshots.")
+    source.add_argument('--synthetic', type=int, help="Number of synthetic frames.")
+    parser.add_argument('--season', help="Season of the synthetic frames, all seasons if not set.")
+    parser.add_argument('--weather', help="Weather of the synthetic frames, all weathers if not set.")
+    parser.add_argument('--space', help="JSON file with a parameter space like DEFAULT_SPACE, missing keys use the defaults.")
+    parser.add_argument('--random', type=int, help="Score this many random configurations instead of the full grid.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the random search and the synthetic frames.")
+    parser.add_argument('--workers', type=int, help="Worker processes, defaults to the number of cores.")
+    parser.add_argument('--top', type=int, default=10, help="Number of configurations to print.")
+    parser.add_argument('--output', help="Write all scored configurations to this JSON file.")
+    args = parser.parse_args(argv)
+
+    if args.archive:
+        spec = {'archive': args.archive}
+    elif args.images:
+        names = sorted(n for n in os.listdir(args.images) if n.lower().endswith('.png'))
+        spec = {'images': [os.path.join(args.images, n) for n in names]}
+    else:
+        kwargs = {k: v for k, v in (('season', args.season), ('weather', args.weather)) if v}
+        spec = {'synthetic': args.synthetic, 'seed': args.seed, 'kwargs': kwargs}
+
+    space = dict(DEFAULT_SPACE)
+    if args.space:
+        with open(args.space, 'r') as file:
+            space.update(json.load(file))
+
+    configs = random_search(space, args.random, args.seed) if args.random else grid(space)
+    print(f"Scoring {len(configs)} configurations on {frame_count(spec)} frames")
+
+    t_start = time.perf_counter()
+    results = sweep(spec, configs, args.workers)
+    print(f"Done in {time.perf_counter() - t_start:.1f} s\n")
+    print(format_results(results, args.top))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=4)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+import threading
+import time
+from collections import deque
+
+
+class LatestValueQueue:
+    """Bounded queue in which new items push out the oldest ones instead of blocking.
+
+    With the default maxsize of 1 this is a latest-value slot: a consumer always gets the
+    newest item and everything it did not manage to read in time is dropped.
+    """
+
+    def __init__(self, maxsize=1, max_age=None):
+        """
+        Args:
+            maxsize: Maximum number of items kept in the queue.
+            max_age: Items older than max_age seconds are discarded on get, None keeps all.
+        """
+        self._items = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self.max_age = max_age
+        self.dropped = 0
+
+    def put(self, item):
+        """Adds an item, dropping the oldest one if the queue is full."""
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append((time.perf_counter(), item))
+            self._cond.notify_all()
+
+    def get(self, timeout=None):
+        """Returns (item, age) of the oldest fresh item, or (None, None) on timeout.
+
+        Args:
+            timeout: Maximum time in seconds to wait for an item, None waits forever.
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        with self._cond:
+            while True:
+                now = time.perf_counter()
+                # Drop items that have become stale while waiting in the queue
+                while self._items and self.max_age is not None and now - self._items[0][0] > self.max_age:
+                    self._items.popleft()
+                    self.dropped += 1
+
+                if self._items:
+                    t_put, item = self._items.popleft()
+                    return item, now - t_put
+
+                remaining = None if deadline is None else deadline - now
+                if remaining is not None and remaining <= 0:
+                    return None, None
+                self._cond.wait(remaining)
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+
+class StageMetrics:
+    """Collects throughput, processing time and input queue age of a pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self.busy_time = 0.0
+            self.age_sum = 0.0
+            self.age_max = 0.0
+            self.t_start = time.perf_counter()
+
+    def record(self, duration, age=None):
+        """Records one processed item.
+
+        Args:
+            duration: Time in seconds the stage spent on the item.
+            age: Time in seconds the item waited in the input queue, if any.
+        """
+        with self._lock:
+            self.count += 1
+            self.busy_time += duration
+            if age is not None:
+                self.age_sum += age
+                self.age_max = max(self.age_max, age)
+
+    def snapshot(self):
+        """Returns a dictionary with the metrics accumulated since the last reset."""
+        with self._lock:
+            elapsed = time.perf_counter() - self.t_start
+            count = max(self.count, 1)
+            return {
+                'stage': self.name,
+                'count': self.count,
+                'fps': self.count / elapsed if elapsed > 0 else 0.0,
+                'latency_ms': 1e3 * self.busy_time / count,
+                'queue_age_ms': 1e3 * self.age_sum / count,
+                'queue_age_max_ms': 1e3 * self.age_max,
+            }
+
+
+class PipelineStage(threading.Thread):
+    """Thread that runs one stage of the capture / detect / actuate pipeline.
+
+    The stage takes items from input_queue (or runs free if there is none), calls func on
+    them and puts every result that is not None into the output queues. It only works
+    while run_event is set and stops once exit_event is set.
+    """
+
+    def __init__(self, name, func, run_event, exit_event, input_queue=None, output_queues=(), poll_interval=0.1):
+        super().__init__(name=name, daemon=True)
+        self.func = func
+        self.run_event = run_event
+        self.exit_event = exit_event
+        self.input_queue = input_queue
+        self.output_queues = list(output_queues)
+        self.poll_interval = poll_interval
+        self.metrics = StageMetrics(name)
+
+    def run(self):
+        while not self.exit_event.is_set():
+            if not self.run_event.wait(self.poll_interval):
+                continue
+
+            age = None
+            if self.input_queue is None:
+                args = ()
+            else:
+                item, age = self.input_queue.get(timeout=self.poll_interval)
+                if item is None:
+                    continue
+                args = (item,)
+
+            t_start = time.perf_counter()
+            try:
+                result = self.func(*args)
+            except Exception as e:
+                print(f"An unexpected error occurred in pipeline stage {self.name}: {e}")
+                continue
+            self.metrics.record(time.perf_counter() - t_start, age)
+
+            if result is not None:
+                for queue in self.output_queues:
+                    queue.put(result)
+
+    def stats(self):
+        stats = self.metrics.snapshot()
+        if self.input_queue is not None:
+            stats['dropped'] = self.input_queue.dropped
+        return stats
+
+
+class RateScheduler:
+    """Calls a tick function at a fixed rate against monotonic deadlines.
+
+    The k-th tick is due at t_start + k * period. The time by which a tick starts after
+    its deadline is its jitter. A tick that is still running at the next deadline is an
+    overrun; the deadlines it ran over are skipped rather than caught up back to back.
+    The tick function is called with late=True if it starts more than late_after seconds
+    after its deadline or follows an overrun, so it can shed optional work.
+
+    While run_event is cleared the scheduler blocks on it, resumes as soon as it is set
+    and restarts the deadlines from then. It stops once exit_event is set.
+    """
+
+    def __init__(self, rate, run_event, exit_event, name='control', late_after=None, poll_interval=0.1, window=1000):
+        """
+        Args:
+            rate: Ticks per second.
+            run_event: Ticks only run while this event is set.
+            exit_event: The scheduler returns once this event is set.
+            name: Name used in the statistics.
+            late_after: Jitter in seconds above which a tick counts as late, half a period if None.
+            poll_interval: Interval in seconds at which a paused scheduler checks exit_event.
+            window: Number of recent ticks the jitter percentiles are computed from.
+        """
+        self.period = 1 / rate
+        self.run_event = run_event
+        self.exit_event = exit_event
+        self.name = name
+        self.late_after = self.period / 2 if late_after is None else late_after
+        self.poll_interval = poll_interval
+        self._jitter = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self.busy_time = 0.0
+            self.late = 0
+            self.overruns = 0
+            self.missed = 0
+            self.jitter_max = 0.0
+            self._jitter.clear()
+            self.t_start = time.perf_counter()
+
+    def run(self, tick):
+        """Runs tick(late) at the fixed rate until exit_event is set."""
+        deadline = None
+        overran = False
+        while not self.exit_event.is_set():
+            if not self.run_event.is_set():
+                deadline = None
+                self.run_event.wait(self.poll_interval)  # Returns as soon as the scheduler is resumed
+                continue
+
+            t_tick = time.perf_counter()
+            if deadline is None:
+                deadline = t_tick
+            jitter = t_tick - deadline
+            late = overran or jitter > self.late_after
+
+            try:
+                tick(late=late)
+            except Exception as e:
+                print(f"An unexpected error occurred in the {self.name} tick: {e}")
+
+            t_end = time.perf_counter()
+            deadline += self.period
+            missed = 0
+            if t_end > deadline:
+                # Skip the deadlines the tick ran over instead of bursting through them
+                missed = int((t_end - deadline) // self.period) + 1
+                deadline += missed * self.period
+            overran = missed > 0
+            self._record(t_end - t_tick, jitter, late, missed)
+
+            self.exit_event.wait(max(deadline - time.perf_counter(), 0))
+
+    def _record(self, duration, jitter, late, missed):
+        with self._lock:
+            self.count += 1
+            self.busy_time += duration
+            self.late += late
+            self.overruns += missed > 0
+            self.missed += missed
+            self.jitter_max = max(self.jitter_max, jitter)
+            self._jitter.append(jitter)
+
+    def stats(self):
+        """Returns a dictionary with the tick rate, duration, jitter and deadline misses since the last reset."""
+        with self._lock:
+            elapsed = time.perf_counter() - self.t_start
+            count = max(self.count, 1)
+            jitter = sorted(self._jitter)
+            return {
+                'stage': self.name,
+                'count': self.count,
+                'rate': 1 / self.period,
+                'fps': self.count / elapsed if elapsed > 0 else 0.0,
+                'latency_ms': 1e3 * self.busy_time / count,
+                'jitter_ms': 1e3 * sum(jitter) / max(len(jitter), 1),
+                'jitter_p99_ms': 1e3 * jitter[int(0.99 * (len(jitter) - 1))] if jitter else 0.0,
+                'jitter_max_ms': 1e3 * self.jitter_max,
+                'late': self.late,
+                'overruns': self.overruns,
+                'missed': self.missed,
+            }
+
+
+def format_scheduler_stats(s):
+    """Formats the statistics of a RateScheduler as one line."""
+    return (
+        f"{s['stage']:>8}: {s['fps']:6.1f} / {s['rate']:.0f} Hz | tick {s['latency_ms']:7.2f} ms | "
+        f"jitter {s['jitter_ms']:5.2f} ms (p99 {s['jitter_p99_ms']:5.2f}, max {s['jitter_max_ms']:6.2f}) | "
+        f"late {s['late']} | overruns {s['overruns']} (missed {s['missed']})"
+    )
+
+
+def format_pipeline_stats(stats_list):
+    """Formats a list of stage statistics as one line per stage."""
+    return "\n".join(
+        f"{s['stage']:>8}: {s['fps']:6.1f} fps | latency {s['latency_ms']:7.1f} ms | "
+        f"queue age {s['queue_age_ms']:6.1f} ms (max {s['queue_age_max_ms']:6.1f}) | "
+        f"dropped {s.get('dropped', 0)}"
+        for s in stats_list
+    )
@@ -0,0 +1,154 @@
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from frame_sources import FrameArchiveWriter, _to_builtin
+
+ANNOTATIONS_SUFFIX = '.annotations'
+
+
+class SessionRecorder:
+    """Streams captured frames and their detection results to a frame archive.
+
+    record() only puts the frame into a bounded queue; a background thread compresses and
+    appends the frames in chunks. The queue bounds the memory in use. When it is full,
+    record() either drops the frame (default, the caller never waits) or blocks until
+    the writer has caught up, depending on block.
+
+    The recording is a regular frame archive and can be replayed with ReplayFrameSource.
+    The values passed to record() are stored under 'meta' in each index entry, together
+    with the frame id ('frame', the sequence number of a frame bus Frame). Results that
+    are only known later, such as detections, are added with annotate(frame_id, ...) and
+    stored as separate records in a sidecar file, see read_annotations. Annotations are
+    never dropped, so they are also kept for frames the detection saw but the recorder did
+    not, and the other way round.
+    """
+
+    def __init__(self, path, compression=None, chunk_size=32, max_pending=64, block=False, append=False):
+        """
+        Args:
+            path: Archive path without suffix.
+            compression: zlib level (0-9), None stores raw frames for zero-copy replay.
+            chunk_size: Number of frames written before the files are flushed.
+            max_pending: Maximum number of frames waiting to be written.
+            block: If True, record() waits for free space instead of dropping the frame.
+            append: Append to an existing archive instead of replacing it.
+        """
+        self.writer = FrameArchiveWriter(path, append)
+        self.compression = compression
+        self.chunk_size = chunk_size
+        self.block = block
+
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.dropped = 0
+        self.expired = 0
+        self.written = 0
+        self.annotated = 0
+
+        self.annotations_file = open(path + ANNOTATIONS_SUFFIX, 'a' if append else 'w')
+        self._annotations = deque()
+
+        self._thread = threading.Thread(target=self._write_frames, daemon=True)
+        self._thread.start()
+
+    def record(self, image, copy=True, **meta):
+        """Queues a frame for writing.
+
+        Args:
+            image: BGR frame to store, or a frame_bus Frame. A Frame is copied out of its
+                slot and stored with its capture timestamp and its sequence number as frame id.
+            copy: Copy the frame first. Only pass False if the caller never reuses the array.
+            meta: Values stored with the frame, e.g. success, offset, lane_center, steering.
+
+        Returns:
+            bool: False if the frame was dropped because the writer is behind or its
+            frame bus slot was reused before it was copied.
+        """
+        if hasattr(image, 'valid'):
+            frame = image
+            image = frame.copy()
+            if not frame.valid():
+                self.expired += 1
+                return False
+            item = (image, frame.timestamp, dict(meta, frame=frame.seq))
+        else:
+            item = (np.array(image) if copy else image, time.time(), meta)
+        try:
+            self.queue.put(item, block=self.block)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def annotate(self, frame_id, **meta):
+        """Queues a record with values that belong to the recorded frame frame_id.
+
+        Args:
+            frame_id: Frame id the values belong to, see record().
+            meta: Values to store, e.g. success, offset, lane_center, steering.
+        """
+        self._annotations.append(dict(meta, frame=frame_id))
+
+    def _write_frames(self):
+        pending = 0
+        while True:
+            try:
+                item = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                item = False
+
+            if item is None or item is False or pending >= self.chunk_size:
+                # Flush the finished chunk, or whatever is there when the queue runs dry
+                if pending:
+                    self.writer.flush()
+                    pending = 0
+                self._write_annotations()
+                if item is None:  # Sentinel put by close()
+                    return
+                if item is False:
+                    continue
+
+            image, timestamp, meta = item
+            try:
+                self.writer.write(image, timestamp, self.compression, **meta)
+            except Exception as e:
+                print(f"An error occurred while recording a frame: {e}")
+                continue
+            self.written += 1
+            pending += 1
+
+    def _write_annotations(self):
+        if not self._annotations:
+            return
+        while self._annotations:
+            self.annotations_file.write(json.dumps(self._annotations.popleft(), default=_to_builtin) + "\n")
+            self.annotated += 1
+        self.annotations_file.flush()
+
+    def stats(self):
+        return {'written': self.written, 'dropped': self.dropped, 'expired': self.expired, 'pending': self.queue.qsize(), 'annotated': self.annotated}
+
+    def close(self):
+        """Writes all queued frames and annotations and closes the archive."""
+        self.queue.put(None)
+        self._thread.join()
+        self.writer.close()
+        self.annotations_file.close()
+
+
+def read_annotations(path):
+    """Reads the annotations of a recording as a dictionary from frame id to the merged values."""
+    annotations = {}
+    try:
+        with open(path + ANNOTATIONS_SUFFIX, 'r') as file:
+            for line in file:
+                if line.strip():
+                    record = json.loads(line)
+                    annotations.setdefault(record.pop('frame'), {}).update(record)
+    except FileNotFoundError:
+        pass  # Recorded before annotations existed, or by FrameArchiveWriter alone
+    return annotations
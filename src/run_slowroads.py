@@ -1,61 +1,154 @@
 import os
 import time
 from slowroads_sim import SlowRoadsSimulator as BaseSlowRoadsSimulator
-from lane_detection_utils import preprocess_image, find_driving_path
-import matplotlib.pyplot as plt
-import numpy as np
-from slowroads_utils import steer_left, steer_right
-import cv2 as cv
+from lane_detection_utils import preprocess_image, OverlayRenderer
+from lane_tracker import LaneTracker
+from actuator import steering_setpoint
+from pipeline import LatestValueQueue, StageMetrics, format_pipeline_stats, format_scheduler_stats
+import instrumentation
 
 class SlowRoadsSimulator(BaseSlowRoadsSimulator):
     def __init__(self):
         super().__init__()  # Initialize the base class   
 
-    def publish_control_commands(self, offset, threshold = 20, kp = 4e-3, tmax = 0.3):
-        
-        # If the offset is within the threshold, no steering adjustment is needed
-        if abs(offset) < threshold:
-            return
-        
-        t_down = min(abs(offset) * kp, tmax)
-        t_up = 0.05
+        # Latest-value slots between the pipeline stages, stale frames are dropped
+        self.frame_queue = LatestValueQueue(max_age=0.5)
+        self.command_queue = LatestValueQueue(max_age=0.5)
 
-        if offset > 0:
-            self.steer_right(t_down, t_up) # Steer right if offset is positive
-        elif offset < 0:
-            self.steer_left(t_down, t_up) # Steer left if offset is negative
+        self.actuate_metrics = StageMetrics('actuate')
 
+        # What the control tick does when it runs late or detection falls behind, see publish_commands.
+        # late_policy 'apply' still applies the newest detection, 'skip' lets a late tick only advance
+        # the actuator (at most max_late_ticks in a row, see control_tick).
+        # stale_policy 'reuse' keeps steering on the last offset once detection is stale_after seconds old, 'release' straightens up.
+        self.late_policy = 'apply'
+        self.stale_policy = 'reuse'
+        self.stale_after = 0.5
+        self.t_command = None
+        self.skipped_ticks = 0
+        self.stale_ticks = 0
 
-    def run(self):
-        self.autodrive_off()  # Turn off autodrive
+        # Keeps the lane estimate between frames, only used by the detect stage
+        self.lane_tracker = LaneTracker(two_sided=True)
+
+        # Overlays are deferred and only rendered by the display, into reused buffers
+        self.overlay_renderer = OverlayRenderer()
 
         # Set up a success list to keep track of successful path findings.
         # If there are N consecutive failures, turn autodrive back on.
-        N = 3
-        success_list = [True] * N
+        self.N = 3
+        self.success_list = [True] * self.N
 
-        try:
-            while not self.exit_event.is_set():
-                time.sleep(1)
-                continue
-                success, image = self.grab_screenshot()
-
-                if not success:  # If screenshot is not successful, skip to the next iteration
-                    continue
+    def publish_control_commands(self, offset, threshold = 20, kp = 4e-3, tmax = 0.3):
+        
+        # No steering within the threshold, otherwise a duty cycle that grows with the offset.
+        # Steer right if offset is positive, left if it is negative
+        self.set_steering(steering_setpoint(offset, threshold, kp, tmax))
+
+    def capture(self):
+        """Capture stage: grabs the next frame from the browser and publishes it on the frame bus."""
+        success, image = self.grab_screenshot()
+        if self.frame_source.finished:  # End of a replayed session
+            self.exit_event.set()
+        if not success:
+            return None
+        frame = self.publish_frame(image)
+        if self.recorder is not None:
+            # Recorded here rather than after detection, so frames the detect stage drops are kept too
+            self.recorder.record(frame)
+        return frame
+
+    def detect(self, frame):
+        """Detect stage: finds the driving path in a frame read zero-copy from the frame bus."""
+        image = frame.image
+        mask, resized_image = preprocess_image(image)
+        success, offset, overlay, stats = self.lane_tracker.find_driving_path(resized_image, mask, min_pixels = 60, draw = self.overlay_renderer)
+
+        if not frame.valid():
+            return None  # The capture reused the slot while the frame was processed
+
+        # Extract relevant statistics for plotting
+        stats_dict = {k: stats[k] for k in ['offset', 'lane_center']}
+
+        if success:
+            # The overlay is drawn later from the bus slot, the display skips it if the slot was reused by then
+            overlay.source = frame
+            self.update_plot(overlay, stats_dict)
+
+        if self.recorder is not None:
+            self.recorder.annotate(frame.seq, success = success, steering = self.actuator.setpoint, **stats_dict)
+
+        return success, offset
+
+    def publish_commands(self, late = False):
+        """Actuate stage: called by the control scheduler once per tick, steers on the latest detection."""
+        if self.resting:
+            pass  # Autodrive steers until the rest is over
+        elif late and self.late_policy == 'skip':
+            # Catch up: the newest detection stays queued for the next tick
+            self.skipped_ticks += 1
+        else:
+            command, age = self.command_queue.get(timeout=0)
+            if command is not None:
+                self.apply_command(command, age)
+                self.t_command = time.perf_counter()
+            elif self.t_command is not None and time.perf_counter() - self.t_command > self.stale_after:
+                self.stale_ticks += 1
+                if self.stale_policy == 'release':
+                    self.release_steering()
+                # 'reuse' keeps the setpoint of the last offset
+
+        # Advance the actuator
+        super().publish_commands(late)
+
+    def apply_command(self, command, age):
+        """Updates the steering setpoint from a (success, offset) detection result."""
+        t_start = time.perf_counter()
+        success, offset = command
+        self.success_list = (self.success_list + [success])[-self.N:]
+
+        if success:
+            self.publish_control_commands(offset)
+        elif not True in self.success_list: # If there are N consecutive failures
+            self.release_steering()
+            self.rest_vehicle() # Rest the vehicle as a fallback mechanism
+
+        self.actuate_metrics.record(time.perf_counter() - t_start, age)
+
+    def pipeline_stats(self):
+        stats = self.actuate_metrics.snapshot()
+        stats['dropped'] = self.command_queue.dropped
+        stats['skipped'] = self.skipped_ticks
+        stats['stale'] = self.stale_ticks
+        stats_list = super().pipeline_stats() + [stats]
+        if self.display is not None:
+            stats_list.append(self.display.stats())
+        return stats_list
+
+    def run(self, stats_interval = 5):
+        self.autodrive_off()  # Turn off autodrive
+        if self.display is None:
+            self.init_display()
 
-                mask, resized_image = preprocess_image(image)
-                success, offset, overlay, stats = find_driving_path(resized_image, mask, min_pixels = 60)
-                success_list.append(success)
+        # Capture and detection run in their own stage threads, actuation in the control thread
+        self.init_pipeline_stage('capture', self.capture, output_queues = [self.frame_queue])
+        self.init_pipeline_stage('detect', self.detect, self.frame_queue, [self.command_queue])
+        self.init_control_thread()
+        self.run_control_thread()
 
-                # Extract relevant statistics for plotting
-                stats_dict = {k: stats[k] for k in ['offset', 'lane_center']}
+        t_stats = time.perf_counter()
 
-                if success:
-                    self.update_plot(overlay, stats_dict)
-                    self.publish_control_commands(offset)
-                elif not True in success_list[-N:]: # If there are N consecutive failures
-                    self.rest_vehicle() # Rest the vehicle as a fallback mechanism
+        try:
+            while not self.exit_event.is_set():
+                # The display draws on its own thread, unless its backend needs the main thread
+                self.poll_display(timeout = 0.1)
 
+                if time.perf_counter() - t_stats > stats_interval:
+                    print(format_pipeline_stats(self.pipeline_stats()))
+                    print(format_scheduler_stats(self.control_stats()))
+                    if instrumentation.is_enabled():
+                        print(instrumentation.format_snapshot())
+                    t_stats = time.perf_counter()
 
         finally:
             self.__clear__()
@@ -82,8 +175,30 @@ if __name__ == "__main__":
     prefix = f"{season}_{weather}"
     sim.add_key_action('g', lambda: sim.save_screenshot(data_dir, prefix))
 
-    # Load local storage
-    sim.open_brwoser(local_storage_file, window_size)
+    # Collect per-stage timings, summarized in data/timings.json
+    sim.init_instrumentation(os.path.join(data_dir, 'timings.json'))
+
+    # Set to a recorded frame archive (path without suffix) to run without a browser
+    replay_file = None
+
+    # Set to True to drive a simulated vehicle without a browser
+    synthetic = False
+
+    # Set to record every frame with its detection results, e.g. os.path.join(data_dir, prefix)
+    record_file = None
+    if record_file is not None:
+        sim.init_recorder(record_file, compression=1)
+
+    if synthetic:
+        sim.open_synthetic(season=season, weather=weather, time_scale=1.0)
+    elif replay_file is None:
+        # Load local storage
+        sim.open_brwoser(local_storage_file, window_size, capture='screencast', capture_options={'quality': 70}, decode_size=(640, 360))
+    else:
+        sim.open_replay(replay_file, realtime=True)
+
+    # Overlay display: 'opencv', 'matplotlib' (blitting, set process=True to draw in its own process) or 'null' for headless runs
+    sim.init_display('opencv', max_fps=20)
 
     sim.run()
 
@@ -0,0 +1,392 @@
+"""
+Collects driving data for many scenes in parallel, one SlowRoadsSimulator per process.
+
+Every job is one scene (season, weather, topography) of the grid that run_slowroads.py
+covers by hand. The orchestrator hands the jobs out to worker processes, one at a time
+over a pipe per worker, so stopping a worker cannot leave a lock shared with the others
+held. Each worker opens its own browser with a private copy of the local storage file
+written by setup_scene, switches it to the scene of every following job with
+switch_scene, and records one frame archive <output>/<season>_<weather>_<topography> per job. Workers
+drive with autodrive on and record every frame with the find_driving_path results.
+
+The orchestrator checks the health of every worker: a worker that exits, raises or
+reports no progress for stall_timeout seconds is stopped and replaced, and its job is
+queued again up to max_retries times. Throughput is printed per worker and in total.
+
+Backends:
+    browser     slowroads.io in Chrome
+    stand_in    the local stand_in/slowroads.html page in Chrome, no network needed
+    synthetic   synthetic_drive.SyntheticDrive, no browser at all
+
+Usage:
+    python scene_farm.py --backend synthetic --frames 300
+    python scene_farm.py --workers 4 --frames 2000 --seasons summer winter --weathers sun night
+"""
+import argparse
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+from collections import deque
+from multiprocessing import Pipe, Process, cpu_count
+from multiprocessing.connection import wait
+
+from lane_detection_utils import preprocess_image, find_driving_path
+from slowroads_utils import stand_in_url
+
+SEASONS = ["summer", "autumn", "spring", "winter"]
+WEATHERS = ["sunrise", "sun", "cloudy", "sunset", "night"]
+TOPOGRAPHIES = ["straight", "casual", "easy", "normal", "hard"]
+
+src_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(src_dir)
+DEFAULT_STORAGE = os.path.join(project_dir, 'config', 'slowroads_storage.json')
+
+# The stand-in page reads the scene colors every frame, it needs no reload to switch them
+STAND_IN_LIVE_KEYS = ('config-scene-skin', 'config-scene-weather-index')
+
+
+def scene_jobs(seasons=SEASONS, weathers=WEATHERS, topographies=("normal",)):
+    """Returns one job dict per scene of the grid."""
+    return [{'season': s, 'weather': w, 'topography': t} for s, w, t in itertools.product(seasons, weathers, topographies)]
+
+
+def job_name(job):
+    return f"{job['season']}_{job['weather']}_{job['topography']}"
+
+
+def open_scene(sim, job, options, storage_dir):
+    """Opens the backend of a worker's simulator with the scene of job."""
+    backend = options['backend']
+    if backend == 'synthetic':
+        sim.open_synthetic(options['size'], season=job['season'], weather=job['weather'], topography=job['topography'])
+        return
+
+    # Every worker writes its own copy of the local storage, the shared file stays untouched
+    storage_file = os.path.join(storage_dir, 'slowroads_storage.json')
+    shutil.copyfile(options['storage'], storage_file)
+    sim.setup_scene(storage_file, job['topography'], job['season'], job['weather'])
+
+    url = stand_in_url() if backend == 'stand_in' else None
+    sim.open_brwoser(storage_file, options['size'], url, capture=options['capture'], decode_size=(640, 360))
+
+
+def run_job(sim, job, options, report):
+    """Drives one scene with autodrive and records options['frames'] frames. Returns the job stats."""
+    sim.init_recorder(os.path.join(options['output'], job_name(job)), compression=1)
+    sim.set_speed(options['speed'])
+    sim.autodrive_on()
+
+    frames = successes = 0
+    t_start = time.perf_counter()
+    while frames < options['frames']:
+        success, image = sim.grab_screenshot()
+        if not success:
+            continue
+
+        mask, resized_image = preprocess_image(image)
+        found, offset, _, stats = find_driving_path(resized_image, mask, min_pixels=60, draw=False)
+        sim.recorder.record(image, success=bool(found), offset=offset, lane_center=stats['lane_center'])
+
+        frames += 1
+        successes += bool(found)
+        report(frames)
+
+        if options['interval']:
+            time.sleep(options['interval'])
+
+    sim.autodrive_off()
+    sim.recorder.close()
+    sim.recorder = None
+    return {'frames': frames, 'success_rate': successes / max(frames, 1), 'seconds': time.perf_counter() - t_start}
+
+
+def farm_worker(worker_id, conn, options):
+    """
+    Worker process: runs the jobs received over conn until it receives None.
+
+    The browser is opened for the first job and kept for the following ones, which only
+    switch the scene. After an error the simulator is closed and the next job starts fresh.
+
+    Sends ('start', id, job, None), ('progress', id, job, frames), ('done', id, job, stats)
+    and ('error', id, job, traceback) events back over conn. Progress is sent at most once
+    per second.
+    """
+    from slowroads_sim import SlowRoadsSimulator
+
+    storage_dir = tempfile.mkdtemp(prefix=f'scene_farm_{worker_id}_')
+    sim = None
+    try:
+        while True:
+            try:
+                job = conn.recv()
+            except EOFError:
+                break  # The orchestrator is gone
+            if job is None:
+                break
+
+            conn.send(('start', worker_id, job, None))
+            last_report = [0.0]
+
+            def report(frames):
+                now = time.perf_counter()
+                if now - last_report[0] >= 1.0:
+                    conn.send(('progress', worker_id, job, frames))
+                    last_report[0] = now
+
+            try:
+                if sim is None:
+                    sim = SlowRoadsSimulator()
+                    open_scene(sim, job, options, storage_dir)
+                else:
+                    sim.switch_scene(job['topography'], job['season'], job['weather'], options['live_keys'])
+                stats = run_job(sim, job, options, report)
+                conn.send(('done', worker_id, job, stats))
+            except Exception:
+                conn.send(('error', worker_id, job, traceback.format_exc()))
+                if sim is not None:
+                    sim.__clear__()
+                sim = None
+    finally:
+        if sim is not None:
+            sim.__clear__()
+        shutil.rmtree(storage_dir, ignore_errors=True)
+
+
+class WorkerHandle:
+    """Orchestrator side state of one worker process."""
+
+    def __init__(self, worker_id, process, conn):
+        self.worker_id = worker_id
+        self.process = process
+        self.conn = conn  # Jobs to the worker, events back
+        self.job = None  # Job sent to the worker and not finished yet
+        self.frames = 0  # Frames of the current job
+        self.total_frames = 0
+        self.jobs_done = 0
+        self.restarts = 0
+        self.last_progress = time.perf_counter()
+        self.t_start = time.perf_counter()
+
+
+class SceneFarm:
+    """Runs scene jobs on a pool of worker processes with health checks and restarts."""
+
+    def __init__(self, jobs, output, workers=None, backend='synthetic', frames=500, interval=0.0, speed=30,
+                 size=(640, 360), capture='screenshot', storage=DEFAULT_STORAGE, stall_timeout=60, max_retries=2,
+                 worker=farm_worker):
+        """
+        Args:
+            jobs: Scene job dicts, see scene_jobs.
+            output: Directory receiving one frame archive per job.
+            workers: Number of worker processes, all cores if None.
+            backend: 'browser', 'stand_in' or 'synthetic'.
+            frames: Frames recorded per job.
+            interval: Seconds between two recorded frames.
+            speed: Cruise speed set at the start of each job.
+            size: Browser window size, format (width, height).
+            capture: Frame capture of the browser backends, see SlowRoadsSimulator.open_brwoser.
+            storage: Local storage file the scene config of every job starts from.
+            stall_timeout: Seconds without progress after which a worker is restarted.
+            max_retries: How often a failed job is queued again.
+            worker: Target of the worker processes, called as worker(worker_id, conn, options),
+                see farm_worker.
+        """
+        self.jobs = list(jobs)
+        self.workers = workers or cpu_count()
+        self.stall_timeout = stall_timeout
+        self.max_retries = max_retries
+        self.worker = worker
+        self.options = {'backend': backend, 'frames': frames, 'interval': interval, 'speed': speed, 'size': size,
+                        'capture': capture, 'storage': storage, 'output': output,
+                        'live_keys': STAND_IN_LIVE_KEYS if backend == 'stand_in' else ()}
+        os.makedirs(output, exist_ok=True)
+
+        self.pending = deque()  # Jobs not sent to a worker yet
+        self.handles = {}
+        self.retries = {}
+        self.results = {}
+        self.failed = {}
+        self._next_id = 0
+
+    def _start_worker(self):
+        worker_id = self._next_id
+        self._next_id += 1
+        conn, child_conn = Pipe()
+        process = Process(target=self.worker, args=(worker_id, child_conn, self.options), daemon=True)
+        process.start()
+        child_conn.close()  # Only the worker keeps its end, so its exit shows up as EOF
+        self.handles[worker_id] = WorkerHandle(worker_id, process, conn)
+        return self.handles[worker_id]
+
+    def _dispatch(self):
+        """Sends the next pending job to every idle worker."""
+        for handle in self.handles.values():
+            if not self.pending:
+                return
+            if handle.job is not None or not handle.process.is_alive():
+                continue
+            job = self.pending.popleft()
+            try:
+                handle.conn.send(job)
+            except OSError:
+                self.pending.appendleft(job)  # Worker died, _check_health replaces it
+                continue
+            handle.job = job
+            handle.frames = 0
+            handle.last_progress = time.perf_counter()
+
+    def _receive(self, timeout):
+        """Handles the events of all workers that sent one within timeout seconds."""
+        conns = {handle.conn: handle for handle in self.handles.values()}
+        for conn in wait(list(conns), timeout):
+            handle = conns[conn]
+            try:
+                while conn.poll():
+                    self._handle_event(*conn.recv())
+            except (EOFError, OSError):
+                handle.process.join(1)  # Worker exited, _check_health replaces it
+
+    def _retry(self, job, reason):
+        name = job_name(job)
+        self.retries[name] = self.retries.get(name, 0) + 1
+        if self.retries[name] > self.max_retries:
+            print(f"Giving up on {name}: {reason}")
+            self.failed[name] = reason
+        else:
+            print(f"Retrying {name} ({self.retries[name]}/{self.max_retries}): {reason}")
+            self.pending.append(job)
+
+    def _handle_event(self, kind, worker_id, job, payload):
+        handle = self.handles.get(worker_id)
+        if handle is None:
+            return  # Late event of a replaced worker
+        handle.last_progress = time.perf_counter()
+
+        if kind == 'start':
+            handle.frames = 0
+        elif kind == 'progress':
+            handle.frames = payload
+        elif kind == 'done':
+            handle.total_frames += payload['frames']
+            handle.jobs_done += 1
+            handle.job = None
+            handle.frames = 0
+            self.results[job_name(job)] = payload
+        elif kind == 'error':
+            handle.job = None
+            handle.frames = 0
+            self._retry(job, payload.strip().splitlines()[-1])
+
+    def _check_health(self):
+        """Replaces workers that exited or stalled and queues their job again."""
+        now = time.perf_counter()
+        for worker_id, handle in list(self.handles.items()):
+            alive = handle.process.is_alive()
+            stalled = handle.job is not None and now - handle.last_progress > self.stall_timeout
+            if alive and not stalled:
+                continue
+
+            reason = 'stalled' if alive else f'exited with code {handle.process.exitcode}'
+            if alive:
+                # Only this worker's pipe can be left in a broken state, it is discarded
+                handle.process.terminate()
+                handle.process.join(5)
+            handle.conn.close()
+            del self.handles[worker_id]
+
+            if handle.job is not None:
+                self._retry(handle.job, f"worker {worker_id} {reason}")
+
+            replacement = self._start_worker()
+            replacement.restarts = handle.restarts + 1
+            print(f"Worker {worker_id} {reason}, started worker {replacement.worker_id}")
+
+    def finished(self):
+        return len(self.results) + len(self.failed) == len(self.jobs)
+
+    def stats(self):
+        """Returns the throughput per worker and in total."""
+        now = time.perf_counter()
+        workers = []
+        for handle in self.handles.values():
+            frames = handle.total_frames + handle.frames
+            workers.append({
+                'worker': handle.worker_id,
+                'job': job_name(handle.job) if handle.job else None,
+                'jobs_done': handle.jobs_done,
+                'frames': frames,
+                'fps': frames / max(now - handle.t_start, 1e-9),
+                'restarts': handle.restarts,
+            })
+        return {
+            'jobs_done': len(self.results),
+            'jobs_failed': len(self.failed),
+            'jobs_total': len(self.jobs),
+            'fps': sum(w['fps'] for w in workers),
+            'workers': workers,
+        }
+
+    def format_stats(self):
+        stats = self.stats()
+        lines = [f"jobs {stats['jobs_done']}/{stats['jobs_total']} done, {stats['jobs_failed']} failed, {stats['fps']:.1f} frames/s"]
+        for w in stats['workers']:
+            lines.append(f"  worker {w['worker']:<4}{w['frames']:>8} frames{w['fps']:>8.1f} fps  restarts {w['restarts']}  {w['job'] or 'idle'}")
+        return "\n".join(lines)
+
+    def run(self, stats_interval=10, poll_interval=0.5):
+        """Runs all jobs and returns (results, failed), both keyed by job name."""
+        self.pending.extend(self.jobs)
+        for _ in range(min(self.workers, len(self.jobs))):
+            self._start_worker()
+
+        t_stats = time.perf_counter()
+        try:
+            while not self.finished():
+                self._dispatch()
+                self._receive(poll_interval)
+                self._check_health()
+
+                if time.perf_counter() - t_stats > stats_interval:
+                    print(self.format_stats())
+                    t_stats = time.perf_counter()
+        finally:
+            for handle in self.handles.values():
+                try:
+                    handle.conn.send(None)
+                except OSError:
+                    pass
+            for handle in self.handles.values():
+                handle.process.join(10)
+                if handle.process.is_alive():
+                    handle.process.terminate()
+                handle.conn.close()
+
+        print(self.format_stats())
+        return self.results, self.failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record driving data for many scenes in parallel.")
+    parser.add_argument('--output', default=os.path.join(project_dir, 'data', 'farm'), help="Directory of the frame archives.")
+    parser.add_argument('--backend', default='browser', choices=['browser', 'stand_in', 'synthetic'], help="What the workers drive.")
+    parser.add_argument('--workers', type=int, help="Worker processes, defaults to the number of cores.")
+    parser.add_argument('--frames', type=int, default=500, help="Frames recorded per scene.")
+    parser.add_argument('--interval', type=float, default=0.0, help="Seconds between recorded frames.")
+    parser.add_argument('--seasons', nargs='+', default=SEASONS, help="Seasons of the scene grid.")
+    parser.add_argument('--weathers', nargs='+', default=WEATHERS, help="Weathers of the scene grid.")
+    parser.add_argument('--topographies', nargs='+', default=["normal"], help="Topographies of the scene grid.")
+    parser.add_argument('--stall-timeout', type=float, default=60, help="Seconds without progress before a worker is restarted.")
+    args = parser.parse_args(argv)
+
+    farm = SceneFarm(scene_jobs(args.seasons, args.weathers, args.topographies), args.output, args.workers,
+                     args.backend, args.frames, args.interval, stall_timeout=args.stall_timeout)
+    _, failed = farm.run()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
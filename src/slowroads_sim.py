@@ -1,9 +1,16 @@
-from slowroads_utils import update_config_file, open_browser, grab_screenshot, set_cruise_speed, autodrive_on, autodrive_off, save_screenshot, KeyListener
-import matplotlib.pyplot as plt
-from slowroads_utils import steer_left, steer_right
+from slowroads_utils import update_config_file, load_config, scene_config, switch_scene, read_local_storage, UICommandChannel, open_browser, set_cruise_speed, autodrive_on, autodrive_off, save_screenshot, KeyListener
+from slowroads_utils import steer_left, steer_right, key_down, key_up
+from actuator import SteeringActuator
+import instrumentation
+from frame_sources import DriverFrameSource, ReplayFrameSource, ScreencastFrameSource
+from recorder import SessionRecorder
+from synthetic_drive import SyntheticDrive
 import time
 import threading
 import signal
+from pipeline import PipelineStage, RateScheduler
+from display import Display
+from frame_bus import FrameBus
 
 # sim.init_control_thread()
 # sim.pause_control_thread()
@@ -12,10 +19,52 @@ import signal
 class SlowRoadsSimulator:
     def __init__(self):
 
-        self.plot_initialized = False
         self.control_initialized = False
         self.key_listener_initialized = False
         self.driver_initialized = False
+        self.pipeline_initialized = False
+
+        # Duration of the startup phases of open_brwoser
+        self.startup_timings = {}
+
+        # Where grab_screenshot reads frames from, set by open_brwoser, open_replay or open_synthetic
+        self.frame_source = None
+
+        # Shared memory ring every grabbed frame is published to once, see publish_frame
+        self.frame_bus = None
+        self.frame_bus_slots = 8
+
+        # Simulated vehicle that replaces the browser, see open_synthetic
+        self.synthetic = None
+
+        # Local storage items of the running game, kept up to date by switch_scene
+        self.local_storage = None
+
+        # Batched UI operations (cruise speed, autodrive), sent once per control tick
+        self.ui = None
+
+        # Overlay display that draws at its own rate off the hot path, see init_display
+        self.display = None
+
+        # Optional background recorder for training data, see init_recorder
+        self.recorder = None
+
+        # Pipeline stage threads, see init_pipeline_stage
+        self.stages = []
+
+        # Non-blocking steering, advanced by the control thread in publish_commands
+        self.actuator = SteeringActuator(self.key_down, self.key_up)
+
+        # Fixed-rate scheduler of the control thread, see init_control_thread
+        self.scheduler = None
+
+        # Late ticks in a row after which a tick does its full work anyway, see control_tick.
+        # Coarse OS timers can make every tick late, which must not defer the work forever.
+        self.max_late_ticks = 3
+        self.late_ticks = 0
+
+        # End of a rest started by rest_vehicle while the control thread runs, see control_tick
+        self.rest_until = None
 
         # Thread event to signal exit
         self.exit_event = threading.Event()
@@ -37,129 +86,312 @@ class SlowRoadsSimulator:
                 self.control_thread.join()  # Wait for the control thread to exit
                 print("Control thread shutdown successfully completed.")
 
-            if self.plot_initialized:
-                print("Initiating closure sequence for the plot...")
-                plt.close('all')  # This ensures that all figures are closed properly.
-                print("Plot closure completed.")
+            if self.pipeline_initialized:
+                print("Initiating shutdown of the pipeline stages...")
+                self.exit_event.set()  # Signal the stage threads to exit
+                for stage in self.stages:
+                    stage.join()
+                print("Pipeline shutdown successfully completed.")
+
+            if self.driver_initialized:
+                self.release_steering()  # Do not leave an arrow key pressed
+
+            if self.display is not None:
+                print("Initiating closure sequence for the display...")
+                self.display.close()
+                print("Display closure completed.")
 
             if self.key_listener_initialized:
                 print("Initiating shutdown of the KeyListener.")
                 self.key_listener.stop_listening()
                 print("KeyListener shutdown successfully completed.")
 
+            if self.recorder is not None:
+                print("Writing the remaining recorded frames...")
+                self.recorder.close()
+                print(f"Recording closed: {self.recorder.stats()}")
+
+            if self.frame_source is not None:
+                self.frame_source.close()
+
+            if self.frame_bus is not None:
+                self.frame_bus.close()
+
             if self.driver_initialized:
                 print("Shutting down the driver...")
                 self.driver.quit()
                 print("Driver shutdown complete. All resources have been cleaned up successfully.")
 
-    def init_control_thread(self):
+    def init_control_thread(self, rate = None):
+        """Starts the control thread, which calls publish_commands rate times per second (once per actuator tick by default)."""
         self.run_event.clear()  # Start in an paused state
+        self.scheduler = RateScheduler(rate or 1 / self.actuator.tick, self.run_event, self.exit_event)
         # Background thread to send commands periodically
         self.control_thread = threading.Thread(target=self._publish_commands)
         self.control_thread.daemon = True
         self.control_thread.start()
         self.control_initialized = True
 
+    def init_pipeline_stage(self, name, func, input_queue=None, output_queues=()):
+        """Starts a pipeline stage thread that shares run_event and exit_event with the control thread.
+
+        Args:
+            name: Name of the stage used in the statistics.
+            func: Function called with the next input item (or without arguments if there is
+                no input_queue). Results that are not None go to all output_queues.
+            input_queue: LatestValueQueue the stage reads from.
+            output_queues: LatestValueQueues the stage writes to.
+        """
+        stage = PipelineStage(name, func, self.run_event, self.exit_event, input_queue, output_queues)
+        stage.start()
+        self.stages.append(stage)
+        self.pipeline_initialized = True
+        return stage
+
+    def init_instrumentation(self, dump_path = None, interval = 5):
+        """Turns on the timing spans and optionally dumps their summary to dump_path every interval seconds."""
+        instrumentation.enable()
+        if dump_path is not None:
+            instrumentation.start_periodic_dump(dump_path, interval, self.exit_event)
+
+    def init_recorder(self, path, compression = None, **kwargs):
+        """Records every captured frame with its detection results to the frame archive at path.
+
+        See SessionRecorder for the remaining keyword arguments.
+        """
+        self.recorder = SessionRecorder(path, compression, **kwargs)
+
+    def pipeline_stats(self):
+        return [stage.stats() for stage in self.stages]
+
     def run_control_thread(self):
         self.run_event.set() # Running state
 
     def pause_control_thread(self):
         self.run_event.clear() # Paused state
+        self.release_steering()
+        if self.resting:
+            self.end_rest()  # Autodrive must not keep driving once control is paused
 
     def is_paused(self):
         return self.run_event.is_set()
     
     def _publish_commands(self):
 
-        """Thread function to send commands at fixed intervals."""
-        while not self.exit_event.is_set():
-            
-            if not self.run_event.is_set(): # Wait until run_event is set
-                time.sleep(1)
-            else:
-                self.publish_commands()
-
-    def publish_commands(self):
-        print("Publishing Control commands")
-        time.sleep(0.5)
-
-    def update_plot(self, image = None, stats_dict = None):
-
-        if not self.plot_initialized:
-            self._init_plot()
+        """Thread function to send commands at a fixed rate, paused while run_event is cleared."""
+        self.scheduler.run(self.control_tick)
 
-        if not image is None:
-            self._plot_image(image)
+    def control_tick(self, late = False):
+        """One control thread tick: publish_commands, then the pending UI operations.
 
-        if not stats_dict is None:
-            self._plot_stats(stats_dict)
-
-        plt.draw()
-        plt.pause(0.01)  # Adjust pause time as needed
+        The UI is flushed here so that subclasses overriding publish_commands cannot drop it.
+        A late tick leaves the UI operations, a browser round trip, to the next one, but
+        after max_late_ticks late ticks in a row the next one counts as on time.
+        """
+        if self.resting and time.perf_counter() >= self.rest_until:
+            self.end_rest()
+        if late and self.late_ticks < self.max_late_ticks:
+            self.late_ticks += 1
+        else:
+            late = False
+            self.late_ticks = 0
+        self.publish_commands(late)
+        if not late:
+            self.flush_ui()
+
+    def publish_commands(self, late = False):
+        """Advances the steering actuator by one scheduler tick."""
+        with instrumentation.span('actuate.update'):
+            self.actuator.update()
+
+    def control_stats(self):
+        """Returns the RateScheduler statistics of the control thread, or None if it was not started."""
+        return None if self.scheduler is None else self.scheduler.stats()
+
+    def flush_ui(self):
+        """Sends all pending UI operations in one round trip."""
+        if self.ui is not None and self.ui.pending():
+            self.ui.flush()
+
+    def submit_ui(self, *operation):
+        """Queues a UI operation for the next control tick, or sends it now if the control thread is not running."""
+        self.ui.submit(*operation)
+        if not (self.control_initialized and self.run_event.is_set()):
+            self.flush_ui()
+
+    def telemetry(self):
+        """Returns the cruise speed and autodrive state of the game, read together with the pending UI operations."""
+        if self.synthetic is not None:
+            return {'cruise_speed': self.synthetic.cruise_speed, 'autodrive': self.synthetic.autodrive, 'ui_visible': True, 'errors': []}
+        if self.ui is None:
+            return None
+        return self.ui.flush()
+
+    def set_steering(self, setpoint):
+        """Sets the steering setpoint in [-1, 1] that the control thread follows."""
+        self.actuator.set_setpoint(setpoint)
+        if self.synthetic is not None:
+            # Simulated time does not follow the wall clock the actuator's duty cycle runs on
+            self.synthetic.set_steering(self.actuator.setpoint)
+
+    def release_steering(self):
+        """Straightens the steering: clears the setpoint and releases any held arrow key."""
+        self.actuator.release()
+        if self.synthetic is not None:
+            self.synthetic.set_steering(0.0)
+
+    def init_display(self, backend = 'opencv', max_fps = 20, process = False):
+        """Starts the overlay display, see Display for the backends. backend = 'null' runs headless."""
+        self.display = Display(backend, max_fps, process).start()
 
-    def _init_plot(self):
-        plt.ion()  # Turn on interactive mode
-        _, self.ax = plt.subplots()
-        self.display = None
-        self.text_obj = None
-        self.plot_initialized = True
+    def update_plot(self, image = None, stats_dict = None):
+        """Publishes an overlay and its statistics to the display. Never blocks, the display draws at its own rate."""
+        if self.display is None:
+            self.init_display()
+        self.display.show(image, stats_dict)
 
-    def _plot_image(self, image):
-        """Update the image displayed on the Axes."""
+    def poll_display(self, timeout = 0.1):
+        """Lets a display that needs the main thread draw, call it from the main loop. Waits at most timeout seconds."""
         if self.display is None:
-            # Create the display object if it doesn't exist
-            self.display = self.ax.imshow(image)
-        else:
-            # Update the display object with the new image
-            self.display.set_data(image)
-
-    def _plot_stats(self, stats_dict):
-        """Plot statistics on the image like a legend, using a dictionary of values."""
-        # Generate the statistics text from the dictionary
-        stats_text = "\n".join(f"{key}: {value}" for key, value in stats_dict.items())
-
-        if self.text_obj is None:
-            # Create the text object if it doesn't exist
-            self.text_obj = self.ax.text(
-                0.02, 0.95, stats_text, transform=self.ax.transAxes, fontsize=12,
-                verticalalignment='top', bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5)
-            )
+            self.exit_event.wait(timeout)
         else:
-            # Update the text object content
-            self.text_obj.set_text(stats_text)
+            self.display.poll(timeout)
 
-        
-    def open_brwoser(self, local_storage_path = None, size = (640, 360)):
+    def open_brwoser(self, local_storage_path = None, size = (640, 360), url = None, capture = 'screenshot', capture_options = None, decode_size = None):
+        """Opens SlowRoads in Chrome.
+
+        capture selects how frames are grabbed: 'screenshot' polls WebDriver screenshots,
+        'screencast' receives the frames Chrome pushes through the DevTools protocol.
+        capture_options are passed on to ScreencastFrameSource, e.g. format, quality, max_size.
+        decode_size, e.g. (640, 360), decodes the frames straight to the working resolution.
+        """
         if not self.driver_initialized:
             # Open SlowRoads in Chrome Browser
-            self.driver = open_browser(local_storage_path, size)
+            self.driver = open_browser(local_storage_path, size, url, timings = self.startup_timings)
             self.driver_initialized = True
+            self.ui = UICommandChannel(self.driver)
+            if local_storage_path is not None:
+                self.local_storage = {k: str(v) for k, v in load_config(local_storage_path).items()}
+
+            if capture == 'screencast':
+                self.frame_source = ScreencastFrameSource(self.driver, decode_size = decode_size, **(capture_options or {}))
+            elif capture == 'screenshot':
+                self.frame_source = DriverFrameSource(self.driver, decode_size)
+            else:
+                raise ValueError("Invalid capture. Select between ['screenshot', 'screencast']")
+
+    def open_replay(self, path, realtime = False, loop = False):
+        """Reads frames from a recorded frame archive instead of the browser.
+
+        Without a browser all vehicle commands (steering, autodrive, cruise speed) are ignored.
+        """
+        self.frame_source = ReplayFrameSource(path, realtime, loop)
+
+    def open_synthetic(self, size = (640, 360), **kwargs):
+        """Drives a simulated vehicle on a procedural road instead of the browser.
+
+        Steering, cruise speed, autodrive and rest_vehicle act on the simulation, which
+        advances by one frame period per grabbed frame. See SyntheticDrive for the keyword arguments.
+        """
+        self.synthetic = SyntheticDrive(size, **kwargs)
+        self.frame_source = self.synthetic
 
     def set_speed(self, speed):
-        set_cruise_speed(self.driver, speed)
+        if self.driver_initialized:
+            if speed % 5 == 0:  # The cruise control moves in steps of 5
+                self.submit_ui('cruise', speed)
+        elif self.synthetic is not None:
+            self.synthetic.set_cruise_speed(speed)
 
     def steer_left(self, t_down, t_up):
-        steer_left(self.driver, t_down, t_up)
+        if self.driver_initialized:
+            steer_left(self.driver, t_down, t_up)
+        elif self.synthetic is not None:
+            self.synthetic.steer_left(t_down, t_up)
 
     def steer_right(self, t_down, t_up):
-        steer_right(self.driver, t_down, t_up)
+        if self.driver_initialized:
+            steer_right(self.driver, t_down, t_up)
+        elif self.synthetic is not None:
+            self.synthetic.steer_right(t_down, t_up)
+
+    def key_down(self, key):
+        if self.driver_initialized:
+            key_down(self.driver, key)
+
+    def key_up(self, key):
+        if self.driver_initialized:
+            key_up(self.driver, key)
 
     def grab_screenshot(self):
-        return grab_screenshot(self.driver)
+        return self.frame_source.grab()
+
+    def publish_frame(self, image):
+        """Publishes a grabbed frame on the frame bus, which is created from the first frame. Returns the bus Frame.
+
+        Consumers read the frames zero-copy, in this process with FrameReader(sim.frame_bus)
+        and in others with FrameReader(FrameBus.attach(sim.frame_bus.name)).
+        """
+        if self.frame_bus is None:
+            self.frame_bus = FrameBus(image.shape, self.frame_bus_slots)
+        return self.frame_bus.publish(image)
+
+    def latest_frame(self):
+        """Returns the newest Frame on the frame bus, or None if nothing was published."""
+        return None if self.frame_bus is None else self.frame_bus.latest()
 
     def save_screenshot(self, directory = None, prefix = None):
-        save_screenshot(self.driver, directory, prefix)
+        """Saves the latest published frame, or takes a browser screenshot if there is none."""
+        frame = self.latest_frame()
+        if frame is not None:
+            # The copy keeps the capture from overwriting the slot while the PNG is encoded
+            save_screenshot(None, directory, prefix, image = frame.copy())
+        elif self.driver_initialized:
+            save_screenshot(self.driver, directory, prefix)
 
     def autodrive_on(self):
-        autodrive_on(self.driver)
+        if self.driver_initialized:
+            self.submit_ui('autodrive', True)
+        elif self.synthetic is not None:
+            self.synthetic.autodrive_on()
     
     def autodrive_off(self):
-        autodrive_off(self.driver)
+        if self.driver_initialized:
+            self.submit_ui('autodrive', False)
+        elif self.synthetic is not None:
+            self.synthetic.autodrive_off()
 
     def rest_vehicle(self, t = 2):
+        """Lets autodrive drive for t seconds.
+
+        While the control thread runs this does not block it: autodrive is turned on and
+        control_tick turns it off again once t seconds have passed. Otherwise it waits.
+        """
+        if self.synthetic is not None:
+            self.synthetic.rest_vehicle(t)  # In simulated time, without waiting
+            return
+        if not self.driver_initialized or self.resting:
+            return
+        # Both states have to reach the page, a batched on and off would cancel out
         self.autodrive_on()
+        self.flush_ui()
+        if self.control_initialized and self.run_event.is_set():
+            self.rest_until = time.perf_counter() + t
+            return
         time.sleep(t)
         self.autodrive_off()
+        self.flush_ui()
+
+    @property
+    def resting(self):
+        """True while a rest started by rest_vehicle lets autodrive drive."""
+        return self.rest_until is not None
+
+    def end_rest(self):
+        """Ends a rest started by rest_vehicle and turns autodrive off."""
+        self.rest_until = None
+        self.autodrive_off()
+        self.flush_ui()
         
     def add_key_action(self, key, func):
         # Unassigned keys: G,J,L,N,O,X,Y
@@ -173,13 +405,44 @@ class SlowRoadsSimulator:
     def setup_scene(self, file_path, topography="normal", season="summer", weather="sun"):
         update_config_file(file_path, topography, season, weather)
 
+    def switch_scene(self, topography="normal", season="summer", weather="sun", live_keys=()):
+        """Changes the scene of the running game without relaunching the browser.
+
+        Only the local storage items that change are written, and the page is reloaded
+        only if one of them is not in live_keys. Nothing is read from or written to disk.
+
+        Returns:
+            The changed items, an empty dictionary if the scene is already active.
+        """
+        if self.synthetic is not None:
+            s = self.synthetic
+            current = scene_config({}, s.topography, s.season, s.weather)
+            config = scene_config({}, topography, season, weather)
+            s.set_scene(season, weather, topography)
+            # The same local storage items the browser path would write
+            return {key: str(value) for key, value in config.items() if current[key] != value}
+        if not self.driver_initialized:
+            return {}
+
+        if self.local_storage is None:
+            self.local_storage = read_local_storage(self.driver)
+
+        config = scene_config(self.local_storage, topography, season, weather)
+        with instrumentation.span('scene.switch'):
+            changed, reloaded = switch_scene(self.driver, config, self.local_storage, live_keys)
+        self.local_storage.update(changed)
+
+        if reloaded:
+            self.release_steering()  # Key state does not survive the reload
+        return changed
+
     def run(self):
 
-        """Main loop to capture images and update commands."""
+        """Waits until exit_event is set while the control thread and pipeline stages run, then cleans up."""
         try:
-            while not self.exit_event.is_set():
-                time.sleep(0.1)
-                # image = self.grab_screenshot()
+            # The timeout keeps the main thread responsive to SIGINT
+            while not self.exit_event.wait(0.5):
+                pass
         finally:
             self.__clear__()
 
@@ -5,14 +5,17 @@ from selenium.webdriver.common.keys import Keys
 import cv2 as cv
 import numpy as np
 import time
-from pynput.keyboard import Key, Listener
 from selenium.webdriver.common.by import By
 from datetime import datetime
 import os
-from selenium.common.exceptions import NoSuchElementException, WebDriverException
+from selenium.common.exceptions import NoSuchElementException, WebDriverException, TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
 from PIL import Image
 import io
 import json
+import threading
+from instrumentation import timed, span, record
 
 # Free Keys
 # G,J,L,N,O,X,Y
@@ -25,35 +28,146 @@ import json
 # "speed-control_speed": "2.2352", "4.4704", "6.7056", "8.9408"
 
 
-def track_time(func):
-    """Decorator to track the execution time of a function."""
-    def wrapper(*args, **kwargs):
-        start_time = time.time()
-        result = func(*args, **kwargs)  # Call the function
-        end_time = time.time()
-        print(f"Function {func.__name__} executed in {end_time - start_time:.4f} seconds")
-        return result
-    return wrapper
+SLOWROADS_URL = 'https://slowroads.io/'
+
+def stand_in_url(delay = None):
+    """Returns the file URL of the local stand-in page stand_in/slowroads.html for testing without network access."""
+    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    url = 'file://' + os.path.join(project_dir, 'stand_in', 'slowroads.html')
+    if delay is not None:
+        url += f'?delay={int(delay)}'
+    return url
+
+# Scripts polled by open_browser to detect when the game is ready
+STORAGE_APPLIED_SCRIPT = """
+var items = JSON.parse(arguments[0]);
+for (var key in items) { if (window.localStorage.getItem(key) !== String(items[key])) return false; }
+return true;
+"""
+
+CANVAS_RENDERING_SCRIPT = """
+var done = arguments[arguments.length - 1];
+var canvas = document.querySelector('canvas');
+if (!canvas || !canvas.width || !canvas.height) { done(false); return; }
+// Wait for two animation frames to make sure the render loop is running
+var frames = 0;
+function tick() { if (++frames >= 2) { done(true); } else { window.requestAnimationFrame(tick); } }
+window.requestAnimationFrame(tick);
+"""
+
+CRUISE_UI_SCRIPT = """
+var element = document.getElementById(arguments[0]);
+return !!element && element.offsetParent !== null && !isNaN(parseInt(element.innerHTML));
+"""
+
+
+def wait_for(driver, condition, timeout = 60, poll_frequency = 0.05, name = None):
+    """
+    Polls condition(driver) until it returns a truthy value.
+
+    Returns:
+    The value returned by condition.
+
+    Raises:
+    TimeoutException naming what was waited for if the timeout expired.
+    """
+    try:
+        return WebDriverWait(driver, timeout, poll_frequency, ignored_exceptions=(WebDriverException,)).until(condition)
+    except TimeoutException:
+        raise TimeoutException(f"Timed out after {timeout} s waiting for {name or condition}") from None
+
+
+def wait_until_ready(driver, local_storage = None, timeout = 60, end_phase = None):
+    """
+    Starts the game from its splash screen and waits until it is ready to drive.
+
+    Used by open_browser after navigating and by switch_scene after a reload.
+
+    Parameters:
+    - driver: The Selenium WebDriver object.
+    - local_storage: JSON string of local storage items to wait for, None skips that phase.
+    - timeout: Maximum time in seconds to wait for each phase.
+    - end_phase: Optional function called with the name of every completed phase.
+
+    Raises:
+    - TimeoutException: A phase did not complete within timeout, the message names it.
+    """
+    end_phase = end_phase or (lambda name: None)
+
+    # IDs for the elements
+    start_button_id = "splash-loader"
+    wait_for(driver, EC.element_to_be_clickable((By.ID, start_button_id)), timeout, name='splash screen')
+    click_element(driver, start_button_id)
+    end_phase('splash')
+
+    if local_storage is not None:
+        wait_for(driver, lambda d: d.execute_script(STORAGE_APPLIED_SCRIPT, local_storage), timeout, name='local storage')
+        end_phase('storage')
+
+    wait_for(driver, lambda d: d.execute_async_script(CANVAS_RENDERING_SCRIPT), timeout, name='canvas rendering')
+    end_phase('canvas')
+
+    wait_for(driver, lambda d: d.execute_script(CRUISE_UI_SCRIPT, 'ui-cruise-value'), timeout, name='cruise UI')
+    end_phase('cruise_ui')
+
+
+def open_browser(local_storage_path = None, size = (640, 360), url = None, timeout = 60, timings = None):
+    """
+    Opens SlowRoads in Chrome and waits until the game is ready to drive.
+
+    Instead of fixed sleeps, startup polls for the splash screen, the applied local
+    storage, a rendering canvas and the cruise control UI. The local storage is injected
+    before the page loads, so the game starts with it and no refresh is needed.
+
+    Parameters:
+    - local_storage_path: JSON file with the local storage items, see config/slowroads_storage.json.
+    - size: Window size, format (width, height).
+    - url: Page to open, defaults to SLOWROADS_URL. A local stand-in page can be used for testing.
+    - timeout: Maximum time in seconds to wait for each startup phase.
+    - timings: Optional dictionary that receives the duration in seconds of every startup phase.
+
+    Returns:
+    - driver: The Selenium WebDriver object.
+
+    Raises:
+    - TimeoutException: A startup phase timed out. The browser is closed before it is raised.
+    """
+    timings = {} if timings is None else timings
+    t_phase = time.perf_counter()
+
+    def end_phase(name):
+        nonlocal t_phase
+        now = time.perf_counter()
+        timings[name] = now - t_phase
+        record('startup.' + name, timings[name])
+        t_phase = now
 
-   
-def open_browser(local_storage_path = None, size = (640, 360)):
-    
     # Setup Selenium to open Chrome
     chrome_options = Options()
     chrome_options.add_experimental_option("detach", True)
     driver = webdriver.Chrome(options=chrome_options)
     driver.set_window_size(*size)
-    driver.get('https://slowroads.io/')
-    
-    # IDs for the elements
-    start_button_id = "splash-loader"
-    click_element(driver, start_button_id)
-    
+    end_phase('launch')
+
+    local_storage = None
     if not local_storage_path is None:
-        time.sleep(3)
-        load_local_storage(driver, local_storage_path)
-        time.sleep(10)
-           
+        local_storage = json.dumps(load_config(local_storage_path))
+        script_id = inject_local_storage(driver, local_storage)
+
+    driver.get(url or SLOWROADS_URL)
+    end_phase('navigate')
+
+    try:
+        wait_until_ready(driver, local_storage, timeout, end_phase)
+    except TimeoutException as e:
+        print(f"Startup failed: {e.msg}")
+        driver.quit()  # The detached browser would stay open otherwise
+        raise
+    if local_storage is not None:
+        # Only the first load gets the file contents, later reloads keep what the game stored
+        driver.execute_cdp_cmd("Page.removeScriptToEvaluateOnNewDocument", {"identifier": script_id})
+
+    print("Startup: " + ", ".join(f"{name} {t:.2f} s" for name, t in timings.items()) + f" (total {sum(timings.values()):.2f} s)")
     return driver
 
 
@@ -88,6 +202,8 @@ class KeyListener:
         
     def start_listening(self):
         if not self.is_listening:
+            # pynput needs a display, importing it here keeps the module usable headless
+            from pynput.keyboard import Listener
             self.listener = Listener(on_press=self.on_press, on_release=self.on_release)
             self.listener.start()
             self.is_listening = True  # Set flag to True as the listener has started
@@ -98,6 +214,22 @@ class KeyListener:
             self.is_listening = False  # Reset flag as the listener has stopped
 
         
+def inject_local_storage(driver, local_storage):
+    """
+    Makes Chrome write the local storage items before any script of the next page loads.
+
+    Parameters:
+    - driver: Chrome WebDriver object.
+    - local_storage: JSON string with the items.
+
+    Returns:
+    - identifier: CDP identifier of the injected script, pass it to
+      Page.removeScriptToEvaluateOnNewDocument to stop overwriting the storage on reloads.
+    """
+    script = f"window.localStorage.clear(); var items = {local_storage}; for (var key in items) {{ window.localStorage.setItem(key, items[key]); }}"
+    result = driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": script})
+    return result["identifier"]
+
 def load_local_storage(driver, path):
     try:
         with open(path, 'r') as file:
@@ -128,7 +260,8 @@ def open_safari():
     return driver
 
 
-def save_screenshot(driver, directory, prefix):
+def save_screenshot(driver, directory, prefix, image = None):
+    """Saves a screenshot of the browser, or image (BGR) if given, as {prefix}_{timestamp}.png in directory."""
 
     # Check if directory is specified and is not None
     if not directory:
@@ -138,19 +271,29 @@ def save_screenshot(driver, directory, prefix):
         prefix = "image"
         
     now = datetime.now()
-    filename = prefix + now.strftime("_%Y%m%d%H%M%S.png")
+    # Include microseconds so that screenshots taken in quick succession do not collide
+    filename = prefix + now.strftime("_%Y%m%d%H%M%S%f.png")
     filepath = os.path.join(directory, filename)
     
-    driver.save_screenshot(filepath)
+    if image is None:
+        driver.save_screenshot(filepath)
+    else:
+        cv.imwrite(filepath, image)
     print(f"Saved screenshot at {filepath}")
 
-@track_time            
-def grab_screenshot(driver):
+@timed('capture.grab_screenshot')
+def grab_screenshot(driver, decoder = None):
     try:
-        screenshot = driver.get_screenshot_as_png()
-        nparr = np.frombuffer(screenshot, np.uint8)
-        image = cv.imdecode(nparr, cv.IMREAD_COLOR)
-        return True, image
+        with span('capture.get_png'):
+            screenshot = driver.get_screenshot_as_png()
+        with span('capture.decode'):
+            nparr = np.frombuffer(screenshot, np.uint8)
+            if decoder is None:
+                image = cv.imdecode(nparr, cv.IMREAD_COLOR)
+            else:
+                # Decode straight to the working resolution into a reused buffer
+                image = decoder.decode(nparr)
+        return image is not None, image
     except WebDriverException as e:
         print(f"WebDriverException occurred in control thread: {e}")
         # Return None or a default image to handle the exception gracefully
@@ -159,7 +302,7 @@ def grab_screenshot(driver):
         # Return None or a default image to handle the exception gracefully
     return False, None
 
-@track_time     
+@timed('actuate.steer_left')
 def steer_left(driver, t_down = 0.2, t_up = 0.1):
     
     try:
@@ -178,7 +321,7 @@ def steer_left(driver, t_down = 0.2, t_up = 0.1):
         print(f"An unexpected error occurred in control thread: {e}")
         # Handle other unexpected exceptions
 
-@track_time
+@timed('actuate.steer_right')
 def steer_right(driver, t_down = 0.2, t_up = 0.1):
     
     try:
@@ -196,6 +339,28 @@ def steer_right(driver, t_down = 0.2, t_up = 0.1):
         print(f"An unexpected error occurred in control thread: {e}")
         # Handle other unexpected exceptions
 
+ARROW_KEYS = {'left': Keys.ARROW_LEFT, 'right': Keys.ARROW_RIGHT}
+
+@timed('actuate.key_down')
+def key_down(driver, key):
+    """Presses an arrow key ('left' or 'right') without releasing it."""
+    try:
+        ActionChains(driver).key_down(ARROW_KEYS[key]).perform()
+    except WebDriverException as e:
+        print(f"WebDriverException occurred in control thread: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred in control thread: {e}")
+
+@timed('actuate.key_up')
+def key_up(driver, key):
+    """Releases an arrow key ('left' or 'right')."""
+    try:
+        ActionChains(driver).key_up(ARROW_KEYS[key]).perform()
+    except WebDriverException as e:
+        print(f"WebDriverException occurred in control thread: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred in control thread: {e}")
+
 def set_value(driver, id_name, value):
     # Execute the script
     script = f"document.getElementById('{id_name}').innerHTML = {value};"
@@ -208,19 +373,129 @@ def get_value(driver, id_name):
     return value
 
 
+# Carries out a list of UI operations in the page and returns a telemetry snapshot, so that a
+# whole control tick of UI work costs a single WebDriver round trip.
+UI_BATCH_SCRIPT = """
+var ops = arguments[0], cfg = arguments[1], errors = [];
+function byXPath(xpath) {
+  return document.evaluate(xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+}
+function cruiseSpeed() {
+  var element = document.getElementById(cfg.cruise_value_id);
+  var value = element ? parseInt(element.innerHTML) : NaN;
+  return isNaN(value) ? null : value;
+}
+function autodriveActive() {
+  var element = document.getElementById(cfg.autodrive_id);
+  return !!element && element.classList.contains(cfg.autodrive_class);
+}
+for (var i = 0; i < ops.length; i++) {
+  var op = ops[i];
+  try {
+    if (op[0] === 'cruise') {
+      var current = cruiseSpeed();
+      if (current === null) { errors.push('cruise: no cruise value'); continue; }
+      var button = byXPath(current > op[1] ? cfg.xpath_down : cfg.xpath_up);
+      for (var n = Math.round(Math.abs(current - op[1]) / 5); n > 0; n--) { button.click(); }
+    } else if (op[0] === 'autodrive') {
+      if (autodriveActive() !== op[1]) { document.getElementById(cfg.autodrive_button_id).click(); }
+    } else if (op[0] === 'click') {
+      document.getElementById(op[1]).click();
+    } else {
+      errors.push('unknown operation ' + op[0]);
+    }
+  } catch (e) {
+    errors.push(op[0] + ': ' + e.message);
+  }
+}
+var cruiseElement = document.getElementById(cfg.cruise_value_id);
+return {
+  cruise_speed: cruiseSpeed(),
+  autodrive: autodriveActive(),
+  ui_visible: !!cruiseElement && cruiseElement.offsetParent !== null,
+  errors: errors
+};
+"""
+
+UI_DEFAULTS = {
+    'cruise_value_id': 'ui-cruise-value',
+    'xpath_up': '//*[@id="ui-cruise-select"]/div[1]',
+    'xpath_down': '//*[@id="ui-cruise-select"]/div[3]',
+    'autodrive_id': 'autodrive',
+    'autodrive_class': 'autodrive-active',
+    'autodrive_button_id': 'autodrive-button',
+}
+
+
+def run_ui_commands(driver, operations, config = None):
+    """
+    Carries out UI operations in the page with a single execute_script call.
+
+    Parameters:
+    - driver (WebDriver): The Selenium WebDriver object.
+    - operations (list): Operations done in order, ('cruise', speed), ('autodrive', bool) or ('click', element_id).
+    - config (dict, optional): Element IDs and XPaths overriding UI_DEFAULTS.
+
+    Returns:
+    dict: Telemetry after the operations: cruise_speed, autodrive, ui_visible and the errors of failed operations.
+    """
+    config = UI_DEFAULTS if config is None else {**UI_DEFAULTS, **config}
+    with span('ui.batch'):
+        telemetry = driver.execute_script(UI_BATCH_SCRIPT, [list(op) for op in operations], config)
+    for error in telemetry['errors']:
+        print(f"UI command failed: {error}")
+    return telemetry
+
+
+class UICommandChannel:
+    """Collects UI operations and sends them together with run_ui_commands.
+
+    Operations can be submitted from any thread; flush() sends everything submitted so
+    far in one round trip and keeps the returned telemetry in self.telemetry.
+    """
+
+    def __init__(self, driver, config = None):
+        self.driver = driver
+        self.config = config
+        self.telemetry = None
+        self.round_trips = 0
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def submit(self, *operation):
+        with self._lock:
+            if operation[0] in ('cruise', 'autodrive'):
+                # Only the last cruise speed or autodrive state of a batch matters
+                self._pending = [op for op in self._pending if op[0] != operation[0]]
+            self._pending.append(operation)
+
+    def pending(self):
+        return bool(self._pending)
+
+    def flush(self):
+        """Sends the pending operations, or only reads the telemetry if there are none."""
+        with self._lock:
+            operations, self._pending = self._pending, []
+        self.telemetry = run_ui_commands(self.driver, operations, self.config)
+        self.round_trips += 1
+        return self.telemetry
+
+
 def set_cruise_speed(driver, target_speed, value_id=None, xpath_up=None, xpath_down=None):
     """
     Adjusts the cruise control speed of a vehicle in a web-based interface to a specified target speed.
     
+    Reading the current speed and all button clicks happen in a single script call.
+
     Parameters:
     - driver (WebDriver): The Selenium WebDriver object used to interact with the web page.
     - target_speed (int): The desired cruise control speed. Must be a multiple of 5.
     - value_id (str, optional): The HTML element ID that displays the current cruise speed. 
       Defaults to 'ui-cruise-value' if not provided.
     - xpath_up (str, optional): The XPath to the button that increases the cruise speed. 
-      Defaults to '//*[@id="ui-cruise-select"]/div[3]' if not provided.
-    - xpath_down (str, optional): The XPath to the button that decreases the cruise speed. 
       Defaults to '//*[@id="ui-cruise-select"]/div[1]' if not provided.
+    - xpath_down (str, optional): The XPath to the button that decreases the cruise speed. 
+      Defaults to '//*[@id="ui-cruise-select"]/div[3]' if not provided.
 
     Returns:
     None: The function modifies the cruise speed on the web interface directly and has no return value.
@@ -234,89 +509,140 @@ def set_cruise_speed(driver, target_speed, value_id=None, xpath_up=None, xpath_d
     if target_speed % 5 != 0:
         return
 
-    # Assign default values if not provided
-    cruise_value_id = value_id or 'ui-cruise-value'
-    xpath_down = xpath_down or '//*[@id="ui-cruise-select"]/div[3]'
-    xpath_up = xpath_up or '//*[@id="ui-cruise-select"]/div[1]' 
-
-    # Retrieve the current speed from the web interface
-    current_speed = int(get_value(driver, cruise_value_id))
-
-    # Determine the direction of adjustment needed and select the appropriate control element
-    if current_speed > target_speed:
-        element = driver.find_element(By.XPATH, xpath_down)
-        # Click the down button until the target speed is reached
-        for _ in range((current_speed - target_speed) // 5):
-            element.click()
-
-    
-    elif current_speed < target_speed:
-        element = driver.find_element(By.XPATH, xpath_up)
-        # Click the up button until the target speed is reached
-        for _ in range((target_speed - current_speed) // 5):
-            element.click()
+    config = {k: v for k, v in (('cruise_value_id', value_id), ('xpath_up', xpath_up), ('xpath_down', xpath_down)) if v}
+    run_ui_commands(driver, [('cruise', target_speed)], config)
 
 def is_autodrive_active(driver):
     try:
-        autodrive_div = driver.find_element(By.ID, 'autodrive')
-        return 'autodrive-active' in autodrive_div.get_attribute('class')
+        return run_ui_commands(driver, [])['autodrive']
     except Exception as e:
         print(f"Error checking autodrive status: {e}")
         return False
 
 def autodrive_on(driver, autodrive_btn_id = 'autodrive-button'):
-    if is_autodrive_active(driver):
-        return
-
-    click_element(driver, autodrive_btn_id)
+    run_ui_commands(driver, [('autodrive', True)], {'autodrive_button_id': autodrive_btn_id})
 
 def autodrive_off(driver, autodrive_btn_id = 'autodrive-button'):
-    if is_autodrive_active(driver):
-        click_element(driver, autodrive_btn_id)
+    run_ui_commands(driver, [('autodrive', False)], {'autodrive_button_id': autodrive_btn_id})
+
+TOPOGRAPHY_LIST = ["straight", "casual", "easy", "normal", "hard"]
+
+SEASON_MAPPING = {
+    "summer": "default", 
+    "autumn": "autumn", 
+    "spring": "spring", 
+    "winter": "winter"
+}
+
+WEATHER_MAPPING = {
+    "sunrise": "0", 
+    "sun": "1", 
+    "cloudy": "2", 
+    "sunset": "3", 
+    "night": "4"
+}
+
+# Parsed config files by path, with the modification time they were read at
+_config_cache = {}
+
+
+def load_config(file_path):
+    """Returns a copy of the local storage config in file_path, parsed only when the file changed."""
+    mtime = os.path.getmtime(file_path)
+    cached = _config_cache.get(file_path)
+    if cached is None or cached[0] != mtime:
+        with open(file_path, 'r') as file:
+            cached = (mtime, json.load(file))
+        _config_cache[file_path] = cached
+    return dict(cached[1])
+
+
+def scene_config(config, topography="normal", season="summer", weather="sun"):
+    """Returns a copy of the local storage config with the scene items of topography, season and weather."""
+    config = dict(config)
 
-def update_config_file(file_path, topography="normal", season="summer", weather="sun"):
-    # Mappings
-    topography_list = ["straight", "casual", "easy", "normal", "hard"]
-    
-    season_mapping = {
-        "summer": "default", 
-        "autumn": "autumn", 
-        "spring": "spring", 
-        "winter": "winter"
-    }
-    
-    weather_mapping = {
-        "sunrise": "0", 
-        "sun": "1", 
-        "cloudy": "2", 
-        "sunset": "3", 
-        "night": "4"
-    }
-    
-    # Read the configuration file
-    with open(file_path, 'r') as file:
-        config = json.load(file)
-    
     # Validate and update topography
-    if topography not in topography_list:
-        raise ValueError(f"Invalid topography. Select between {topography_list}")
+    if topography not in TOPOGRAPHY_LIST:
+        raise ValueError(f"Invalid topography. Select between {TOPOGRAPHY_LIST}")
     else:
         config["config-scene-topography"] = topography
     
     # Validate and update season
-    if season not in season_mapping:
-        raise ValueError(f"Invalid season. Select between {list(season_mapping.keys())}")
+    if season not in SEASON_MAPPING:
+        raise ValueError(f"Invalid season. Select between {list(SEASON_MAPPING.keys())}")
     else:
-        config["config-scene-skin"] = season_mapping[season]
+        config["config-scene-skin"] = SEASON_MAPPING[season]
     
     # Validate and update weather
-    if weather not in weather_mapping:
-        raise ValueError(f"Invalid weather. Select between {list(weather_mapping.keys())}")
+    if weather not in WEATHER_MAPPING:
+        raise ValueError(f"Invalid weather. Select between {list(WEATHER_MAPPING.keys())}")
     else:
-        config["config-scene-weather-index"] = weather_mapping[weather]
+        config["config-scene-weather-index"] = WEATHER_MAPPING[weather]
+
+    return config
+
+
+def update_config_file(file_path, topography="normal", season="summer", weather="sun"):
+    config = scene_config(load_config(file_path), topography, season, weather)
     
     # Write the updated configuration back to the file
     with open(file_path, 'w') as file:
         json.dump(config, file, indent=4)
     
-    return "Configuration file has been successfully updated."
\ No newline at end of file
+    return "Configuration file has been successfully updated."
+
+
+READ_STORAGE_SCRIPT = """
+var items = {};
+for (var i = 0; i < window.localStorage.length; i++) {
+  var key = window.localStorage.key(i);
+  items[key] = window.localStorage.getItem(key);
+}
+return items;
+"""
+
+WRITE_STORAGE_SCRIPT = """
+var items = arguments[0];
+for (var key in items) { window.localStorage.setItem(key, items[key]); }
+"""
+
+
+def read_local_storage(driver):
+    """Returns all local storage items of the current page in one round trip."""
+    return driver.execute_script(READ_STORAGE_SCRIPT)
+
+
+def switch_scene(driver, config, current = None, live_keys = (), timeout = 60):
+    """
+    Changes the local storage of the running game to config with as little work as possible.
+
+    Only items that differ from the current storage are written, all in one script call.
+    The page is reloaded only if a changed item is not in live_keys, i.e. the game only
+    picks it up on load, and then only the splash screen and readiness phases of
+    open_browser are repeated, not the browser launch.
+
+    Parameters:
+    - driver: The Selenium WebDriver object.
+    - config: Desired local storage items, e.g. from scene_config.
+    - current: The items currently in the local storage if known, read from the page if None.
+    - live_keys: Items the page applies without a reload.
+    - timeout: Maximum time in seconds to wait for each phase after a reload.
+
+    Returns:
+    - changed: Dictionary of the items that were written.
+    - reloaded: Whether the page was reloaded.
+    """
+    if current is None:
+        current = read_local_storage(driver)
+
+    changed = {key: str(value) for key, value in config.items() if current.get(key) != str(value)}
+    if not changed:
+        return changed, False
+
+    driver.execute_script(WRITE_STORAGE_SCRIPT, changed)
+
+    reloaded = any(key not in live_keys for key in changed)
+    if reloaded:
+        driver.refresh()
+        wait_until_ready(driver, json.dumps(changed), timeout)
+    return changed, reloaded
@@ -0,0 +1,373 @@
+"""
+Closed-loop synthetic driving, a stand-in for the browser that runs without Chrome.
+
+SyntheticDrive moves a kinematic vehicle along a procedural road and renders what the
+camera sees. It offers the calls SlowRoadsSimulator makes on the browser (frames,
+steering, cruise speed, autodrive, rest_vehicle), see SlowRoadsSimulator.open_synthetic.
+Time is simulated: every grabbed frame advances the model by one frame period, so a
+run is limited by the detection speed only and usually far faster than real time.
+
+Usage:
+    python synthetic_drive.py --km 50                    # soak test of the lane controller
+    python synthetic_drive.py --km 5 --season winter --weather cloudy
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from actuator import steering_setpoint
+from frame_sources import FrameSource
+from lane_detection_utils import preprocess_image
+from lane_tracker import LaneTracker
+from synthetic_frames import (GROUND_COLORS, SKY_COLORS, WEATHER_GAINS, ROAD_COLOR, MARKING_COLOR,
+                              lane_geometry)
+
+LANE_WIDTH_M = 3.7
+
+# Maximum road curvature in 1/m per SlowRoads topography
+TOPOGRAPHY_CURVATURE = {'straight': 0.0, 'casual': 1 / 800, 'easy': 1 / 500, 'normal': 1 / 250, 'hard': 1 / 150}
+
+
+class RoadProfile:
+    """Road curvature along the driven distance as a sum of seeded sinusoids.
+
+    The curvature is in 1/m, positive values bend the road to the right.
+    """
+
+    def __init__(self, seed=0, max_curvature=1 / 250, n_terms=4):
+        rng = np.random.default_rng(seed)
+        self.wavelengths = rng.uniform(200, 1500, n_terms)
+        self.phases = rng.uniform(0, 2 * np.pi, n_terms)
+        self.amplitudes = rng.uniform(0.3, 1.0, n_terms)
+        self.amplitudes *= max_curvature / self.amplitudes.sum()
+
+    def curvature(self, distance):
+        return float(np.sum(self.amplitudes * np.sin(2 * np.pi * distance / self.wavelengths + self.phases)))
+
+
+class VehicleModel:
+    """Kinematic bicycle model in road coordinates.
+
+    State: lateral offset from the lane center in meters (positive right of the center),
+    heading relative to the road in radians (positive pointing right), steering angle,
+    speed and driven distance. The steering angle follows its target with a first order lag.
+    """
+
+    def __init__(self, wheelbase=2.7, max_steer=0.03, steer_lag=0.15):
+        self.wheelbase = wheelbase
+        self.max_steer = max_steer
+        self.steer_lag = steer_lag
+        self.reset()
+
+    def reset(self, speed=None):
+        self.lateral = 0.0
+        self.heading = 0.0
+        self.steer = 0.0
+        self.distance = getattr(self, 'distance', 0.0)
+        self.speed = getattr(self, 'speed', 0.0) if speed is None else speed
+
+    def step(self, dt, steer_input, road_curvature):
+        """
+        Advances the model by dt seconds.
+
+        Args:
+        dt (float): Time step in seconds.
+        steer_input (float): Steering in [-1, 1], a fraction of max_steer, positive steers right.
+        road_curvature (float): Curvature of the road at the vehicle in 1/m.
+        """
+        target = float(np.clip(steer_input, -1, 1)) * self.max_steer
+        self.steer += (target - self.steer) * min(dt / self.steer_lag, 1.0)
+
+        yaw_rate = self.speed / self.wheelbase * np.tan(self.steer) - self.speed * road_curvature
+        self.heading += yaw_rate * dt
+        self.lateral += self.speed * np.sin(self.heading) * dt
+        self.distance += self.speed * dt
+
+
+class SyntheticDrive(FrameSource):
+    """Frame source and vehicle controls of a simulated drive.
+
+    Steering comes from the arrow key state (key_down/key_up), from a continuous setpoint
+    (set_steering, which averages the actuator's duty cycle over time), or from the built-in
+    autodrive. Leaving the road resets the vehicle to the lane center and counts as off_road.
+
+    Frames are rendered into a ring of n_buffers reused buffers, consumers that keep a
+    frame for longer have to copy it.
+    """
+
+    def __init__(self, size=(640, 360), season='summer', weather='sun', speed=60, fps=30, seed=0,
+                 lane_width=370, horizon=0.45, n_buffers=3, max_distance=None, time_scale=None, topography='normal'):
+        """
+        Args:
+            size: Frame size, format (width, height).
+            season: One of synthetic_frames.SEASONS.
+            weather: One of synthetic_frames.WEATHERS.
+            speed: Initial cruise speed in km/h.
+            fps: Simulated frames per second, every grab advances the model by 1 / fps seconds.
+            seed: Seed of the road profile.
+            lane_width: Lane width in pixels at row 257 of 360, like find_driving_path's lane_width.
+            horizon: Height of the horizon as a fraction of the frame height.
+            n_buffers: Number of output buffers used in turn.
+            max_distance: finished is set once this many meters are driven, None drives forever.
+            time_scale: If set, grab waits so that simulated time runs at most time_scale
+                times as fast as the wall clock, e.g. 1.0 for the threaded pipeline of
+                SlowRoadsSimulator whose commands arrive in wall clock time. None never waits.
+            topography: One of TOPOGRAPHY_CURVATURE, sets how sharp the curves get.
+        """
+        self.size = size
+        self.season = season
+        self.weather = weather
+        self.dt = 1.0 / fps
+        self.lane_width = lane_width
+        self.horizon = horizon
+        self.max_distance = max_distance
+        self.time_scale = time_scale
+        self._t_start = None
+        self.seed = seed
+        self.set_topography(topography)
+        self.vehicle = VehicleModel()
+        self.vehicle.reset(speed / 3.6)
+        self.cruise_speed = speed
+
+        self.keys = set()
+        self.setpoint = None  # Continuous steering, overrides the keys while set
+        self.autodrive = False
+        self.finished = False
+
+        self.frames = 0
+        self.off_road = 0
+        self.departures = 0
+        self._departed = False
+        self._abs_lateral = 0.0
+
+        width, height = size
+        self.y_horizon = int(horizon * height)
+        rows = np.arange(self.y_horizon, height, dtype=np.float32)
+        self._t = ((height - rows) / (height - horizon * height))[:, None]
+
+        # Pixels per meter at the bottom row and focal length for the heading shift
+        _, _, half_width = lane_geometry(np.zeros(1), size, lane_width=lane_width, horizon=horizon)
+        self.px_per_m = 2 * half_width[0] / LANE_WIDTH_M
+        self.focal = width / 2
+
+        self.buffers = [np.empty((height, width, 3), dtype=np.uint8) for _ in range(n_buffers)]
+        self.set_scene(season, weather)
+        self.index = 0
+        self._rows = np.arange(height - self.y_horizon)
+        self._diff = np.zeros((height - self.y_horizon, width + 1), dtype=np.int8)
+        self._labels = np.empty((height - self.y_horizon, width), dtype=np.int8)
+
+    def set_scene(self, season=None, weather=None, topography=None):
+        """Changes the scene while driving, arguments that are None keep their current value."""
+        if season is not None and season not in GROUND_COLORS:
+            raise ValueError(f"Invalid season. Select between {list(GROUND_COLORS)}")
+        if weather is not None and weather not in WEATHER_GAINS:
+            raise ValueError(f"Invalid weather. Select between {list(WEATHER_GAINS)}")
+        self.season = season or self.season
+        self.weather = weather or self.weather
+        if topography is not None:
+            self.set_topography(topography)
+
+        # Colors of ground (0), road (1) and markings (2 or more overlapping), with the weather lighting applied
+        gain = np.array(WEATHER_GAINS[self.weather], dtype=np.float32)
+        colors = [GROUND_COLORS[self.season], ROAD_COLOR] + [MARKING_COLOR] * 6
+        self.palette = np.clip(np.array(colors, dtype=np.float32) * gain, 0, 255).astype(np.uint8)
+        sky = np.clip(np.array(SKY_COLORS[self.weather], dtype=np.float32) * gain, 0, 255).astype(np.uint8)
+        for buffer in self.buffers:
+            buffer[:self.y_horizon] = sky  # The sky only changes with the scene
+
+    def set_topography(self, topography):
+        if topography not in TOPOGRAPHY_CURVATURE:
+            raise ValueError(f"Invalid topography. Select between {list(TOPOGRAPHY_CURVATURE)}")
+        self.topography = topography
+        self.road = RoadProfile(self.seed, TOPOGRAPHY_CURVATURE[topography])
+
+    def steer_input(self):
+        if self.autodrive:
+            # Built-in lane keeping with curvature feed forward
+            v = self.vehicle
+            feed_forward = v.wheelbase * self.road.curvature(v.distance) / v.max_steer
+            return float(np.clip(feed_forward - 0.5 * v.lateral - 2.0 * v.heading, -1, 1))
+        if self.setpoint is not None:
+            return self.setpoint
+        return ('right' in self.keys) - ('left' in self.keys)
+
+    def step(self, dt=None):
+        """Advances the simulation by dt seconds (one frame period by default) without rendering."""
+        dt = self.dt if dt is None else dt
+        v = self.vehicle
+        v.step(dt, self.steer_input(), self.road.curvature(v.distance))
+
+        departed = abs(v.lateral) > LANE_WIDTH_M / 2
+        if departed and not self._departed:
+            self.departures += 1
+        self._departed = departed
+        if abs(v.lateral) > 1.5 * LANE_WIDTH_M:
+            self.off_road += 1
+            v.reset()
+
+        self._abs_lateral += abs(v.lateral)
+        self.frames += 1
+        if self.max_distance is not None and v.distance >= self.max_distance:
+            self.finished = True
+
+    def render(self):
+        """Renders the current camera view into the next output buffer."""
+        v = self.vehicle
+        offset = -v.lateral * self.px_per_m  # The lane moves left when the vehicle is right of its center
+        heading = -self.focal * np.tan(v.heading)
+        # Lateral displacement of the road 60 m ahead as a fraction of the frame width at the horizon
+        curvature = self.road.curvature(v.distance + 30) * 60 ** 2 / 2 * self.px_per_m / 8 / self.size[0]
+        _, center, half = lane_geometry(self._t, self.size, offset, curvature, self.lane_width, self.horizon, heading)
+
+        left = center - half
+        right = center + half
+        road_left = center - 3 * half
+        thickness = 0.05 * half + 1
+        dashed = ((self._t * 12 + v.distance / 6) % 1) < 0.5
+
+        # Every row is a few column intervals (road, markings). Their start and end columns
+        # are marked in a difference array whose cumulative sum gives 1 on the road and
+        # 2 or more on a marking, which indexes the palette.
+        width = self.size[0]
+        intervals = [(road_left, right + 0.15 * half, 1),
+                     (road_left - thickness, road_left + thickness, 2),
+                     (right - thickness, right + thickness, 2),
+                     (left - thickness, left + thickness, np.where(dashed, 2, 0))]
+        diff = self._diff
+        diff[:] = 0
+        for start, end, value in intervals:
+            start = np.clip(np.round(start), 0, width).astype(np.intp).ravel()
+            end = np.clip(np.round(end) + 1, 0, width).astype(np.intp).ravel()
+            value = np.broadcast_to(value, self._t.shape).ravel()
+            diff[self._rows, start] += value
+            diff[self._rows, end] -= value
+        labels = np.cumsum(diff[:, :width], axis=1, out=self._labels)
+
+        out = self.buffers[self.index]
+        self.index = (self.index + 1) % len(self.buffers)
+        np.take(self.palette, labels, axis=0, out=out[self.y_horizon:], mode='clip')
+        return out
+
+    def grab(self):
+        """Advances the simulation by one frame and returns (True, frame)."""
+        if self.time_scale is not None:
+            if self._t_start is None:
+                self._t_start = time.perf_counter() - self.frames * self.dt / self.time_scale
+            delay = self._t_start + (self.frames + 1) * self.dt / self.time_scale - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        self.step()
+        return True, self.render()
+
+    def key_down(self, key):
+        self.keys.add(key)
+
+    def key_up(self, key):
+        self.keys.discard(key)
+
+    def set_steering(self, setpoint):
+        """Steers continuously with a setpoint in [-1, 1], None returns control to the keys."""
+        self.setpoint = setpoint
+
+    def steer_left(self, t_down, t_up):
+        self.set_steering(-t_down / (t_down + t_up))
+
+    def steer_right(self, t_down, t_up):
+        self.set_steering(t_down / (t_down + t_up))
+
+    def set_cruise_speed(self, speed):
+        self.cruise_speed = speed
+        self.vehicle.speed = speed / 3.6
+
+    def autodrive_on(self):
+        self.autodrive = True
+
+    def autodrive_off(self):
+        self.autodrive = False
+
+    def rest_vehicle(self, t=2):
+        """Lets autodrive steer for t simulated seconds, without rendering or waiting."""
+        self.autodrive_on()
+        for _ in range(int(round(t / self.dt))):
+            self.step()
+        self.autodrive_off()
+
+    def stats(self):
+        return {
+            'km': self.vehicle.distance / 1000,
+            'frames': self.frames,
+            'departures': self.departures,
+            'off_road': self.off_road,
+            'mean_abs_lateral_m': float(self._abs_lateral / max(self.frames, 1)),
+        }
+
+
+def soak_test(km=10, size=(640, 360), season='summer', weather='sun', speed=60, seed=0, min_pixels=60, n_failures=3):
+    """
+    Drives km kilometers with the lane detection and controller of run_slowroads, without threads.
+
+    Every frame is detected and the steering setpoint applied before the next frame, and
+    n_failures detection failures in a row trigger rest_vehicle like in apply_command.
+
+    Returns:
+    dict: SyntheticDrive.stats() plus detection failures, rests and the simulation speed.
+    """
+    drive = SyntheticDrive(size, season, weather, speed, seed=seed, max_distance=km * 1000)
+    tracker = LaneTracker(two_sided=True)
+    failures = rests = misses = 0
+
+    t_start = time.perf_counter()
+    while not drive.finished:
+        _, image = drive.grab()
+        mask, resized_image = preprocess_image(image)
+        success, offset, _, _ = tracker.find_driving_path(resized_image, mask, min_pixels=min_pixels)
+
+        if success:
+            misses = 0
+            drive.set_steering(steering_setpoint(offset))
+        else:
+            failures += 1
+            misses += 1
+            if misses >= n_failures:
+                drive.set_steering(0)
+                drive.rest_vehicle()
+                tracker.reset()
+                rests += 1
+                misses = 0
+    elapsed = time.perf_counter() - t_start
+
+    stats = drive.stats()
+    stats.update({
+        'detection_failures': failures,
+        'rests': rests,
+        'wall_s': elapsed,
+        'fps': stats['frames'] / elapsed,
+        'realtime_factor': stats['frames'] * drive.dt / elapsed,
+    })
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Soak test the lane controller on a simulated road.")
+    parser.add_argument('--km', type=float, default=10, help="Distance to drive in kilometers.")
+    parser.add_argument('--speed', type=float, default=60, help="Cruise speed in km/h.")
+    parser.add_argument('--season', default='summer', help="Season of the scene.")
+    parser.add_argument('--weather', default='sun', help="Weather of the scene.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the road profile.")
+    parser.add_argument('--max-departures', type=int, help="Exit with 1 if there are more lane departures.")
+    args = parser.parse_args(argv)
+
+    stats = soak_test(args.km, season=args.season, weather=args.weather, speed=args.speed, seed=args.seed)
+    for key, value in stats.items():
+        print(f"{key:<22}{value:>12.3f}" if isinstance(value, float) else f"{key:<22}{value:>12}")
+
+    if args.max_departures is not None and stats['departures'] > args.max_departures:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+import numpy as np
+import cv2 as cv
+
+# Scene options, named like the arguments of slowroads_utils.update_config_file
+SEASONS = ["summer", "autumn", "spring", "winter"]
+WEATHERS = ["sunrise", "sun", "cloudy", "sunset", "night"]
+
+# Ground color (BGR) per season; winter snow is white enough to pass the marking mask
+GROUND_COLORS = {
+    "summer": (60, 140, 70),
+    "autumn": (40, 110, 170),
+    "spring": (90, 170, 110),
+    "winter": (225, 225, 230),
+}
+
+# Per-channel gain (BGR) and sky color per weather
+WEATHER_GAINS = {
+    "sunrise": (0.80, 0.85, 1.00),
+    "sun": (1.00, 1.00, 1.00),
+    "cloudy": (0.80, 0.80, 0.80),
+    "sunset": (0.60, 0.70, 0.95),
+    "night": (0.30, 0.30, 0.35),
+}
+SKY_COLORS = {
+    "sunrise": (180, 200, 250),
+    "sun": (235, 200, 150),
+    "cloudy": (200, 200, 200),
+    "sunset": (120, 140, 230),
+    "night": (60, 30, 20),
+}
+
+ROAD_COLOR = (90, 90, 90)
+MARKING_COLOR = (235, 235, 235)
+
+
+def lane_geometry(t, size=(640, 360), offset=0.0, curvature=0.0, lane_width=370, horizon=0.45, heading=0.0):
+    """
+    Computes the lane center and half width of the synthetic road at depth t.
+
+    Args:
+    t (np.array): Depth along the road, 0 at the bottom row and 1 at the horizon.
+    size (tuple): Frame size, format (width, height).
+    offset (float): Lateral position of the lane center at the bottom row relative to the image center.
+    curvature (float): Lateral bend of the road at the horizon as a fraction of the frame width.
+    lane_width (int): Lane width in pixels at row 257 of a 360 row frame, like find_driving_path's lane_width.
+    horizon (float): Height of the horizon as a fraction of the frame height.
+    heading (float): Lateral shift of the vanishing point in pixels, e.g. from the vehicle heading.
+
+    Returns:
+    tuple: (y, center, half_width) arrays in pixels.
+    """
+    width, height = size
+    y_horizon = horizon * height
+    y = height - t * (height - y_horizon)
+
+    # Scale the lane so that it is lane_width wide at the row find_driving_path reads by default
+    t_ref = (height - 257 * height / 360) / (height - y_horizon)
+    half_width0 = lane_width * width / 640 / 2 / (1 - t_ref)
+
+    vanishing_x = width / 2 + heading
+    center = (width / 2 + offset) * (1 - t) + vanishing_x * t + curvature * width * t ** 2
+    half_width = half_width0 * (1 - t)
+    return y, center, half_width
+
+
+def make_road_frame(size=(640, 360), season="summer", weather="sun", offset=0.0, curvature=0.0,
+                    lane_width=370, phase=0.0, noise_components=0, noise_sigma=4.0, seed=0):
+    """
+    Renders a deterministic synthetic road frame resembling the SlowRoads view.
+
+    The camera looks down a road with a dashed marking on the left of the lane, a solid
+    edge marking on its right and the road edge further left.
+
+    Args:
+    size (tuple): Frame size, format (width, height).
+    season (str): One of SEASONS, changes the ground color.
+    weather (str): One of WEATHERS, changes the sky color and the overall lighting.
+    offset (float): Lateral lane offset in pixels, see lane_geometry.
+    curvature (float): Road curvature, see lane_geometry.
+    lane_width (int): Lane width in pixels, see lane_geometry.
+    phase (float): Position of the dashes in [0, 1), advance it to animate driving.
+    noise_components (int): Number of small white speckles added as mask noise.
+    noise_sigma (float): Standard deviation of the Gaussian pixel noise.
+    seed (int): Seed of the random generator for the noise.
+
+    Returns:
+    np.array: BGR uint8 image.
+    """
+    if season not in GROUND_COLORS:
+        raise ValueError(f"Invalid season. Select between {SEASONS}")
+    if weather not in WEATHER_GAINS:
+        raise ValueError(f"Invalid weather. Select between {WEATHERS}")
+
+    width, height = size
+    rng = np.random.default_rng(seed)
+    image = np.empty((height, width, 3), dtype=np.uint8)
+
+    # Sky and ground
+    horizon = 0.45
+    y_horizon = int(horizon * height)
+    image[:y_horizon] = SKY_COLORS[weather]
+    image[y_horizon:] = GROUND_COLORS[season]
+
+    # Sample the road at increasing depth, denser near the camera
+    t = 1 - np.linspace(0, 1, 60) ** 0.5
+    t = t[::-1]
+    y, center, half_width = lane_geometry(t, size, offset, curvature, lane_width, horizon)
+
+    left = center - half_width
+    right = center + half_width
+    road_left = center - 3 * half_width
+    road_right = right + 0.15 * half_width
+
+    road = np.concatenate([np.stack([road_left, y], 1), np.stack([road_right, y], 1)[::-1]])
+    cv.fillPoly(image, [np.round(road).astype(np.int32)], ROAD_COLOR)
+
+    # Markings are drawn as quads between consecutive samples, thinner with depth
+    thickness = 0.05 * half_width + 1
+    dashes = ((t * 12 + phase) % 1) < 0.5
+    for i in range(len(t) - 1):
+        for x, solid in ((left, False), (right, True), (road_left, True)):
+            if not solid and not dashes[i]:
+                continue
+            quad = np.array([
+                [x[i] - thickness[i], y[i]], [x[i] + thickness[i], y[i]],
+                [x[i + 1] + thickness[i + 1], y[i + 1]], [x[i + 1] - thickness[i + 1], y[i + 1]],
+            ])
+            cv.fillConvexPoly(image, np.round(quad).astype(np.int32), MARKING_COLOR)
+
+    # Lighting of the weather, applied to the whole frame
+    gain = np.array(WEATHER_GAINS[weather], dtype=np.float32)
+    frame = image.astype(np.float32) * gain
+
+    if noise_sigma > 0:
+        frame += rng.normal(0, noise_sigma, frame.shape).astype(np.float32)
+
+    frame = np.clip(frame, 0, 255).astype(np.uint8)
+
+    # White speckles that survive the color threshold, e.g. snow or reflections
+    if noise_components > 0:
+        ys = rng.integers(0, height, noise_components)
+        xs = rng.integers(0, width, noise_components)
+        frame[ys, xs] = 255
+
+    return frame
+
+
+def make_road_frames(n, size=(640, 360), seed=0, **kwargs):
+    """
+    Renders n frames covering every season and weather with varying offset and curvature.
+
+    Args:
+    n (int): Number of frames.
+    size (tuple): Frame size, format (width, height).
+    seed (int): Seed that determines the scene parameters and noise of all frames.
+    kwargs: Passed on to make_road_frame and override the sampled parameters.
+
+    Returns:
+    list: BGR uint8 images.
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(n):
+        params = {
+            'season': SEASONS[i % len(SEASONS)],
+            'weather': WEATHERS[(i // len(SEASONS)) % len(WEATHERS)],
+            'offset': rng.uniform(-60, 60) * size[0] / 640,
+            'curvature': rng.uniform(-0.3, 0.3),
+            'phase': rng.uniform(0, 1),
+            'seed': int(rng.integers(1 << 31)),
+        }
+        params.update(kwargs)
+        frames.append(make_road_frame(size, **params))
+    return frames
@@ -0,0 +1,78 @@
+import threading
+import time
+
+import numpy as np
+
+from actuator import SteeringActuator, steering_setpoint
+
+
+class KeyLog:
+    """Records key edges and checks that they alternate per key."""
+
+    def __init__(self, delay=0.0):
+        self.events = []
+        self.held = set()
+        self.errors = []
+        self.delay = delay
+
+    def down(self, key):
+        if key in self.held:
+            self.errors.append(('down twice', key))
+        time.sleep(self.delay)  # Widens the window in which another thread could interleave
+        self.held.add(key)
+        self.events.append(('down', key))
+
+    def up(self, key):
+        if key not in self.held:
+            self.errors.append(('up twice', key))
+        time.sleep(self.delay)
+        self.held.discard(key)
+        self.events.append(('up', key))
+
+
+def test_duty_cycle_follows_setpoint():
+    log = KeyLog()
+    actuator = SteeringActuator(log.down, log.up, period=0.2)
+    actuator.set_setpoint(0.5)
+    t0 = actuator._t_setpoint
+
+    actuator.update(t0 + 0.05)
+    assert log.held == {SteeringActuator.RIGHT}
+    actuator.update(t0 + 0.15)
+    assert log.held == set()
+
+    actuator.set_setpoint(-0.5)
+    actuator.update()
+    assert log.held == {SteeringActuator.LEFT}
+    actuator.release()
+    assert log.held == set() and actuator.setpoint == 0.0
+
+
+def test_release_from_other_thread_never_leaves_a_key_held():
+    log = KeyLog(delay=0.0005)
+    actuator = SteeringActuator(log.down, log.up, period=0.004)
+    stop = threading.Event()
+
+    def control():
+        while not stop.is_set():
+            actuator.update()
+
+    thread = threading.Thread(target=control)
+    thread.start()
+    for i in range(200):
+        actuator.set_setpoint(0.6 if i % 2 else -0.6)
+        time.sleep(0.001)
+        actuator.release()
+    stop.set()
+    thread.join()
+    actuator.release()
+
+    assert log.errors == []
+    assert log.held == set()
+
+
+def test_steering_setpoint_is_vectorized():
+    offsets = np.array([-200, -10, 0, 15, 200])
+    expected = [steering_setpoint(o) for o in offsets]
+    np.testing.assert_allclose(steering_setpoint(offsets), expected)
+    assert steering_setpoint(0) == 0.0
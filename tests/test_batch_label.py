@@ -0,0 +1,40 @@
+import json
+import os
+
+import cv2 as cv
+
+from batch_label import MANIFEST, label_directory, read_manifest
+from synthetic_frames import make_road_frames
+
+
+def manifest_entries(output_dir):
+    with open(os.path.join(output_dir, MANIFEST)) as file:
+        return [json.loads(line) for line in file]
+
+
+def test_read_manifest_skips_failed_and_truncated_entries(tmp_path):
+    with open(tmp_path / MANIFEST, 'w') as file:
+        file.write(json.dumps({'path': 'a.png', 'found': True}) + "\n")
+        file.write(json.dumps({'path': 'b.png', 'error': 'unreadable'}) + "\n")
+        file.write('{"path": "c.p')
+    assert read_manifest(tmp_path) == {'a.png'}
+
+
+def test_resume_retries_failed_frames(tmp_path):
+    input_dir, output_dir = tmp_path / 'in', tmp_path / 'out'
+    input_dir.mkdir()
+    good, retried = make_road_frames(2)
+    cv.imwrite(str(input_dir / 'summer_sun_1.png'), good)
+    (input_dir / 'summer_sun_2.png').write_bytes(b'not a png')
+
+    label_directory(str(input_dir), str(output_dir), workers=1)
+    assert {e['path'] for e in manifest_entries(output_dir) if 'error' in e} == {'summer_sun_2.png'}
+    assert read_manifest(output_dir) == {'summer_sun_1.png'}
+
+    cv.imwrite(str(input_dir / 'summer_sun_2.png'), retried)
+    label_directory(str(input_dir), str(output_dir), workers=1, resume=True)
+    entries = manifest_entries(output_dir)
+    assert sorted(e['path'] for e in entries) == ['summer_sun_1.png', 'summer_sun_2.png', 'summer_sun_2.png']
+    assert entries[-1]['path'] == 'summer_sun_2.png' and 'error' not in entries[-1]
+    assert read_manifest(output_dir) == {'summer_sun_1.png', 'summer_sun_2.png'}
+    assert (output_dir / 'masks' / 'summer_sun_2.png').exists()
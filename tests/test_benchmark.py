@@ -0,0 +1,35 @@
+import json
+
+import numpy as np
+
+import benchmark_lane_pipeline as benchmark
+from synthetic_frames import make_road_frames
+
+QUICK = ['--sizes', '640x360', '--frames', '2', '--repeat', '3', '--components', '0']
+
+
+def test_same_seed_gives_same_frames():
+    first, second = make_road_frames(6, seed=5), make_road_frames(6, seed=5)
+    assert all(np.array_equal(a, b) for a, b in zip(first, second))
+    assert not all(np.array_equal(a, b) for a, b in zip(first, make_road_frames(6, seed=6)))
+
+    masks = benchmark.noise_masks(100, seed=5)
+    assert all(np.array_equal(a, b) for a, b in zip(masks, benchmark.noise_masks(100, seed=5)))
+
+
+def test_compare_reports_cases_slower_than_tolerance():
+    results = {'fast': {'fps': 95.0}, 'slow': {'fps': 70.0}, 'new': {'fps': 1.0}}
+    baseline = {'fast': {'fps': 100.0}, 'slow': {'fps': 100.0}, 'removed': {'fps': 100.0}}
+    assert benchmark.compare(results, baseline, 0.2) == [('slow', 100.0, 70.0)]
+    assert benchmark.compare(results, baseline, 0.01) == [('fast', 100.0, 95.0), ('slow', 100.0, 70.0)]
+    assert benchmark.compare(results, baseline, 0.5) == []
+
+
+def test_main_fails_on_regression_past_tolerance(tmp_path, capsys):
+    path = tmp_path / 'baseline.json'
+    path.write_text(json.dumps({'components/0': {'fps': 1e12}}))
+    assert benchmark.main(QUICK + ['--baseline', str(path)]) == 1
+    assert 'Regression in components/0' in capsys.readouterr().out
+
+    path.write_text(json.dumps({'components/0': {'fps': 1e-3}}))
+    assert benchmark.main(QUICK + ['--baseline', str(path)]) == 0
@@ -0,0 +1,37 @@
+import shutil
+
+import pytest
+from selenium.common.exceptions import TimeoutException
+
+from slowroads_utils import open_browser, stand_in_url, wait_for
+
+requires_chrome = pytest.mark.skipif(
+    not any(shutil.which(name) for name in ('google-chrome', 'google-chrome-stable', 'chromium', 'chromium-browser', 'chrome')),
+    reason="Chrome is not installed",
+)
+
+
+def test_wait_for_raises_on_timeout():
+    with pytest.raises(TimeoutException, match='never ready'):
+        wait_for(object(), lambda driver: False, timeout=0.1, name='never ready')
+
+
+def test_wait_for_returns_condition_value():
+    assert wait_for(object(), lambda driver: 42, timeout=0.1) == 42
+
+
+@requires_chrome
+def test_open_browser_stand_in():
+    timings = {}
+    driver = open_browser(size=(640, 360), url=stand_in_url(delay=200), timeout=20, timings=timings)
+    try:
+        assert set(timings) >= {'launch', 'navigate', 'splash', 'canvas', 'cruise_ui'}
+    finally:
+        driver.quit()
+
+
+@requires_chrome
+def test_open_browser_raises_when_not_ready():
+    # The stand-in keeps its splash screen loading for longer than the timeout
+    with pytest.raises(TimeoutException, match='splash screen'):
+        open_browser(size=(640, 360), url=stand_in_url(delay=30000), timeout=1)
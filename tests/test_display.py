@@ -0,0 +1,49 @@
+import pickle
+import queue
+import sys
+
+import numpy as np
+
+import display as display_module
+from display import Display, OpenCVBackend
+from lane_detection_utils import OverlayRenderer, find_driving_path
+
+
+def detection_overlay(renderer):
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (360, 640, 3), dtype=np.uint8)
+    mask = np.zeros((360, 640), dtype=np.uint8)
+    mask[:, 120:126] = 1
+    success, _, overlay, _ = find_driving_path(image, mask, draw=renderer)
+    assert success
+    return overlay
+
+
+def test_opencv_backend_shows_bgr_overlay_unchanged(monkeypatch):
+    shown = []
+    monkeypatch.setattr(display_module.cv, 'imshow', lambda name, canvas: shown.append(canvas.copy()))
+    monkeypatch.setattr(display_module.cv, 'waitKey', lambda delay: -1)
+
+    backend = OpenCVBackend(panel_height=24)
+    image = np.asarray(detection_overlay(True))
+    backend.draw(image, {'offset': 3})
+    assert np.array_equal(shown[0][24:], image)
+    assert backend.main_thread == (sys.platform == 'darwin')
+
+
+def test_process_mode_sends_overlay_unrendered():
+    renderer = OverlayRenderer()
+    overlay = detection_overlay(renderer)
+
+    # A started process display, without the process
+    display = Display('opencv', process=True)
+    display.worker = object()
+    display._queue = queue.Queue(maxsize=2)
+
+    display.show(overlay, {'offset': 3})
+    assert renderer.rendered == 0  # Nothing was drawn on the caller's thread
+
+    sent, stats_dict = display._queue.get_nowait()
+    received = pickle.loads(pickle.dumps(sent))
+    assert stats_dict == {'offset': 3}
+    assert np.array_equal(received.render(), overlay.render())
@@ -0,0 +1,137 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+
+from conftest import SRC_DIR
+from display import Display
+from frame_bus import FrameBus, FrameReader
+from lane_detection_utils import OverlayRenderer, find_driving_path
+from recorder import SessionRecorder
+
+
+class RecordingBackend:
+    """Display backend that keeps copies of the drawn images."""
+
+    main_thread = True
+
+    def __init__(self):
+        self.images = []
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def draw(self, image, stats_dict):
+        self.images.append(image.copy())
+
+
+def publish_n(bus, n, start=0):
+    return [bus.publish(np.full(bus.shape, start + i, dtype=np.uint8)) for i in range(n)]
+
+
+def test_frames_expire_when_slot_is_reused():
+    bus = FrameBus((4, 6, 3), n_slots=2)
+    reader = FrameReader(bus)
+    try:
+        first, = publish_n(bus, 1)
+        assert reader.next(timeout=0).image[0, 0, 0] == 0
+        assert first.valid()
+
+        publish_n(bus, 2, start=1)
+        assert not first.valid()
+        frame = reader.next(timeout=0)
+        assert frame.image[0, 0, 0] == 2 and reader.stats() == {'read': 2, 'skipped': 1}
+        assert reader.next(timeout=0) is None
+    finally:
+        bus.close()
+
+
+def test_overlay_of_reused_slot_is_not_drawn():
+    bus = FrameBus((360, 640, 3), n_slots=2)
+    try:
+        frame, = publish_n(bus, 1)
+        mask = np.zeros((360, 640), dtype=np.uint8)
+        mask[:, 120:126] = 1
+        success, _, overlay, _ = find_driving_path(frame.image, mask, draw=OverlayRenderer())
+        assert success
+        overlay.source = frame
+
+        backend = RecordingBackend()
+        display = Display(backend, max_fps=0)
+        publish_n(bus, 2, start=1)  # The capture moves on before the display draws
+        display.show(overlay, {'offset': 0})
+        display.poll(0)
+        assert backend.images == [] and display.stats()['expired'] == 1
+        assert overlay.render() is None
+
+        frame = bus.latest()
+        _, _, overlay, _ = find_driving_path(frame.image, mask, draw=OverlayRenderer())
+        overlay.source = frame
+        display.show(overlay, {'offset': 0})
+        display.poll(0)
+        assert len(backend.images) == 1
+    finally:
+        bus.close()
+
+
+def test_recorder_copies_bus_frames_with_capture_time(tmp_path):
+    bus = FrameBus((4, 6, 3), n_slots=2)
+    recorder = SessionRecorder(str(tmp_path / 'session'))
+    try:
+        frame = bus.publish(np.full((4, 6, 3), 7, dtype=np.uint8), timestamp=12.5)
+        assert recorder.record(frame, success=True)
+        publish_n(bus, 2)
+        assert not recorder.record(frame, success=True)  # Slot reused before it was copied
+        recorder.close()
+        assert recorder.stats()['written'] == 1 and recorder.stats()['expired'] == 1
+    finally:
+        bus.close()
+
+    from frame_sources import ReplayFrameSource
+    source = ReplayFrameSource(str(tmp_path / 'session'))
+    success, image = source.grab()
+    assert success and (image == 7).all()
+    assert source.index[0]['t'] == 12.5
+    source.close()
+
+
+def test_spawned_consumer_leaves_block_to_producer(tmp_path):
+    code = textwrap.dedent("""
+        import multiprocessing, os
+        import numpy as np
+        from frame_bus import FrameBus, FrameReader
+
+        def consume(name, seq, result):
+            bus = FrameBus.attach(name)
+            frame = bus.latest()
+            result.value = int(frame.image[0, 0, 0]) if frame is not None and frame.seq == seq else -1
+            del frame
+            bus.close()
+
+        if __name__ == '__main__':
+            bus = FrameBus((4, 6, 3), n_slots=2)
+            frame = bus.publish(np.full((4, 6, 3), 9, dtype=np.uint8))
+            context = multiprocessing.get_context('spawn')
+            result = context.Value('i', 0)
+            child = context.Process(target=consume, args=(bus.name, frame.seq, result))
+            child.start()
+            child.join()
+            assert child.exitcode == 0 and result.value == 9, (child.exitcode, result.value)
+            assert bus.latest() is not None  # Still mapped after the consumer exited
+            name = bus.name
+            del frame
+            bus.close()
+            print(os.path.exists('/dev/shm/' + name))
+    """)
+    script = tmp_path / 'consumer.py'
+    script.write_text(code)
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    result = subprocess.run([sys.executable, str(script)], cwd=SRC_DIR, env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() in ('False', '')
+    assert 'resource_tracker' not in result.stderr and 'KeyError' not in result.stderr, result.stderr
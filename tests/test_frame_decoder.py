@@ -0,0 +1,24 @@
+import cv2 as cv
+import numpy as np
+
+from frame_decoder import FrameDecoder
+from lane_detection_utils import preprocess_image
+from synthetic_frames import make_road_frame
+
+
+def test_decoded_frames_feed_preprocess_image():
+    frame = make_road_frame((1280, 720), weather='sun')
+    data = np.frombuffer(cv.imencode('.jpg', frame, [cv.IMWRITE_JPEG_QUALITY, 95])[1], np.uint8)
+    decoder = FrameDecoder((640, 360))
+
+    first = decoder.decode(data).copy()
+    second = decoder.decode(data)
+    assert decoder.reduce == 2 and decoder.last_reduce == 2  # libjpeg scales from the second frame on
+    for image in (first, second):
+        assert image.shape == (360, 640, 3)
+        mask, resized = preprocess_image(image)
+        assert mask.any()
+
+    # The reduced decode agrees with a full decode and resize up to JPEG scaling differences
+    expected = cv.resize(cv.imdecode(data, cv.IMREAD_COLOR), (640, 360), interpolation=cv.INTER_AREA)
+    assert np.abs(second.astype(int) - expected).mean() < 4
@@ -0,0 +1,129 @@
+import base64
+import json
+import os
+import queue
+import subprocess
+import sys
+
+import cv2 as cv
+import numpy as np
+import pytest
+
+import frame_sources
+from conftest import SRC_DIR
+from frame_sources import FrameArchiveWriter, FrameSource, ReplayFrameSource, ScreencastFrameSource
+
+
+def test_headless_modules_import_without_a_display():
+    env = {k: v for k, v in os.environ.items() if k not in ('DISPLAY', 'PYNPUT_BACKEND', 'WAYLAND_DISPLAY')}
+    code = "import frame_sources, recorder, synthetic_drive, parameter_sweep, scene_farm, slowroads_sim"
+    result = subprocess.run([sys.executable, '-c', code], cwd=SRC_DIR, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+def test_replay_returns_recorded_frames(tmp_path):
+    path = str(tmp_path / 'session')
+    frames = [np.full((4, 6, 3), i, dtype=np.uint8) for i in range(3)]
+    with FrameArchiveWriter(path) as writer:
+        for i, frame in enumerate(frames):
+            writer.write(frame, timestamp=i, compression=1 if i == 1 else None, offset=i)
+
+    source = ReplayFrameSource(path)
+    replayed = [source.grab() for _ in range(4)]
+    source.close()
+
+    assert [success for success, _ in replayed] == [True, True, True, False]
+    for frame, (_, image) in zip(frames, replayed):
+        np.testing.assert_array_equal(image, frame)
+    assert source.finished
+
+
+def test_frame_source_requires_grab():
+    class Incomplete(FrameSource):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+class FakeDevToolsSocket:
+    """Websocket stand-in: recv returns the pushed messages, send records the sent commands."""
+
+    def __init__(self):
+        self.incoming = queue.Queue()
+        self.sent = []
+
+    def push_frame(self, image, session_id):
+        data = base64.b64encode(cv.imencode('.png', image)[1].tobytes()).decode()
+        self.incoming.put({'method': 'Page.screencastFrame', 'params': {'data': data, 'sessionId': session_id}})
+
+    def recv(self):
+        message = self.incoming.get(timeout=5)
+        if message is None:
+            raise ConnectionError("closed")
+        return json.dumps(message)
+
+    def send(self, message):
+        self.sent.append(json.loads(message))
+
+    def close(self):
+        self.incoming.put(None)
+
+    def methods(self):
+        return [m['method'] for m in self.sent]
+
+
+@pytest.fixture
+def devtools(monkeypatch):
+    ws = FakeDevToolsSocket()
+    monkeypatch.setattr(frame_sources.websocket, 'create_connection', lambda url, **kwargs: ws)
+    monkeypatch.setattr(ScreencastFrameSource, '_page_websocket_url', staticmethod(lambda driver: 'ws://fake'))
+    return ws
+
+
+def test_screencast_acks_and_decodes_newest_frame(devtools):
+    source = ScreencastFrameSource(driver=None, timeout=0.5)
+    assert devtools.sent[0]['method'] == 'Page.startScreencast'
+    assert source.grab() == (False, None)  # Nothing arrived yet
+    assert not source.finished
+
+    frames = [np.full((8, 12, 3), 40 * i, dtype=np.uint8) for i in range(1, 4)]
+    for i, frame in enumerate(frames):
+        devtools.push_frame(frame, session_id=i)
+    devtools.incoming.put({'method': 'Page.frameNavigated', 'params': {}})  # Other events are ignored
+    devtools.push_frame(frames[-1], session_id=99)
+
+    # Every frame is acknowledged with its session id, in order
+    for _ in range(100):
+        acks = [m['params']['sessionId'] for m in devtools.sent if m['method'] == 'Page.screencastFrameAck']
+        if len(acks) == 4:
+            break
+        source._thread.join(0.01)
+    assert acks == [0, 1, 2, 99]
+
+    # grab returns only the newest frame, and nothing until another one arrives
+    success, image = source.grab()
+    assert success and np.array_equal(image, frames[-1])
+    assert source.grab() == (False, None)
+
+    source.close()
+    source._thread.join(1)
+    assert source.finished
+    assert devtools.methods()[-1] == 'Page.stopScreencast'
+    assert source.grab() == (False, None)
+
+
+def test_screencast_finishes_when_connection_drops(devtools):
+    source = ScreencastFrameSource(driver=None, timeout=5)
+    devtools.close()
+    source._thread.join(1)
+    assert source.finished
+    assert source.grab() == (False, None)  # Returns at once instead of waiting for the timeout
+
+
+def test_screencast_decodes_to_decode_size(devtools):
+    source = ScreencastFrameSource(driver=None, timeout=1, decode_size=(6, 4))
+    devtools.push_frame(np.full((8, 12, 3), 200, dtype=np.uint8), session_id=1)
+    success, image = source.grab()
+    source.close()
+    assert success and image.shape == (4, 6, 3)
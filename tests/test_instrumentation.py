@@ -0,0 +1,109 @@
+import json
+import threading
+
+import numpy as np
+import pytest
+
+import instrumentation
+from instrumentation import SpanStats
+
+
+@pytest.fixture(autouse=True)
+def clean_spans():
+    instrumentation.reset()
+    instrumentation.enable()
+    yield
+    instrumentation.disable()
+    instrumentation.reset()
+
+
+def test_percentiles_of_known_durations():
+    for ms in range(1, 101):
+        instrumentation.record('known', ms * 1e-3)
+    summary = instrumentation.snapshot()['known']
+    assert summary['count'] == 100
+    assert summary['mean_ms'] == pytest.approx(50.5)
+    assert summary['p50_ms'] == pytest.approx(50.5)
+    assert summary['p95_ms'] == pytest.approx(95.05)
+    assert summary['p99_ms'] == pytest.approx(99.01)
+    assert summary['max_ms'] == pytest.approx(100.0)
+
+
+def test_ring_buffer_keeps_most_recent_durations():
+    stats = SpanStats('ring', size=4)
+    for duration in (1.0, 1.0, 1.0, 0.001, 0.002, 0.003, 0.004):
+        stats.add(duration)
+    summary = stats.summary()
+    assert summary['count'] == 7  # All calls are counted, the percentiles cover the last 4
+    assert summary['max_ms'] == pytest.approx(4.0)
+    assert summary['mean_ms'] == pytest.approx(2.5)
+    assert SpanStats('empty').summary() == {'count': 0}
+
+
+def test_disabled_instrumentation_records_nothing():
+    @instrumentation.timed('timed')
+    def work(x):
+        return 2 * x
+
+    instrumentation.disable()
+    assert instrumentation.span('span') is instrumentation.span('other')  # Shared no-op, nothing allocated
+    with instrumentation.span('span'):
+        pass
+    assert work(3) == 6
+    instrumentation.record('recorded', 1.0)
+    assert instrumentation.snapshot() == {}
+
+    instrumentation.enable()
+    with instrumentation.span('span'):
+        pass
+    assert work(3) == 6
+    assert {name: s['count'] for name, s in instrumentation.snapshot().items()} == {'span': 1, 'timed': 1}
+
+
+def test_snapshot_is_sorted_and_formatted():
+    instrumentation.record('b', 0.002)
+    instrumentation.record('a', 0.001)
+    snap = instrumentation.snapshot()
+    assert list(snap) == ['a', 'b']
+    lines = instrumentation.format_snapshot(snap).splitlines()
+    assert len(lines) == 2 and lines[0].strip().startswith('a: n=1')
+
+
+def test_dump_json_creates_directory_and_leaves_no_temp_file(tmp_path):
+    path = tmp_path / 'logs' / 'timings.json'
+    instrumentation.record('span', 0.005)
+    instrumentation.dump_json(str(path))
+    data = json.loads(path.read_text())
+    assert data['spans']['span']['p50_ms'] == pytest.approx(5.0)
+    assert [p.name for p in path.parent.iterdir()] == ['timings.json']
+
+
+def test_periodic_dump_until_stopped(tmp_path):
+    path = tmp_path / 'timings.json'
+    instrumentation.record('span', 0.001)
+    stop_event = threading.Event()
+    thread = instrumentation.start_periodic_dump(str(path), 0.01, stop_event)
+    try:
+        for _ in range(200):
+            if path.exists():
+                break
+            stop_event.wait(0.01)
+        assert 'span' in json.loads(path.read_text())['spans']
+    finally:
+        stop_event.set()
+        thread.join(1.0)
+    assert not thread.is_alive()
+
+
+def test_concurrent_spans_are_all_counted():
+    def work():
+        for _ in range(500):
+            with instrumentation.span('threads'):
+                np.zeros(1)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert instrumentation.snapshot()['threads']['count'] == 2000
@@ -0,0 +1,130 @@
+import cv2 as cv
+import numpy as np
+import pytest
+
+import instrumentation
+from lane_detection_utils import find_driving_path, find_lane_curve, preprocess_image, remove_small_components, scanline_band
+from synthetic_frames import make_road_frames
+
+
+def remove_small_components_per_label(image, min_size=90):
+    """The original implementation: one full-frame comparison and sum per label."""
+    num_labels, labels_im = cv.connectedComponents(image)
+    output = np.zeros_like(image)
+    for label in range(1, num_labels):
+        component = labels_im == label
+        if np.sum(component) > min_size:
+            output[component] = 255
+    return output
+
+
+def test_find_driving_path_records_total_span():
+    mask = np.zeros((360, 640), dtype=np.uint8)
+    mask[:, 120:126] = 1
+    image = np.zeros((360, 640, 3), dtype=np.uint8)
+
+    instrumentation.reset()
+    instrumentation.enable()
+    try:
+        success, _, _, _ = find_driving_path(image, mask, draw=False)
+    finally:
+        instrumentation.disable()
+    assert success
+    assert instrumentation.snapshot()['detect.total']['count'] == 1
+
+
+@pytest.mark.parametrize('density', [0.02, 0.2, 0.45])
+def test_remove_small_components_matches_per_label_loop(density):
+    rng = np.random.default_rng(int(density * 100))
+    image = np.where(rng.random((120, 200)) < density, 255, 0).astype(np.uint8)
+    image = cv.dilate(image, np.ones((3, 3), np.uint8), iterations=int(density < 0.1))
+    for min_size in (0, 9, 90):
+        assert np.array_equal(remove_small_components(image, min_size), remove_small_components_per_label(image, min_size))
+
+
+def test_remove_small_components_keeps_only_larger_than_min_size():
+    image = np.zeros((40, 40), dtype=np.uint8)
+    image[0:9, 0:10] = 255    # 90 pixels, removed
+    image[20:29, 20:31] = 255  # 99 pixels, kept
+    result = remove_small_components(image, 90)
+    assert not result[0:9, 0:10].any() and (result[20:29, 20:31] == 255).all()
+    assert np.array_equal(result, remove_small_components_per_label(image, 90))
+
+
+@pytest.mark.parametrize('size', [(640, 360), (1280, 720)])
+def test_roi_preprocessing_matches_full_frame(size):
+    ymin, ymax = 250, 265
+    y0, y1 = scanline_band(ymin, ymax, 360)
+    found = 0
+    for frame in make_road_frames(20, size=size, noise_components=300):
+        mask, resized = preprocess_image(frame)
+        band_mask, band = preprocess_image(frame, roi=(y0, y1))
+        assert band_mask.shape == (y1 - y0, 640)
+        assert np.array_equal(band_mask[ymin - y0:ymax - y0], mask[ymin:ymax])
+
+        full = find_driving_path(resized, mask, ymin, ymax, min_pixels=60, draw=False)
+        roi = find_driving_path(band, band_mask, ymin, ymax, min_pixels=60, draw=False, roi_offset=y0)
+        assert full[0] == roi[0] and full[1] == roi[1]
+        assert full[3] == roi[3]
+        found += full[0]
+    assert found > 0
+
+
+@pytest.mark.parametrize('dash_rows', [(200, 253), (262, 300), (120, 242)])
+def test_roi_keeps_dash_that_ends_inside_the_band(dash_rows):
+    # A dash that is large on the full frame but small inside the band must not be removed as noise
+    ymin, ymax = 250, 265
+    y0, y1 = scanline_band(ymin, ymax, 360)
+    frame = np.full((360, 640, 3), 60, dtype=np.uint8)
+    frame[dash_rows[0]:dash_rows[1], 100:106] = 255
+    frame[300:303, 400:403] = 255  # Small speck far from the band, noise on both paths
+
+    mask, _ = preprocess_image(frame)
+    band_mask, _ = preprocess_image(frame, roi=(y0, y1))
+    assert np.array_equal(band_mask, mask[y0:y1])
+    assert band_mask[:, 100:106].sum() == mask[y0:y1, 100:106].sum() > 0
+
+
+def band_positions_per_band(mask, ymin=200, ymax=350, band_height=15, min_pixels=55, prev_center=320):
+    """find_lane_curve's band positions, with find_driving_path's stripe search run per band."""
+    positions = []
+    for y in range(ymin, ymin + (ymax - ymin) // band_height * band_height, band_height):
+        stripe = mask[y:y + band_height, :prev_center][:, ::-1]
+        cumsum = np.cumsum(np.sum(stripe, axis=0))
+        index = np.argmax(cumsum > min_pixels)
+        _, x = np.nonzero(stripe[:, :index])
+        positions.append(prev_center - x.mean() if cumsum[-1] > min_pixels and len(x) else np.nan)
+    return np.array(positions)
+
+
+def curved_marking_mask(c, b, a, y_ref=257, size=(640, 360), width=5):
+    """Mask with a left marking at x(y) = c + b * (y - y_ref) + a * (y - y_ref)^2."""
+    mask = np.zeros(size[::-1], dtype=np.uint8)
+    for y in range(size[1]):
+        x = int(round(c + b * (y - y_ref) + a * (y - y_ref) ** 2))
+        mask[y, max(x, 0):max(x + width, 0)] = 1
+    return mask
+
+
+@pytest.mark.parametrize('c, b, a', [(140, 0.0, 0.0), (150, -0.4, 0.0), (120, 0.3, 2e-3)])
+def test_find_lane_curve_recovers_offset_and_heading(c, b, a):
+    mask = curved_marking_mask(c, b, a)
+    success, offset, _, stats = find_lane_curve(None, mask, draw=False)
+    assert success
+    # The marking position is the mean over its width, 2 px right of its left edge
+    assert abs(stats['marking_x'] - (c + 2)) <= 2
+    assert abs(offset - (c + 2 + 370 // 2 - 320)) <= 2
+    assert stats['heading'] == pytest.approx(np.arctan(-b), abs=0.03)
+    assert stats['curvature'] == pytest.approx(2 * a, abs=1e-3)
+    assert np.allclose(stats['band_x'], band_positions_per_band(mask), equal_nan=True)
+
+
+def test_find_lane_curve_band_positions_match_per_band_search():
+    compared = 0
+    for frame in make_road_frames(12, size=(640, 360), noise_components=100):
+        mask, resized = preprocess_image(frame)
+        _, _, _, stats = find_lane_curve(resized, mask, min_pixels=60, draw=False)
+        expected = band_positions_per_band(mask, min_pixels=60)
+        assert np.allclose(stats['band_x'], expected, equal_nan=True)
+        compared += np.count_nonzero(~np.isnan(expected))
+    assert compared > 0
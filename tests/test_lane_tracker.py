@@ -0,0 +1,66 @@
+import numpy as np
+
+from lane_detection_utils import find_lane_markings
+from lane_tracker import LaneTracker
+
+
+def lane_mask(left, right, size=(360, 640), thickness=6):
+    """Binary mask with two vertical markings starting at columns left and right."""
+    mask = np.zeros(size, dtype=np.uint8)
+    mask[:, left:left + thickness] = 1
+    mask[:, right:right + thickness] = 1
+    return mask
+
+
+def test_markings_full_window_matches_default():
+    mask = lane_mask(120, 500)
+    assert find_lane_markings(mask, center=310, search_window=(0, 640)) == find_lane_markings(mask, center=310)
+
+
+def test_markings_window_excludes_outside_columns():
+    # A stray marking near the center is ignored when the window starts past it
+    mask = lane_mask(125, 495)
+    mask[:, 300:306] = 1
+    left_x, right_x, _ = find_lane_markings(mask, center=310, search_window=(0, 640))
+    assert 300 <= left_x < 306
+    left_x, right_x, _ = find_lane_markings(mask, center=310, search_window=(145, 225))
+    assert 125 <= left_x < 131 and 495 <= right_x < 501
+
+
+def test_two_sided_tracks_with_search_window():
+    tracker = LaneTracker(two_sided=True)
+    mask = lane_mask(125, 495)
+    image = np.zeros(mask.shape + (3,), dtype=np.uint8)
+
+    success, _, _, stats = tracker.find_driving_path(image, mask, draw=False)
+    assert success and stats['search_width'] is None  # No track yet, full search
+
+    success, _, _, stats = tracker.find_driving_path(image, mask, draw=False)
+    assert success and stats['search_width'] == 2 * tracker.window
+    assert 125 <= stats['marking_x'] < 131 and 495 <= stats['right_marking_x'] < 501
+
+    # A miss doubles the window
+    tracker.find_driving_path(image, np.zeros_like(mask), draw=False)
+    _, _, _, stats = tracker.find_driving_path(image, mask, draw=False)
+    assert stats['search_width'] == 4 * tracker.window
+
+
+def test_passed_lane_width_only_initializes_estimate():
+    tracker = LaneTracker(two_sided=True, width_alpha=0.5)
+    mask = lane_mask(125, 495)
+    image = np.zeros(mask.shape + (3,), dtype=np.uint8)
+
+    _, _, _, stats = tracker.find_driving_path(image, mask, lane_width=300, draw=False)
+    measured = stats['measured_width']
+    assert tracker.lane_width == 300 + 0.5 * (measured - 300)
+    for _ in range(10):
+        tracker.find_driving_path(image, mask, lane_width=300, draw=False)
+    assert abs(tracker.lane_width - measured) < 1
+
+
+def test_one_sided_lane_width_is_fixed():
+    tracker = LaneTracker()
+    mask = lane_mask(125, 495)
+    image = np.zeros(mask.shape + (3,), dtype=np.uint8)
+    tracker.find_driving_path(image, mask, lane_width=350, draw=False)
+    assert tracker.lane_width == 350
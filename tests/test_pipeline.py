@@ -0,0 +1,141 @@
+import threading
+import time
+
+from pipeline import LatestValueQueue, PipelineStage, RateScheduler, StageMetrics
+
+
+def test_latest_value_wins():
+    queue = LatestValueQueue()
+    for i in range(3):
+        queue.put(i)
+    item, age = queue.get(timeout=0)
+    assert item == 2 and age >= 0
+    assert queue.dropped == 2
+    assert queue.get(timeout=0) == (None, None)
+
+
+def test_bounded_queue_keeps_newest_items_in_order():
+    queue = LatestValueQueue(maxsize=2)
+    for i in range(5):
+        queue.put(i)
+    assert len(queue) == 2 and queue.dropped == 3
+    assert [queue.get(timeout=0)[0] for _ in range(2)] == [3, 4]
+
+
+def test_stale_items_are_dropped_on_get():
+    queue = LatestValueQueue(max_age=0.02)
+    queue.put('old')
+    time.sleep(0.05)
+    assert queue.get(timeout=0) == (None, None)
+    assert queue.dropped == 1
+
+    queue.put('fresh')
+    assert queue.get(timeout=0)[0] == 'fresh'
+
+
+def test_get_waits_for_put_from_other_thread():
+    queue = LatestValueQueue()
+    threading.Timer(0.05, queue.put, args=('item',)).start()
+    t0 = time.perf_counter()
+    item, age = queue.get(timeout=1.0)
+    assert item == 'item' and age < 0.05
+    assert 0.03 < time.perf_counter() - t0 < 1.0
+
+
+def test_stage_metrics_queue_age():
+    metrics = StageMetrics('detect')
+    for duration, age in ((0.01, 0.002), (0.03, 0.006), (0.02, None)):
+        metrics.record(duration, age)
+    snapshot = metrics.snapshot()
+    assert snapshot['stage'] == 'detect' and snapshot['count'] == 3
+    assert abs(snapshot['latency_ms'] - 20.0) < 1e-9
+    # Averaged over all items, those without an input queue count as zero age
+    assert abs(snapshot['queue_age_ms'] - 8.0 / 3) < 1e-9
+    assert abs(snapshot['queue_age_max_ms'] - 6.0) < 1e-9
+
+    metrics.reset()
+    assert metrics.snapshot()['count'] == 0 and metrics.snapshot()['queue_age_max_ms'] == 0.0
+
+
+def test_pipeline_stage_passes_latest_items_on():
+    run_event, exit_event = threading.Event(), threading.Event()
+    source, sink = LatestValueQueue(), LatestValueQueue(maxsize=10)
+    stage = PipelineStage('double', lambda x: None if x < 0 else 2 * x, run_event, exit_event,
+                          input_queue=source, output_queues=[sink], poll_interval=0.01)
+    stage.start()
+    try:
+        source.put(1)
+        source.put(2)  # Replaces 1 before the paused stage reads it
+        time.sleep(0.03)
+        assert len(sink) == 0
+
+        run_event.set()
+        assert sink.get(timeout=1.0)[0] == 4
+        source.put(-1)  # No result, nothing is passed on
+        source.put(3)
+        assert sink.get(timeout=1.0)[0] == 6
+    finally:
+        exit_event.set()
+        stage.join(1.0)
+
+    assert not stage.is_alive()
+    stats = stage.stats()
+    # Every item was either processed or dropped, -1 may have been replaced by 3 before it was read
+    assert stats['count'] + stats['dropped'] == 4 and stats['dropped'] in (1, 2)
+
+
+def run_scheduler(scheduler, tick, n):
+    """Runs the scheduler until tick has been called n times, returns the late flags of the ticks."""
+    flags = []
+
+    def counted(late):
+        flags.append(late)
+        tick(len(flags))
+        if len(flags) == n:
+            scheduler.exit_event.set()
+
+    scheduler.run(counted)
+    return flags
+
+
+def scheduler(rate, **kwargs):
+    run_event = threading.Event()
+    run_event.set()
+    return RateScheduler(rate, run_event, threading.Event(), **kwargs)
+
+
+def test_overrun_skips_deadlines_and_marks_next_tick_late():
+    s = scheduler(50)  # 20 ms period
+
+    def tick(i):
+        if i == 3:
+            time.sleep(0.07)  # Runs over the next 3 deadlines
+
+    flags = run_scheduler(s, tick, 6)
+    stats = s.stats()
+    assert stats['count'] == 6
+    assert stats['overruns'] == 1
+    assert 3 <= stats['missed'] <= 4  # 3 deadlines, one more under timer slop
+    assert flags[3]  # The tick after the overrun sheds optional work
+    assert stats['late'] >= 1
+    assert stats['latency_ms'] >= 70 / 6
+
+
+def test_jitter_past_late_after_marks_tick_late():
+    s = scheduler(50, late_after=0.0)
+    flags = run_scheduler(s, lambda i: None, 5)
+    assert flags[0] is False  # The first tick starts at its deadline
+    stats = s.stats()
+    assert stats['late'] == sum(flags)
+    assert stats['overruns'] == 0 and stats['missed'] == 0
+    assert 0.0 <= stats['jitter_ms'] <= stats['jitter_p99_ms'] <= stats['jitter_max_ms']
+
+
+def test_paused_scheduler_does_not_tick():
+    s = scheduler(100, poll_interval=0.01)
+    s.run_event.clear()
+    calls = []
+    threading.Timer(0.1, s.exit_event.set).start()
+    s.run(lambda late: calls.append(late))
+    assert calls == []
+    assert s.stats()['count'] == 0
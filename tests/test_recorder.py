@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from frame_sources import ReplayFrameSource, read_frame_index, FRAMES_SUFFIX
+from recorder import SessionRecorder, read_annotations
+
+
+def frames(n, shape=(12, 16, 3)):
+    return [np.full(shape, 10 * i, dtype=np.uint8) for i in range(n)]
+
+
+def wait_until(condition, timeout=2.0):
+    t_end = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < t_end:
+        time.sleep(0.005)
+    return condition()
+
+
+def blocked_writer(recorder):
+    """Makes the writer thread of recorder wait in write() until the returned event is set."""
+    release = threading.Event()
+    write = recorder.writer.write
+
+    def slow_write(*args, **kwargs):
+        release.wait()
+        write(*args, **kwargs)
+
+    recorder.writer.write = slow_write
+    return release
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'session')
+    recorder = SessionRecorder(path)
+    images = frames(3)
+    for i, image in enumerate(images):
+        assert recorder.record(image, success=i != 1, offset=np.float32(i))
+    recorder.annotate(2, steering=0.25)
+    recorder.annotate(2, lane_center=300)
+    recorder.close()
+    assert recorder.stats() == {'written': 3, 'dropped': 0, 'expired': 0, 'pending': 0, 'annotated': 2}
+
+    source = ReplayFrameSource(path)
+    for i, image in enumerate(images):
+        success, replayed = source.grab()
+        assert success and np.array_equal(replayed, image)
+        assert source.index[i]['meta'] == {'success': i != 1, 'offset': i}
+    source.close()
+    assert read_annotations(path) == {2: {'steering': 0.25, 'lane_center': 300}}
+
+
+def test_full_queue_drops_frames(tmp_path):
+    recorder = SessionRecorder(str(tmp_path / 'session'), max_pending=1)
+    release = blocked_writer(recorder)
+    assert recorder.record(frames(1)[0])
+    assert wait_until(lambda: recorder.queue.empty())  # The writer holds the first frame
+    assert recorder.record(frames(1)[0])
+    assert not recorder.record(frames(1)[0])  # Returns at once instead of waiting
+    release.set()
+    recorder.close()
+    assert recorder.stats()['dropped'] == 1 and recorder.stats()['written'] == 2
+
+
+def test_full_queue_blocks_until_writer_catches_up(tmp_path):
+    recorder = SessionRecorder(str(tmp_path / 'session'), max_pending=1, block=True)
+    release = blocked_writer(recorder)
+    recorder.record(frames(1)[0])
+    assert wait_until(lambda: recorder.queue.empty())
+    recorder.record(frames(1)[0])
+
+    producer = threading.Thread(target=recorder.record, args=(frames(1)[0],))
+    producer.start()
+    producer.join(0.1)
+    assert producer.is_alive()  # Waits for free space
+
+    release.set()
+    producer.join(1.0)
+    assert not producer.is_alive()
+    recorder.close()
+    assert recorder.stats()['dropped'] == 0 and recorder.stats()['written'] == 3
+
+
+def test_frames_are_flushed_per_chunk(tmp_path):
+    path = str(tmp_path / 'session')
+    recorder = SessionRecorder(path, chunk_size=2)
+    for image in frames(3):
+        recorder.record(image)
+    assert wait_until(lambda: recorder.written == 3)
+    # The first chunk is on disk, the third frame waits for the next chunk or an idle queue
+    assert len(read_frame_index(path)) == 2
+    assert wait_until(lambda: len(read_frame_index(path)) == 3)
+    recorder.close()
+
+
+def test_compressed_frames_replay_identically(tmp_path):
+    raw_path, zlib_path = str(tmp_path / 'raw'), str(tmp_path / 'zlib')
+    images = frames(4, shape=(90, 160, 3))
+    for path, compression in ((raw_path, None), (zlib_path, 1)):
+        recorder = SessionRecorder(path, compression)
+        for image in images:
+            recorder.record(image)
+        recorder.close()
+
+    assert os.path.getsize(zlib_path + FRAMES_SUFFIX) < os.path.getsize(raw_path + FRAMES_SUFFIX) / 10
+    source = ReplayFrameSource(zlib_path)
+    assert all(entry['codec'] == 'zlib' for entry in source.index)
+    for image in images:
+        success, replayed = source.grab()
+        assert success and np.array_equal(replayed, image)
+    source.close()
@@ -0,0 +1,69 @@
+import os
+import time
+
+from scene_farm import SceneFarm, job_name, scene_jobs
+
+
+def fake_worker(worker_id, conn, options):
+    """Finishes every job at once, except that it hangs on the first attempt at a winter scene."""
+    while True:
+        job = conn.recv()
+        if job is None:
+            return
+        conn.send(('start', worker_id, job, None))
+        marker = os.path.join(options['output'], job_name(job) + '.stalled')
+        if job['season'] == 'winter' and not os.path.exists(marker):
+            open(marker, 'w').close()
+            time.sleep(60)
+        conn.send(('done', worker_id, job, {'frames': 1, 'worker': worker_id}))
+
+
+def crashing_worker(worker_id, conn, options):
+    """Exits on its first job without reporting."""
+    job = conn.recv()
+    if job is not None:
+        os._exit(3)
+
+
+def test_jobs_are_spread_over_workers(tmp_path):
+    jobs = scene_jobs(['summer', 'autumn'], ['sun', 'night', 'cloudy'])
+    farm = SceneFarm(jobs, str(tmp_path), workers=3, worker=fake_worker)
+    results, failed = farm.run(poll_interval=0.05)
+
+    assert set(results) == {job_name(job) for job in jobs}
+    assert failed == {}
+    assert sum(w['jobs_done'] for w in farm.stats()['workers']) == len(jobs)
+
+
+def test_stalled_worker_is_replaced_and_its_job_requeued(tmp_path):
+    jobs = scene_jobs(['summer', 'winter'], ['sun'])
+    farm = SceneFarm(jobs, str(tmp_path), workers=2, stall_timeout=0.5, worker=fake_worker)
+    results, failed = farm.run(poll_interval=0.05)
+
+    assert set(results) == {'summer_sun_normal', 'winter_sun_normal'}
+    assert failed == {}
+    assert farm.retries == {'winter_sun_normal': 1}
+    assert [w['restarts'] for w in farm.stats()['workers']].count(1) == 1
+    # A live worker, not the stalled one, finished the job
+    live = {w['worker'] for w in farm.stats()['workers']}
+    assert results['winter_sun_normal']['worker'] in live
+
+
+def test_job_of_crashed_worker_fails_after_retries(tmp_path):
+    jobs = scene_jobs(['summer'], ['sun'])
+    farm = SceneFarm(jobs, str(tmp_path), workers=1, max_retries=2, worker=crashing_worker)
+    results, failed = farm.run(poll_interval=0.05)
+
+    assert results == {}
+    assert list(failed) == ['summer_sun_normal']
+    assert farm.retries['summer_sun_normal'] == 3
+
+
+def test_synthetic_backend_records_every_job(tmp_path):
+    jobs = scene_jobs(['summer', 'winter'], ['sun'])
+    farm = SceneFarm(jobs, str(tmp_path), workers=2, backend='synthetic', frames=3)
+    results, failed = farm.run(poll_interval=0.05)
+
+    assert failed == {}
+    assert {name: stats['frames'] for name, stats in results.items()} == {'summer_sun_normal': 3, 'winter_sun_normal': 3}
+    assert all((tmp_path / (name + '.frames')).exists() for name in results)
@@ -0,0 +1,167 @@
+import time
+
+from run_slowroads import SlowRoadsSimulator
+
+
+def synthetic_sim():
+    sim = SlowRoadsSimulator()
+    sim.open_synthetic(size=(320, 180))
+    return sim
+
+
+def test_pause_straightens_synthetic_drive():
+    sim = synthetic_sim()
+    sim.set_steering(0.6)
+    assert sim.synthetic.setpoint == 0.6
+
+    sim.pause_control_thread()
+    assert sim.actuator.setpoint == 0.0
+    assert sim.synthetic.setpoint == 0.0
+
+
+def test_stale_release_straightens_synthetic_drive():
+    sim = synthetic_sim()
+    sim.stale_policy = 'release'
+    sim.stale_after = 0.0
+    sim.apply_command((True, 120), 0.0)
+    sim.t_command = 0.0  # The last detection is long stale
+    assert sim.synthetic.setpoint != 0.0
+
+    sim.publish_commands()
+    assert sim.stale_ticks == 1
+    assert sim.synthetic.setpoint == 0.0
+
+
+class FakeUI:
+    """UICommandChannel stand-in that counts the flushes of pending operations."""
+
+    def __init__(self):
+        self.operations = []
+        self.flushed = []
+
+    def submit(self, *operation):
+        self.operations.append(operation)
+
+    def pending(self):
+        return len(self.operations)
+
+    def flush(self):
+        self.flushed.append(self.operations)
+        self.operations = []
+        return {}
+
+
+def test_control_tick_flushes_ui_of_subclass():
+    sim = synthetic_sim()
+    sim.ui = FakeUI()
+    sim.ui.submit('cruise', 50)
+
+    sim.control_tick(late=True)
+    assert sim.ui.flushed == []  # Deferred on a late tick
+
+    sim.control_tick(late=False)
+    assert sim.ui.flushed == [[('cruise', 50)]]
+
+
+def test_late_ticks_apply_detections_after_cap():
+    sim = synthetic_sim()
+    assert sim.late_policy == 'apply'
+    sim.late_policy = 'skip'
+
+    # Every tick is late, as with coarse timers, but the newest detection still gets applied
+    applied = []
+    sim.apply_command = lambda command, age: applied.append(command)
+    for i in range(2 * (sim.max_late_ticks + 1)):
+        sim.command_queue.put((True, i))
+        sim.control_tick(late=True)
+    assert sim.skipped_ticks == 2 * sim.max_late_ticks
+    assert applied == [(True, sim.max_late_ticks), (True, 2 * sim.max_late_ticks + 1)]
+
+
+def browser_sim():
+    """Simulator that drives a FakeUI as if the browser and the control thread were running."""
+    sim = SlowRoadsSimulator()
+    sim.driver_initialized = True
+    sim.control_initialized = True
+    sim.run_event.set()
+    sim.ui = FakeUI()
+    return sim
+
+
+def test_rest_vehicle_does_not_block_control_thread():
+    sim = browser_sim()
+    t0 = time.perf_counter()
+    sim.rest_vehicle(t=2)
+    assert time.perf_counter() - t0 < 0.5
+    assert sim.resting
+    assert sim.ui.flushed == [[('autodrive', True)]]
+
+    # Detections are not applied while autodrive steers
+    applied = []
+    sim.apply_command = lambda command, age: applied.append(command)
+    sim.command_queue.put((True, 10))
+    sim.control_tick()
+    assert sim.resting and applied == []
+    assert sim.ui.flushed == [[('autodrive', True)]]
+
+    sim.rest_until = time.perf_counter()  # The rest is over
+    sim.command_queue.put((True, 20))
+    sim.control_tick()
+    assert not sim.resting
+    assert sim.ui.flushed[-1] == [('autodrive', False)]
+    assert applied == [(True, 20)]
+
+
+def test_pause_ends_rest():
+    sim = browser_sim()
+    sim.rest_vehicle(t=2)
+    sim.pause_control_thread()
+    assert not sim.resting
+    assert sim.ui.flushed[-1] == [('autodrive', False)]
+
+
+def test_recording_keeps_frames_detection_dropped(tmp_path):
+    from frame_sources import read_frame_index
+    from recorder import read_annotations
+
+    sim = synthetic_sim()
+    path = str(tmp_path / 'session')
+    sim.init_recorder(path)
+    skipped = sim.capture()
+    frame = sim.capture()
+    success, offset = sim.detect(frame)  # The first frame never reaches detection
+    sim.recorder.close()
+
+    assert [entry['meta']['frame'] for entry in read_frame_index(path)] == [skipped.seq, frame.seq]
+    annotations = read_annotations(path)
+    assert list(annotations) == [frame.seq]
+    assert annotations[frame.seq]['success'] == success
+    assert set(annotations[frame.seq]) >= {'steering', 'offset', 'lane_center'}
+
+
+def test_synthetic_switch_scene_returns_changed_items():
+    sim = synthetic_sim()
+    sim.switch_scene('normal', 'summer', 'sun')
+    assert sim.switch_scene('normal', 'summer', 'sun') == {}
+    assert sim.switch_scene('hard', 'summer', 'night') == {'config-scene-topography': 'hard', 'config-scene-weather-index': '4'}
+    assert (sim.synthetic.topography, sim.synthetic.season, sim.synthetic.weather) == ('hard', 'summer', 'night')
+
+
+class FakeDriver:
+    def __init__(self):
+        self.scripts = []
+
+    def execute_script(self, script, *args):
+        self.scripts.append(args)
+
+
+def test_browser_switch_scene_writes_only_changed_items():
+    sim = browser_sim()
+    sim.driver = FakeDriver()
+    sim.local_storage = {'config-scene-topography': 'normal', 'config-scene-skin': 'default', 'config-scene-weather-index': '1'}
+    live_keys = ('config-scene-skin', 'config-scene-weather-index')
+
+    assert sim.switch_scene('normal', 'winter', 'sun', live_keys) == {'config-scene-skin': 'winter'}
+    assert sim.driver.scripts == [({'config-scene-skin': 'winter'},)]
+    assert sim.switch_scene('normal', 'winter', 'sun', live_keys) == {}
+    assert len(sim.driver.scripts) == 1
@@ -0,0 +1,24 @@
+import json
+import os
+
+import slowroads_utils
+from slowroads_utils import load_config, update_config_file
+
+
+def test_load_config_parses_only_after_the_file_changed(tmp_path):
+    path = str(tmp_path / 'storage.json')
+    with open(path, 'w') as file:
+        json.dump({'config-scene-skin': 'default'}, file)
+
+    config = load_config(path)
+    config['config-scene-skin'] = 'modified'  # Callers get a copy, the cache is unchanged
+    cached = slowroads_utils._config_cache[path]
+    assert load_config(path) == {'config-scene-skin': 'default'}
+    assert slowroads_utils._config_cache[path] is cached
+
+    update_config_file(path, 'hard', 'winter', 'night')
+    mtime = cached[0] + 1  # Coarse file system timestamps may not tell both writes apart
+    os.utime(path, (mtime, mtime))
+    config = load_config(path)
+    assert slowroads_utils._config_cache[path] is not cached
+    assert config['config-scene-skin'] == 'winter' and config['config-scene-topography'] == 'hard'